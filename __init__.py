@@ -1,4 +1,2 @@
-import numpy as np
-
 from .program   import _program
 from .scheduler import _scheduler
@@ -0,0 +1,160 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import signal
+import sys
+import time
+from multiprocessing import Pool
+
+from .program   import _program
+from .scheduler import _scheduler
+
+# Batch command-line entry point: runs an analysis command on many process files
+# (each one a Process JSON: processor parameters + instruction_list, as in kernels/)
+# on a pool of worker processes, writing one record per job as NDJSON or CSV.
+#   python -m rvcat results kernels/ --niters 10 100 --processor proc1.json proc2.json --jobs 8
+# A processor file, if given, overrides the processor parameters of every process file.
+
+COMMANDS = ["results", "timeline", "analysis", "unroll", "graphviz"]
+USES_NITERS = {"results", "timeline", "graphviz"}
+
+def find_files(paths) -> list:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, "**", "*.json"), recursive=True))
+        else:
+            files.append(path)
+    return files
+
+def load_json(file_name: str) -> dict:
+    with open(file_name) as f:
+        return json.load(f)
+
+class JobTimeout(Exception):
+    pass
+
+def on_alarm(signum, frame):
+    raise JobTimeout()
+
+def run_command(command: str, process: dict, niters, options: dict) -> str:
+    if command == "results":
+        return _scheduler.get_results(process, niters, warmup=options["warmup"], timeseries=options["timeseries"])
+    if command == "timeline":
+        return _scheduler.get_timeline(process, niters, timeseries=options["timeseries"])
+    if command == "analysis":
+        return _program.get_performance_analysis(process)
+    if command == "unroll":   # already on a worker process: simulations run sequentially
+        return _program.get_unroll_analysis(process, options["max_unroll"], options["simulate"])
+    return _program.show_graphviz(process.get("instruction_list", []), niters,
+                                  options["internal"], options["latency"], options["small"], options["full"])
+
+def run_job(job: tuple) -> dict:
+    # job = (command, process file, processor file, niters, timeout, options)
+    command, file_name, proc_name, niters, timeout, options = job
+    record = {"command": command, "file": file_name, "processor": proc_name, "niters": niters}
+    start  = time.perf_counter()
+    timer  = timeout > 0 and hasattr(signal, "setitimer")   # no per-job timeout on Windows
+    try:
+        process = load_json(file_name)
+        if proc_name:
+            process = dict(process, **{k: v for k, v in load_json(proc_name).items() if k != "instruction_list"})
+        if timer:
+            signal.signal(signal.SIGALRM, on_alarm)
+            signal.setitimer(signal.ITIMER_REAL, timeout)
+        output = run_command(command, process, niters, options)
+        if timer:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        record["name"]   = process.get("name", "")
+        record["status"] = "ok"
+        record["result"] = output if command == "graphviz" else json.loads(output)
+    except JobTimeout:
+        record["status"] = "timeout"
+    except Exception as error:
+        if timer:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        record["status"] = "error"
+        record["error"]  = f"{type(error).__name__}: {error}"
+    record["time"] = time.perf_counter() - start
+    return record
+
+def flatten(record: dict) -> dict:
+    # one CSV row: nested dictionaries become dotted columns, lists are left out
+    row = {}
+
+    def add(prefix, value):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                add(f"{prefix}.{key}" if prefix else str(key), item)
+        elif not isinstance(value, list):
+            row[prefix] = value
+
+    add("", record)
+    return row
+
+def write_csv(records, out) -> None:
+    rows    = [flatten(record) for record in records]
+    columns = []
+    for row in rows:
+        columns += [key for key in row if key not in columns]
+    writer = csv.DictWriter(out, fieldnames=columns)
+    writer.writeheader()
+    writer.writerows(rows)
+
+def main(argv = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m rvcat", description="RVCAT batch analysis")
+    parser.add_argument("command", choices=COMMANDS)
+    parser.add_argument("files", nargs="+", help="process JSON files or directories")
+    parser.add_argument("--processor", nargs="+", default=[""], help="processor JSON files (override process parameters)")
+    parser.add_argument("--niters",    nargs="+", type=int, default=[3], help="loop iterations (one job per value)")
+    parser.add_argument("--warmup",    type=int, default=0, help="results: iterations excluded from statistics")
+    parser.add_argument("--timeseries",type=int, default=0, help="results, timeline: bins of utilisation time series")
+    parser.add_argument("--max-unroll",type=int, default=8, help="unroll: largest unroll factor evaluated")
+    parser.add_argument("--simulate",  action="store_true", help="unroll: simulate every unroll factor")
+    parser.add_argument("--jobs",      type=int, default=0, help="worker processes (default: all CPUs)")
+    parser.add_argument("--timeout",   type=float, default=0, help="per-job timeout in seconds (0: none)")
+    parser.add_argument("--format",    choices=["ndjson", "csv"], default="ndjson")
+    parser.add_argument("--output",    default="", help="output file (default: stdout)")
+    parser.add_argument("--quiet",     action="store_true", help="no progress report")
+    group = parser.add_argument_group("graphviz options")
+    group.add_argument("--internal",   action="store_true", help="show non-cyclic instructions")
+    group.add_argument("--latency",    action="store_true", help="show instruction latencies")
+    group.add_argument("--small",      action="store_true", help="show instruction ids only")
+    group.add_argument("--full",       action="store_true", help="show all dependences")
+    args = parser.parse_args(argv)
+
+    options = {"internal": args.internal, "latency": args.latency, "small": args.small, "full": args.full,
+               "warmup": args.warmup, "timeseries": args.timeseries,
+               "max_unroll": args.max_unroll, "simulate": args.simulate}
+    niters  = args.niters if args.command in USES_NITERS else [None]
+    jobs    = [(args.command, file_name, proc_name, n, args.timeout, options)
+               for file_name in find_files(args.files) for proc_name in args.processor for n in niters]
+
+    out     = open(args.output, "w", newline="") if args.output else sys.stdout
+    records = []
+    failed  = 0
+    start   = time.perf_counter()
+    with Pool(args.jobs or None) as pool:
+        for done, record in enumerate(pool.imap(run_job, jobs), 1):
+            failed += record["status"] != "ok"
+            if args.format == "ndjson":
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+            else:
+                records.append(record)
+            if not args.quiet:
+                print(f"\r[{done}/{len(jobs)}] {failed} failed, {time.perf_counter()-start:.1f}s",
+                      end="", file=sys.stderr)
+    if not args.quiet:
+        print(file=sys.stderr)
+
+    if args.format == "csv":
+        write_csv(records, out)
+    if out is not sys.stdout:
+        out.close()
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
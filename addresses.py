@@ -0,0 +1,73 @@
+# Multi-dimensional affine address streams of memory instructions (nested and tiled loops).
+# The simulated loop body is the innermost level of a loop nest; each level has a trip count
+# and a byte stride. Access k of an instruction (k-th iteration of the body) has the address
+#   base + sum(k_l * stride_l)
+# where k_l are the digits of k in the mixed radix of the trip counts, innermost first: when a
+# level completes its trips it resets and the next level advances. The outermost level has no
+# trip count (it runs as long as the simulation). A single-loop stream has one level:
+#   base + k*stride (the addr/byte_stride model of Instruction).
+
+class AddressStream:
+
+    def __init__(self, base: int, levels: list) -> None:
+        # levels: [trips, byte stride] of each loop level, innermost first (trips of last one ignored)
+        if not levels:
+            raise ValueError("an address stream needs at least one loop level")
+        for trips, _ in levels[:-1]:
+            if trips < 1:
+                raise ValueError(f"trip count of inner loop levels must be positive (got {trips})")
+        self.base    = base
+        self.trips   = [trips for trips, _ in levels[:-1]]
+        self.strides = [stride for _, stride in levels]
+
+    def get_address(self, k: int) -> int:
+        # address of access k: O(levels)
+        addr = self.base
+        for trips, stride in zip(self.trips, self.strides):
+            k, idx = divmod(k, trips)
+            addr  += idx * stride
+        return addr + k * self.strides[-1]
+
+    def get_offsets(self, count: int) -> list:
+        # offsets from base of the first count accesses, built one level at a time: the offsets
+        #   of a level are the offsets of the inner levels repeated once per trip, shifted by stride
+        offsets = [0]
+        levels  = list(zip(self.trips, self.strides)) + [(count, self.strides[-1])]
+        for trips, stride in levels:
+            if len(offsets) >= count:
+                break
+            trips   = min(trips, -(-count // len(offsets)))
+            offsets = [offset + i*stride for i in range(trips) for offset in offsets]
+        return offsets[:count]
+
+    def get_addresses(self, count: int, first: int = 0) -> list:
+        # addresses of accesses first .. first+count-1
+        if first == 0:
+            return [self.base + offset for offset in self.get_offsets(count)]
+        return [self.get_address(k) for k in range(first, first+count)]
+
+    def get_period(self, levels: int) -> int:
+        # accesses in one iteration of level levels (product of the trips of the inner levels)
+        period = 1
+        for trips in self.trips[:levels]:
+            period *= trips
+        return period
+
+    def get_extent(self, count: int) -> tuple:
+        # lowest and highest offset from base of the first count accesses (a bound: assumes every
+        #   digit reaches its maximum value)
+        low, high = 0, 0
+        for level, stride in enumerate(self.strides):
+            digits = -(-count // self.get_period(level))
+            if level < len(self.trips):
+                digits = min(digits, self.trips[level])
+            last  = (max(digits, 1) - 1) * stride
+            low  += min(0, last)
+            high += max(0, last)
+        return low, high
+
+    def is_nested(self) -> bool:
+        return len(self.strides) > 1
+
+    def json(self) -> dict:
+        return {"base": self.base, "trips": self.trips, "strides": self.strides}
@@ -0,0 +1,361 @@
+import numpy as np
+from .program import Process, _program
+
+# Lockstep simulation of K processor configurations of the same kernel (parameter sweeps).
+# Reproduces the summary of Scheduler.get_results for sched = "greedy": window state, latency
+# counters and cache tables are NumPy arrays with a leading configuration axis, and every
+# pipeline stage of Scheduler.next_cycle is applied to all configurations at once:
+#   - window arrays are kept in age order (position 0 = oldest), so the dependences of an
+#     instruction are at fixed distances (dependence offsets) towards position 0
+#   - the order-dependent parts of a cycle (cache accesses, greedy port selection) are done
+#     in rounds: each round handles the oldest pending instruction of every configuration
+# Configurations may change any processor parameter, and the latency and ports of the
+# instructions (through an "instruction_list" with the same instructions).
+# Configurations with sched = "optimal" are run one by one with the Scheduler.
+# Finished configurations are removed from the arrays (see compact), so a batch costs about
+# as many cycles as its slowest configuration, on arrays that shrink as the batch advances.
+
+SUMMARY_KEYS = ["total_iterations", "total_instructions", "total_cycles", "ipc", "cycles_per_iteration",
+                "ports", "reads", "read_misses", "writes", "write_misses", "second_misses",
+                "MM_Reads", "MM_Writes"]
+
+# arrays with a leading configuration axis (see compact)
+CONFIG_ARRAYS = ["ids", "latency", "pmask", "disp_width", "retr_width", "capacity", "mPenalty", "mIssueTime",
+                 "blkSize", "nBlocks", "valid", "sidx", "state", "sub", "lat", "mem", "addr", "count",
+                 "line_ok", "TAGS", "DATA", "LRU", "VALID", "MODIFIED", "MEM_last_access",
+                 "dispatched", "retired", "finish", "port_usage", "reads", "writes",
+                 "rd_misses", "wr_misses", "s2_misses", "mm_writes"]
+WINDOW_ARRAYS = ["valid", "sidx", "state", "sub", "lat", "mem", "addr"]
+CACHE_ARRAYS  = ["line_ok", "TAGS", "DATA", "LRU", "VALID", "MODIFIED"]
+
+# instruction states and substates (aliases of InstrState share a code, as in the Scheduler)
+DISPATCH, EXECUTE, LOAD, STORE, WRITE_BACK, RETIRE = range(6)
+NONE, WAIT_DATA, WAIT_RESOURCE, WAIT_RETIRE, WAIT_MM_REQUEST, WAIT_MM_READY, WAIT_DATA_READY, WAIT_CACHE_2ND = range(8)
+
+class BatchEngine:
+
+    def __init__(self, processJSON, configs: list, niters: int = 3) -> None:
+        base = Process.from_json(processJSON)
+        _program.load_instruction_list(base.instruction_list)
+        _program.assign_memory_addresses(niters)
+        procs = [Process.from_json(dict(processJSON, **config)) for config in configs]
+
+        K = self.K     = len(procs)
+        self.ids       = np.arange(K)        # original index of each configuration
+        self.results   = [None] * K
+        self.niters    = niters
+        self.num_instr = _program.n
+        self.n         = niters * _program.n
+        self.W         = max(proc.ROBsize for proc in procs)
+        self.B         = max([proc.nBlocks for proc in procs] + [1])
+
+        # per static instruction (fixed) and per configuration (latency, ports)
+        instrs       = _program.instruction_list
+        self.memtype = np.array([(1 if instr.oper == "LOAD" else 2) if instr.type in ("MEM", "VMEM") else 0
+                                 for instr in instrs], dtype=np.int64)
+        self.addr0   = np.array([instr.addr   if instr.type in ("MEM", "VMEM") else -1 for instr in instrs], dtype=np.int64)
+        self.stride  = np.array([instr.byte_stride if instr.type in ("MEM", "VMEM") else 0 for instr in instrs], dtype=np.int64)
+        max_deps     = max([len(deps) for deps in _program.dependence_edges] + [1])
+        self.deps    = np.zeros((self.num_instr, max_deps), dtype=np.int64)   # offsets, 0 = none
+        for i, deps in enumerate(_program.dependence_edges):
+            self.deps[i, :len(deps)] = deps
+
+        self.latency = np.zeros((K, self.num_instr), dtype=np.int64)
+        self.pmask   = np.zeros((K, self.num_instr), dtype=np.int64)
+        for k, (proc, config) in enumerate(zip(procs, configs)):
+            overrides = config.get("instruction_list", base.instruction_list)
+            if len(overrides) != self.num_instr:
+                raise ValueError("configurations must have the same instructions as the kernel")
+            for i, (instr, override) in enumerate(zip(instrs, overrides)):
+                self.latency[k, i] = override.get("latency", instr.latency)
+                self.pmask[k, i]   = override.get("ports",   instr.ports)
+
+        self.disp_width = np.array([proc.dispatch   for proc in procs], dtype=np.int64)
+        self.retr_width = np.array([proc.retire     for proc in procs], dtype=np.int64)
+        self.capacity   = np.array([proc.ROBsize    for proc in procs], dtype=np.int64)
+        self.mPenalty   = np.array([proc.mPenalty   for proc in procs], dtype=np.int64)
+        self.mIssueTime = np.array([proc.mIssueTime for proc in procs], dtype=np.int64)
+        self.blkSize    = np.array([proc.blkSize    for proc in procs], dtype=np.int64)
+        self.nBlocks    = np.array([proc.nBlocks    for proc in procs], dtype=np.int64)
+
+        # window (K, W), in age order
+        shape = (K, self.W)
+        self.valid = np.zeros(shape, dtype=bool)
+        self.sidx  = np.zeros(shape, dtype=np.int64)
+        self.state = np.zeros(shape, dtype=np.int8)
+        self.sub   = np.zeros(shape, dtype=np.int8)
+        self.lat   = np.zeros(shape, dtype=np.int64)
+        self.mem   = np.zeros(shape, dtype=np.int8)
+        self.addr  = np.zeros(shape, dtype=np.int64)
+        self.count = np.zeros(K, dtype=np.int64)
+
+        # cache (K, B): lines beyond nBlocks of a configuration are never used
+        shape = (K, self.B)
+        self.line_ok  = np.arange(self.B)[None, :] < self.nBlocks[:, None]
+        self.TAGS     = np.zeros(shape, dtype=np.int64)
+        self.DATA     = np.zeros(shape, dtype=np.int64)
+        self.LRU      = np.where(self.line_ok, np.arange(self.B)[None, :], self.B)
+        self.VALID    = np.zeros(shape, dtype=bool)
+        self.MODIFIED = np.zeros(shape, dtype=np.int64)
+        self.MEM_last_access = -self.mIssueTime.copy()
+
+        self.cycles     = 0
+        self.dispatched = np.zeros(K, dtype=np.int64)
+        self.retired    = np.zeros(K, dtype=np.int64)
+        self.finish     = np.zeros(K, dtype=np.int64)
+        self.port_usage = np.zeros((K, 32), dtype=np.int64)
+        self.reads      = np.zeros(K, dtype=np.int64)
+        self.writes     = np.zeros(K, dtype=np.int64)
+        self.rd_misses  = np.zeros(K, dtype=np.int64)
+        self.wr_misses  = np.zeros(K, dtype=np.int64)
+        self.s2_misses  = np.zeros(K, dtype=np.int64)
+        self.mm_writes  = np.zeros(K, dtype=np.int64)
+        self.set_rows()
+
+    def set_rows(self) -> None:
+        # offsets of each configuration in flattened (K, W) and (K, num_instr) arrays
+        self.rows_w = np.arange(self.K)[:, None] * self.W
+        self.rows_i = np.arange(self.K)[:, None] * self.num_instr
+
+    def compact(self) -> None:
+        # keep results of finished configurations and remove them from all arrays;
+        #   shrink window and cache arrays to the largest remaining configuration
+        active = self.retired < self.n
+        for k in np.nonzero(~active)[0]:
+            self.results[self.ids[k]] = self.json(k)
+        for name in CONFIG_ARRAYS:
+            setattr(self, name, getattr(self, name)[active])
+        self.K = int(active.sum())
+        if self.K == 0:
+            return
+        self.W = int(self.capacity.max())
+        self.B = int(max(self.nBlocks.max(), 1))
+        for name in WINDOW_ARRAYS:
+            setattr(self, name, getattr(self, name)[:, :self.W])
+        for name in CACHE_ARRAYS:
+            setattr(self, name, getattr(self, name)[:, :self.B])
+        self.set_rows()
+
+    def cache_access(self, ks, positions) -> None:
+        # one access of configurations ks, by the instruction at window position of each one
+        # (same as Cache.access, followed by the substate update of Scheduler.next_cycle)
+        cycle   = self.cycles
+        address = self.addr[ks, positions]
+        block   = address // self.blkSize[ks]
+        match   = self.VALID[ks] & (self.TAGS[ks] == block[:, None]) & self.line_ok[ks]
+        found   = match.any(1)
+        line    = np.where(found, match.argmax(1), (self.LRU[ks] == 0).argmax(1))
+        data    = self.DATA[ks, line]
+
+        second  = found & (data > cycle)
+        miss    = ~found
+        latency = np.where(second, data + 1 - cycle, 0)
+        self.DATA[ks[second], line[second]] += 1
+
+        mk, ml  = ks[miss], line[miss]
+        mla     = np.maximum(self.MEM_last_access[mk] + self.mIssueTime[mk], cycle)
+        latency[miss] = mla - cycle
+        dirty   = self.MODIFIED[mk, ml] == 1
+        self.MEM_last_access[mk] = mla + np.where(dirty, self.mIssueTime[mk], 0)
+        self.TAGS[mk, ml]  = block[miss]
+        self.VALID[mk, ml] = True
+        self.DATA[mk, ml]  = cycle + latency[miss] + self.mPenalty[mk]
+
+        self.MODIFIED[ks, line] = self.mem[ks, positions] - 1
+        previous = self.LRU[ks, line]
+        self.LRU[ks] -= (self.LRU[ks] > previous[:, None]) & self.line_ok[ks]
+        self.LRU[ks, line] = self.nBlocks[ks] - 1
+
+        is_load = self.mem[ks, positions] == 1
+        np.add.at(self.rd_misses, ks[miss &  is_load], 1)
+        np.add.at(self.wr_misses, ks[miss & ~is_load], 1)
+        np.add.at(self.mm_writes, mk[dirty], 1)
+        np.add.at(self.s2_misses, ks[second], 1)
+
+        hit = found & ~second
+        self.state[ks[hit], positions[hit]] = WRITE_BACK
+        request = miss & (latency > 0)
+        ready   = miss & (latency <= 0)
+        self.sub[ks[request], positions[request]] = WAIT_MM_REQUEST
+        self.lat[ks[request], positions[request]] = latency[request]
+        self.sub[ks[ready], positions[ready]]     = WAIT_MM_READY
+        self.lat[ks[ready], positions[ready]]     = self.mIssueTime[ks[ready]]
+        self.sub[ks[second], positions[second]]   = WAIT_CACHE_2ND
+        self.lat[ks[second], positions[second]]   = latency[second]
+
+    def next_cycle(self) -> np.ndarray:
+        K, W  = self.K, self.W
+        state, sub, lat, valid = self.state, self.sub, self.lat, self.valid
+        pos   = np.arange(W)[None, :]
+
+        # retire: oldest consecutive instructions in WRITE_BACK, up to retire width
+        wb       = valid & (state == WRITE_BACK)
+        prefix   = np.cumprod(wb, axis=1).astype(bool)
+        retiring = prefix & (np.cumsum(prefix, axis=1) <= self.retr_width[:, None])
+        state[retiring] = RETIRE
+        sub[retiring]   = NONE
+        sub[wb & ~retiring] = WAIT_RETIRE
+        retires  = retiring.sum(1)
+        self.reads  += (retiring & (self.mem == 1)).sum(1)
+        self.writes += (retiring & (self.mem == 2)).sum(1)
+
+        # memory instructions
+        ls = valid & ((state == LOAD) | (state == STORE))
+        lat[ls] -= 1
+        done    = ls & (lat == 0)
+        to_wb   = done & ((sub == WAIT_DATA_READY) | (sub == WAIT_CACHE_2ND) | (self.nBlocks == 0)[:, None])
+        to_data = done & ~to_wb & (sub == WAIT_MM_READY)
+        to_mm   = done & ~to_wb & (sub == WAIT_MM_REQUEST)
+        access  = done & ~to_wb & (sub == NONE)
+        state[to_wb] = WRITE_BACK
+        sub[to_wb]   = NONE
+        sub[to_data] = WAIT_DATA_READY
+        lat[to_data] = np.broadcast_to((self.mPenalty - self.mIssueTime)[:, None], (K, W))[to_data]
+        sub[to_mm]   = WAIT_MM_READY
+        lat[to_mm]   = np.broadcast_to(self.mIssueTime[:, None], (K, W))[to_mm]
+        while access.any():   # cache accesses in age order
+            ks        = np.nonzero(access.any(1))[0]
+            positions = access[ks].argmax(1)
+            self.cache_access(ks, positions)
+            access[ks, positions] = False
+
+        # execution
+        ex = valid & (state == EXECUTE)
+        lat[ex] -= 1
+        finished = ex & (lat == 0)
+        state[finished] = WRITE_BACK
+        sub[finished]   = NONE
+
+        # issue: dependences on older instructions still in window, then greedy port selection
+        disp  = valid & (state == DISPATCH)
+        check = disp & ((sub == NONE) | (sub == WAIT_DATA))
+        sub[check] = NONE
+        offsets   = self.deps[self.sidx]                       # (K, W, max_deps)
+        dep_pos   = pos[:, :, None] - offsets
+        dep_state = state.ravel()[self.rows_w[:, :, None] + np.maximum(dep_pos, 0)]
+        blocked   = ((offsets > 0) & (dep_pos >= 0) & (dep_state != WRITE_BACK) & (dep_state != RETIRE)).any(2)
+        waiting   = check & blocked
+        sub[waiting] = WAIT_DATA
+        ready     = disp & ~waiting
+
+        masks     = self.pmask.ravel()[self.rows_i + self.sidx]
+        used      = np.zeros(K, dtype=np.int64)
+        issued    = np.zeros((K, W), dtype=bool)
+        remaining = ready.copy()
+        while True:
+            avail = masks & ~used[:, None]
+            elig  = remaining & (avail != 0)
+            has   = elig.any(1)
+            if not has.any():
+                break
+            ks        = np.nonzero(has)[0]
+            positions = elig[ks].argmax(1)
+            free      = avail[ks, positions]
+            used[ks] |= free & -free        # lowest free port of the instruction
+            issued[ks, positions] = True
+            remaining[ks] &= pos > positions[:, None]
+
+        mem = self.mem
+        state[issued] = np.where(mem[issued] == 0, EXECUTE, np.where(mem[issued] == 1, LOAD, STORE))
+        sub[issued]   = NONE
+        lat[issued]   = self.latency.ravel()[(self.rows_i + self.sidx)[issued]]
+        sub[ready & ~issued] = WAIT_RESOURCE
+        self.port_usage += (used[:, None] >> np.arange(32)[None, :]) & 1
+        return retires
+
+    def pop_and_dispatch(self, retires) -> None:
+        K, W = self.K, self.W
+        pos  = np.arange(W)[None, :]
+
+        # remove retired instructions from the head of the window
+        if retires.any():
+            shift = (self.rows_w + np.minimum(pos + retires[:, None], W - 1)).ravel()
+            for name in ("sidx", "state", "sub", "lat", "mem", "addr"):
+                setattr(self, name, getattr(self, name).ravel()[shift].reshape(K, W))
+            self.count   -= retires
+            self.retired += retires
+            self.finish[(self.retired >= self.n) & (self.finish == 0)] = self.cycles + 1
+
+        # dispatch new instructions at the tail
+        nd = np.minimum(np.minimum(self.disp_width, self.capacity - self.count), self.n - self.dispatched)
+        if nd.any():
+            ks   = np.repeat(np.arange(K), nd)
+            j    = np.arange(len(ks)) - np.repeat(np.cumsum(nd) - nd, nd)
+            p    = self.count[ks] + j
+            didx = self.dispatched[ks] + j
+            s    = didx % self.num_instr
+            self.sidx[ks, p]  = s
+            self.state[ks, p] = DISPATCH
+            self.sub[ks, p]   = NONE
+            self.lat[ks, p]   = 0
+            self.mem[ks, p]   = self.memtype[s]
+            self.addr[ks, p]  = self.addr0[s] + (didx // self.num_instr) * self.stride[s]
+        self.count      += nd
+        self.dispatched += nd
+        self.valid = pos < self.count[:, None]
+        self.cycles += 1
+
+    def run(self) -> list:
+        while self.K:
+            retires = self.next_cycle()
+            self.pop_and_dispatch(retires)
+            finished = int((self.retired >= self.n).sum())
+            if finished and (finished * 8 >= self.K or finished == self.K):
+                self.compact()
+        return self.results
+
+    def json(self, k: int) -> dict:
+        cycles = int(self.finish[k])
+        all_ports = 0
+        for mask in self.pmask[k]:
+            all_ports |= int(mask)
+        out = {}
+        out["total_iterations"]     = self.niters
+        out["total_instructions"]   = self.n
+        out["total_cycles"]         = cycles
+        out["ipc"]                  = self.n / cycles
+        out["cycles_per_iteration"] = cycles / self.niters
+        out["ports"] = {str(port): int(self.port_usage[k, port])/cycles*100
+                        for port in range(32) if (all_ports >> port) & 1}
+        out["reads"]         = int(self.reads[k])
+        out["read_misses"]   = int(self.rd_misses[k])
+        out["writes"]        = int(self.writes[k])
+        out["write_misses"]  = int(self.wr_misses[k])
+        out["second_misses"] = int(self.s2_misses[k])
+        out["MM_Reads"]      = int(self.rd_misses[k] + self.wr_misses[k])
+        out["MM_Writes"]     = int(self.mm_writes[k])
+        return out
+
+def simulate_batch(processJSON, configs: list, niters: int = 3) -> list:
+    # list of get_results summaries (SUMMARY_KEYS), one per configuration (dict of overrides)
+    from .scheduler import _scheduler
+    results = [None] * len(configs)
+    # the batch engine models the greedy scheduler, pipelined ports, register dependences, no
+    #   load/store queue limits, single-loop addresses and a write-back LRU cache only
+    default = Process().cache_options()
+    greedy  = [k for k, config in enumerate(configs)
+               if dict(processJSON, **config).get("sched", "greedy") == "greedy"
+               and Process.from_json(dict(processJSON, **config)).cache_options() == default
+               and not dict(processJSON, **config).get("memDependences", False)
+               and not dict(processJSON, **config).get("LQsize", 0)
+               and not dict(processJSON, **config).get("SQsize", 0)
+               and all(instr.get("occupancy", 1) == 1 and not instr.get("loops")
+                       for instr in dict(processJSON, **config).get("instruction_list", []))]
+    if greedy:
+        engine = BatchEngine(processJSON, [configs[k] for k in greedy], niters)
+        for k, out in zip(greedy, engine.run()):
+            results[k] = out
+    for k, config in enumerate(configs):
+        if results[k] is None:
+            out = _scheduler.simulate(dict(processJSON, **config), niters)
+            results[k] = {key: out[key] for key in SUMMARY_KEYS}
+    return results
+
+class BatchScheduler:
+    # single-configuration adapter, for differential testing (python -m rvcat.difftest
+    #   --candidate rvcat.batch:BatchScheduler): reproduces only result_keys of get_results
+    result_keys = SUMMARY_KEYS
+
+    def get_results(self, processJSON, niters: int = 3) -> str:
+        import json
+        return json.dumps(simulate_batch(processJSON, [{}], niters)[0])
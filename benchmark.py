@@ -0,0 +1,181 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from .scheduler      import _scheduler
+from .interval_model import load_reference_suite
+
+# Performance benchmarks of the simulator itself (not of the simulated kernels).
+# Each canonical kernel in kernels/ is run along several scaling axes, one axis at a time
+# (the other parameters keep the kernel's values), measuring:
+#   cycles_per_second : simulated cycles per second of wall time (best of REPEAT runs)
+#   peak_memory       : peak Python memory allocated during the run (bytes, tracemalloc)
+#   longest_path_time : wall time of the critical path computation (seconds)
+#   simulated_cycles  : total cycles of the simulation (must not change)
+# and the cold-start time of "import rvcat" in a fresh interpreter, which must stay within
+# IMPORT_BUDGET and must not load NumPy (slow to load on Pyodide).
+# Results are compared against a stored baseline; run as:
+#   python -m rvcat.benchmark [--quick] [--update] [--threshold 0.25]
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "benchmarks", "baseline.json")
+THRESHOLD     = 0.25   # maximum relative slowdown / memory growth before failing
+MIN_TIME      = 0.001  # longest_path times below this (seconds) are too noisy to compare
+REPEAT        = 3
+IMPORT_BUDGET = 0.1    # seconds
+NITERS        = 100
+
+AXES = {
+    "niters":  [50, 200],
+    "ROBsize": [8, 64],
+    "ports":   [1, 2],       # all instructions restricted to the first P ports
+    "nBlocks": [0, 64],
+    "sched":   ["greedy", "optimal"],
+}
+
+QUICK_AXES = {
+    "niters":  [50],
+    "sched":   ["greedy", "optimal"],
+}
+
+def restrict_ports(instruction_list, n_ports):
+    # map every port p used by an instruction to port p % n_ports
+    instrs = []
+    for instr in instruction_list:
+        mask = 0
+        for port in range(32):
+            if (instr["ports"] >> port) & 1:
+                mask |= 1 << (port % n_ports)
+        instrs.append(dict(instr, ports=mask))
+    return instrs
+
+def get_cases(suite, axes):
+    # list of (case name, process JSON, niters)
+    cases = []
+    for kernel in suite:
+        for axis, values in axes.items():
+            for value in values:
+                process = dict(kernel)
+                niters  = NITERS
+                if axis == "niters":
+                    niters = value
+                elif axis == "ports":
+                    process["instruction_list"] = restrict_ports(kernel["instruction_list"], value)
+                else:
+                    process[axis] = value
+                cases.append((f"{kernel['name']}/{axis}={value}", process, niters))
+    return cases
+
+def run_case(process, niters, repeat = REPEAT):
+    best = None
+    for _ in range(repeat):
+        start   = time.perf_counter()
+        results = json.loads(_scheduler.get_results(process, niters))
+        elapsed = time.perf_counter() - start
+        best    = elapsed if best is None else min(best, elapsed)
+
+    profile = json.loads(_scheduler.get_results(process, niters, profile=True))["profile"]
+
+    tracemalloc.start()
+    _scheduler.get_results(process, niters)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"cycles_per_second": results["total_cycles"] / best,
+            "peak_memory":       peak,
+            "longest_path_time": profile["phases"]["longest_path"]["time"],
+            "simulated_cycles":  results["total_cycles"]}
+
+def measure_import(repeat = REPEAT):
+    # best cold-start import time (seconds) and whether NumPy got imported
+    package = os.path.dirname(os.path.abspath(__file__))
+    code    = ("import sys, time; t = time.perf_counter(); import " + os.path.basename(package) +
+               "; print(time.perf_counter() - t, 'numpy' in sys.modules)")
+    best, numpy_loaded = None, False
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(package),
+                             capture_output=True, text=True, check=True).stdout.split()
+        best = float(out[0]) if best is None else min(best, float(out[0]))
+        numpy_loaded = out[1] == "True"
+    return best, numpy_loaded
+
+def check_import(import_time, numpy_loaded, budget = IMPORT_BUDGET):
+    regressions = []
+    if import_time > budget:
+        regressions.append(f"import: {import_time*1000:.1f} ms exceeds budget of {budget*1000:.0f} ms")
+    if numpy_loaded:
+        regressions.append("import: NumPy is loaded at import time")
+    return regressions
+
+def run_benchmarks(axes = AXES, repeat = REPEAT, progress = None):
+    results = {}
+    for name, process, niters in get_cases(load_reference_suite(), axes):
+        results[name] = run_case(process, niters, repeat)
+        if progress:
+            progress(name, results[name])
+    return results
+
+def compare(results, baseline, threshold = THRESHOLD):
+    # returns list of regression messages (empty if none)
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["simulated_cycles"] != base["simulated_cycles"]:
+            regressions.append(f"{name}: simulated cycles changed {base['simulated_cycles']} -> {result['simulated_cycles']}")
+        if result["cycles_per_second"] < base["cycles_per_second"] * (1 - threshold):
+            regressions.append(f"{name}: cycles/s {base['cycles_per_second']:.0f} -> {result['cycles_per_second']:.0f}")
+        if result["peak_memory"] > base["peak_memory"] * (1 + threshold):
+            regressions.append(f"{name}: peak memory {base['peak_memory']} -> {result['peak_memory']}")
+        if max(result["longest_path_time"], base["longest_path_time"]) > MIN_TIME and \
+           result["longest_path_time"] > base["longest_path_time"] * (1 + threshold):
+            regressions.append(f"{name}: longest_path {base['longest_path_time']:.4f}s -> {result['longest_path_time']:.4f}s")
+    return regressions
+
+def main(argv = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m rvcat.benchmark", description="RVCAT simulator benchmarks")
+    parser.add_argument("--quick",     action="store_true", help="run a reduced set of scaling axes")
+    parser.add_argument("--update",    action="store_true", help="store results as the new baseline")
+    parser.add_argument("--baseline",  default=BASELINE_FILE, help="baseline file (JSON)")
+    parser.add_argument("--output",    default="", help="also write results to this file (JSON)")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="allowed relative regression")
+    parser.add_argument("--repeat",    type=int,   default=REPEAT,    help="timed runs per case (best is kept)")
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET, help="maximum cold-start import time (s)")
+    args = parser.parse_args(argv)
+
+    import_time, numpy_loaded = measure_import(args.repeat)
+    print(f"{'import':32s} {import_time*1000:10.1f} ms cold start, NumPy {'loaded' if numpy_loaded else 'not loaded'}",
+          file=sys.stderr)
+
+    def progress(name, result):
+        print(f"{name:32s} {result['cycles_per_second']:10.0f} cycles/s {result['peak_memory']/1024:9.0f} KiB "
+              f"{result['longest_path_time']*1000:8.2f} ms longest_path", file=sys.stderr)
+
+    results = run_benchmarks(QUICK_AXES if args.quick else AXES, args.repeat, progress)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=1)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    if args.update:
+        baseline.update(results)
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+        return 0
+
+    regressions = check_import(import_time, numpy_loaded, args.import_budget) + compare(results, baseline, args.threshold)
+    for text in regressions:
+        print("REGRESSION " + text)
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,44 @@
-import numpy as np
+import os
+from bisect      import bisect_right
+from collections import deque
+from .replacement import get_policy
+
+# Storage of cache tables: plain Python lists (default: scalar element access is faster
+# than on NumPy arrays, and no NumPy import is needed, e.g. on Pyodide), or NumPy uint32
+# arrays, imported only when selected with set_backend("numpy") or RVCAT_BACKEND=numpy
+BACKEND = os.environ.get("RVCAT_BACKEND", "python")
+
+def set_backend(name):
+  global BACKEND
+  if name not in ("python", "numpy"):
+    raise ValueError(f"unknown cache backend '{name}'")
+  BACKEND = name
+
+def new_table(rows, cols= 0):
+  if BACKEND == "numpy":
+    import numpy as np
+    return np.zeros( (rows, cols) if cols else rows, dtype=np.uint32)
+  return [[0]*cols for _ in range(rows)] if cols else [0]*rows
+
+def load_table(data):
+  if BACKEND == "numpy":
+    import numpy as np
+    return np.array(data, dtype=np.uint32)
+  return [row[:] if isinstance(row, list) else row for row in data]
+
+def dump_table(table):
+  if hasattr(table, "tolist"):
+    return table.tolist()
+  return [row[:] if isinstance(row, list) else row for row in table]
 
 class Cache:
 
-  def __init__(self, cache_sz, block_sz, MissLatency= 10, MissIssueTime= 4):
+  # replacement:    "lru", "plru" (tree pseudo-LRU), "fifo", "random" (with seed), "srrip"
+  # write_policy:   "write-back" (dirty blocks written on eviction) or "write-through" (every
+  #                 store is sent to memory through a write buffer of write_buffer entries)
+  # write_allocate: False: a store miss does not bring the block, it goes to the write buffer
+  def __init__(self, cache_sz, block_sz, MissLatency= 10, MissIssueTime= 4, replacement= "lru",
+               write_policy= "write-back", write_allocate= True, write_buffer= 4, seed= 0):
 
     self.CACHE_SIZE      = cache_sz
     self.BLOCK_SIZE      = block_sz
@@ -10,80 +46,256 @@ class Cache:
     self.MEM_latency     = MissLatency
     self.MEM_issue_time  = MissIssueTime
 
-    self.TAGS     = np.zeros( cache_sz, dtype=np.uint32)
-    self.DATA     = np.zeros( cache_sz, dtype=np.uint32)
-    self.LRU      = np.zeros( cache_sz, dtype=np.uint32)
-    self.VALID    = np.zeros( cache_sz, dtype=np.uint32)
-    self.MODIFIED = np.zeros( cache_sz, dtype=np.uint32)
+    if write_policy not in ("write-back", "write-through"):
+      raise ValueError(f"unknown write policy '{write_policy}' (use write-back or write-through)")
+    self.REPLACEMENT     = replacement
+    self.SEED            = seed
+    self.WRITE_THROUGH   = write_policy == "write-through"
+    self.WRITE_ALLOCATE  = write_allocate
+    self.WRITE_BUFFER    = max(write_buffer, 1)
+
+    self.TAGS     = new_table( cache_sz)
+    self.DATA     = new_table( cache_sz)
+    self.VALID    = new_table( cache_sz)
+    self.MODIFIED = new_table( cache_sz)
+
+    # optional access statistics per static instruction and per array (see set_statistics)
+    self.INSTR_STATS = None
+    self.ARRAY_STATS = None
+    self.ARRAY_BASE  = []
+    self.ARRAY_END   = []
 
     self.reset()
 
   def reset(self):
     self.MEM_last_access = - self.MEM_issue_time
 
-    # Initialize cache with LRU list: any random order would suffice
     for i in range(self.CACHE_SIZE):
-      self.LRU[i]     = i
       self.VALID[i]   = 0
+    self.BLOCKS  = {}     # block -> cache line, of valid lines
+    self.FILLED  = 0      # lines are filled in order: lines >= FILLED are invalid
+    self.POLICY  = get_policy(self.REPLACEMENT, self.CACHE_SIZE, self.SEED)
 
-  # returns position in cache where block resides, or -1 otherwise
-  def search(self, block):
+    self.WBUF           = deque()   # cycles when write buffer entries are drained to memory
+    self.BUFFER_WRITES  = 0         # writes sent to memory through the write buffer
+    self.NOALLOC_MISSES = 0         # store misses not allocated in cache (write_allocate = False)
+
+  # Enable attribution of accesses to static instructions and arrays.
+  # Counters (columns): 0: hits, 1: primary misses, 2: secondary misses, 3: write-backs
+  #   last row of each table accounts for unknown instructions / addresses outside arrays
+  # array_addrs = [ [init_addr, dataSize, array_size], ...] as in Program.array_addrs
+  def set_statistics(self, n_instr, array_addrs):
+    self.INSTR_STATS = new_table( n_instr+1, 4)
+    self.ARRAY_STATS = new_table( len(array_addrs)+1, 4)
+    self.ARRAY_BASE  = [addr for addr, _, _ in array_addrs]   # increasing: arrays are back to back
+    self.ARRAY_END   = [addr+size for addr, _, size in array_addrs]
+
+  # serialisable state, used for simulation checkpoints
+  def get_state(self):
+    state = {"MEM_last_access": int(self.MEM_last_access),
+             "FILLED":          self.FILLED,
+             "POLICY":          self.POLICY.get_state(),
+             "WBUF":            list(self.WBUF),
+             "BUFFER_WRITES":   self.BUFFER_WRITES,
+             "NOALLOC_MISSES":  self.NOALLOC_MISSES}
+    for name in ("TAGS", "DATA", "VALID", "MODIFIED", "INSTR_STATS", "ARRAY_STATS"):
+      table = getattr(self, name)
+      state[name] = dump_table(table) if table is not None else None
+    return state
+
+  def set_state(self, state):
+    self.MEM_last_access = state["MEM_last_access"]
+    self.FILLED          = state["FILLED"]
+    self.POLICY.set_state(state["POLICY"])
+    self.WBUF            = deque(state["WBUF"])
+    self.BUFFER_WRITES   = state["BUFFER_WRITES"]
+    self.NOALLOC_MISSES  = state["NOALLOC_MISSES"]
+    for name in ("TAGS", "DATA", "VALID", "MODIFIED", "INSTR_STATS", "ARRAY_STATS"):
+      if state[name] is not None:
+        setattr(self, name, load_table(state[name]))
+    self.BLOCKS = {int(self.TAGS[i]): i for i in range(self.CACHE_SIZE) if self.VALID[i] == 1}
+
+  # copy of access statistics, to report statistics since this point (see get_statistics)
+  def get_statistics_state(self):
+    return {"INSTR_STATS": dump_table(self.INSTR_STATS), "ARRAY_STATS": dump_table(self.ARRAY_STATS),
+            "counters":    (self.NOALLOC_MISSES, self.BUFFER_WRITES)}
+
+  # functional access (no timing, no statistics), to keep cache contents up to date while
+  #   fast-forwarding (see sampling): tags, replacement and dirty state change as in access
+  def warm(self, access_type, address):
+    block = address // self.BLOCK_SIZE
+    pos   = self.BLOCKS.get(block, -1)
+    if pos >= 0:
+      self.POLICY.touch(pos)
+    elif access_type == 1 and not self.WRITE_ALLOCATE:
+      return
+    else:
+      pos = self.get_victim()
+      self.fill(pos, block)
+      self.DATA[pos] = 0
+    self.MODIFIED[pos] = 0 if self.WRITE_THROUGH else access_type
+
+  # move pending memory activity (data ready, memory and write buffer busy) cycles back,
+  #   keeping cache contents: a new simulation from cycle 0 continues with the same backlog
+  #   as a simulation that ended at cycle cycles
+  def shift_timing(self, cycles):
     for i in range(self.CACHE_SIZE):
-      if self.VALID[i]==1 and self.TAGS[i]==block:
-        return i
+      self.DATA[i] = max(0, self.DATA[i] - cycles)
+    self.MEM_last_access = max(self.MEM_last_access - cycles, - self.MEM_issue_time)
+    self.WBUF = deque(t - cycles for t in self.WBUF if t > cycles)
+
+  # index of array containing address (bisect on array base addresses), or -1 if none
+  def get_array(self, address):
+    i = bisect_right(self.ARRAY_BASE, address) - 1
+    if i >= 0 and address < self.ARRAY_END[i]:
+      return i
     return -1
 
-  # updates the LRU list setting cache position pos at the end
-  def updateLRU(self, block):
-    previous = self.LRU[block]
-    for i in range(self.CACHE_SIZE):
-      if self.LRU[i] > previous:
-        self.LRU[i] = self.LRU[i]-1      # Decrease LRU priority
-    self.LRU[block] = self.CACHE_SIZE-1  # Set maximum priority
+  # returns position in cache where block resides, or -1 otherwise
+  def search(self, block):
+    return self.BLOCKS.get(block, -1)
 
-  # get line with LRU=0
-  def getLRU(self):
-    for i in range(self.CACHE_SIZE):
-      if self.LRU[i] == 0:
-        return i
-    return 0  ## Error: should not happen (but not checked at runtime)
+  # line to store a new block: first invalid line, or the one chosen by the replacement policy
+  def get_victim(self):
+    if self.FILLED < self.CACHE_SIZE:
+      self.FILLED += 1
+      return self.FILLED - 1
+    return self.POLICY.victim()
+
+  # store block in line pos (tag and valid bit)
+  def fill(self, pos, block):
+    if self.VALID[pos] == 1:
+      del self.BLOCKS[int(self.TAGS[pos])]
+    self.BLOCKS[block] = pos
+    self.TAGS[pos]  = block    # store tag for stored block
+    self.VALID[pos] = 1        # cache line is valid
+    self.POLICY.insert(pos)
+
+  # send a store to memory through the write buffer; returns cycles the store waits for a free entry
+  def buffer_write(self, block, current_cycle):
+    while self.WBUF and self.WBUF[0] <= current_cycle:
+      self.WBUF.popleft()
+    stall = 0
+    if len(self.WBUF) >= self.WRITE_BUFFER:
+      stall = self.WBUF.popleft() - current_cycle
+    start = max(self.WBUF[-1] if self.WBUF else 0, current_cycle + stall)
+    self.WBUF.append(start + self.MEM_issue_time)    # entries drain one per memory issue time
+    self.next_level_write(block, current_cycle + stall)
+    self.BUFFER_WRITES += 1
+    return stall
+
+  # request block to next level (main memory channel); returns result and latency:
+  #   result 1: block comes from main memory, latency to MM request sent (MM latency added by scheduler)
+  #   result 4: block comes from a shared last-level cache, latency to data ready (see multicore)
+  def next_level_read(self, block, current_cycle):
+    self.MEM_last_access += self.MEM_issue_time
 
-  def access(self, access_type, address, current_cycle):  
-    # returns result (0: hit, 1: primary miss, 2: secondary miss, 3: primary miss with MM update of dirty block),
-    #         latency (hit: 0, primary miss: latency_to_MM_request_sent, secondary miss: latency_to_WB),
+    if current_cycle > self.MEM_last_access:
+      self.MEM_last_access = current_cycle
+
+    return 1, self.MEM_last_access - current_cycle
+
+  # write dirty block back to next level
+  def next_level_write(self, block, current_cycle):
+    self.MEM_last_access  += self.MEM_issue_time  # consume MEM bandwidth
+
+  def access(self, access_type, address, current_cycle, instr_idx= -1):  
+    # returns result (0: hit, 1: primary miss, 2: secondary miss, 3: primary miss with MM update of dirty block,
+    #                 4: access completes after latency, without primary miss: shared last-level
+    #                    cache hit or store waiting for the write buffer),
+    #         latency (hit: 0, primary miss: latency_to_MM_request_sent, secondary miss: latency_to_WB,
+    #                  result 4: latency_to_WB),
+    # instr_idx: static instruction performing the access (only used for statistics)
 
     block   = address // self.BLOCK_SIZE
     pos     = self.search(block)
     result  = 0  # HIT by default
     latency = 0  # HIT latency by default
+    dirty   = False
+    stat    = 0  # statistics: 0: hit, 1: primary miss, 2: secondary miss
       
     if (pos >= 0): 
       if self.DATA[pos] > current_cycle:  # SECONDARY MISS
         result  = 2  # CACHE_2ND
+        stat    = 2
         latency = self.DATA[pos] + 1 - current_cycle
         self.DATA[pos] += 1     # one secondary miss to same cache line per cycle
       # else: HIT, no latency
+      self.POLICY.touch(pos)
+      if access_type == 1 and self.WRITE_THROUGH:
+        stall = self.buffer_write(block, current_cycle)
+        if stall and result == 0:
+          result, latency = 4, stall
+
+    elif access_type == 1 and not self.WRITE_ALLOCATE:  # STORE MISS to write buffer, not allocated
+      stat = 1
+      self.NOALLOC_MISSES += 1
+      stall = self.buffer_write(block, current_cycle)
+      if stall:
+        result, latency = 4, stall
 
     else:  # PRIMARY MISS
-      result = 1 # CACHE_MISS
+      stat = 1
+      pos  = self.get_victim()
+      # compute traffic to Main Memory (or shared last-level cache)
+      result, latency = self.next_level_read(block, current_cycle)  # CACHE_MISS or LLC hit
 
-      pos = self.getLRU()
-      # compute traffic to Main Memory
-      self.MEM_last_access += self.MEM_issue_time
+      if (self.MODIFIED[pos] == 1):   # Need to update dirty data block in Cache to Memory
+        self.next_level_write(int(self.TAGS[pos]), current_cycle)
+        dirty  = True
+        if result == 1:
+          result = 3  # CACHE_MISS_WB
+        if self.ARRAY_STATS is not None:  # write-back is attributed to the array of the evicted block
+          self.ARRAY_STATS[self.get_array(int(self.TAGS[pos]) * self.BLOCK_SIZE)][3] += 1
+  
+      self.fill(pos, block)
+      if result == 4:            # time when data will be ready in cache
+        self.DATA[pos] = current_cycle + latency
+      else:
+        self.DATA[pos] = current_cycle + latency + self.MEM_latency
+      if access_type == 1 and self.WRITE_THROUGH:
+        self.buffer_write(block, current_cycle)   # any wait is hidden by the miss
 
-      if current_cycle > self.MEM_last_access:
-        self.MEM_last_access = current_cycle
+    if pos >= 0:
+      self.MODIFIED[pos] = 0 if self.WRITE_THROUGH else access_type
 
-      latency = self.MEM_last_access - current_cycle ## self.MEM_latency will be added by scheduler
+    if self.INSTR_STATS is not None:
+      self.INSTR_STATS[instr_idx][stat] += 1
+      self.ARRAY_STATS[self.get_array(address)][stat] += 1
+      if dirty:
+        self.INSTR_STATS[instr_idx][3] += 1
 
-      if (self.MODIFIED[pos] == 1):   # Need to update dirty data block in Cache to Memory
-        self.MEM_last_access  += self.MEM_issue_time  # consume MEM bandwidth
-        result = 3  # CACHE_MISS_WB
-  
-      self.TAGS[pos]  = block    # store tag for stored block
-      self.VALID[pos] = 1        # cache line is valid
-      self.DATA[pos]  = current_cycle + latency + self.MEM_latency  # time when data will be ready in cache
+    return result, int(latency)   # plain int: latency feeds counters and the execution graph
+
+  # JSON-like summary of statistics: list of per-instruction and per-array counters
+  #   since: get_statistics_state() at the start of the measured region (default: reset)
+  def get_statistics(self, instr_names, array_names, since= None):
+    def counters(row):
+      return {"accesses":      int(row[0]+row[1]+row[2]),
+              "hits":          int(row[0]),
+              "misses":        int(row[1]),
+              "second_misses": int(row[2]),
+              "write_backs":   int(row[3])}
+
+    def table(name):
+      rows = dump_table(getattr(self, name))
+      if since is not None:
+        rows = [[a-b for a, b in zip(row, base)] for row, base in zip(rows, since[name])]
+      return rows
+
+    instr_stats = table("INSTR_STATS")
+    array_stats = table("ARRAY_STATS")
+
+    instructions = []
+    for i, name in enumerate(instr_names):
+      row = instr_stats[i]
+      if any(row):
+        instructions.append(dict({"id": i, "instruction": name}, **counters(row)))
+
+    arrays = []
+    for i, name in enumerate(array_names):
+      arrays.append(dict({"name": name, "address": self.ARRAY_BASE[i]}, **counters(array_stats[i])))
+    if any(array_stats[-1]):
+      arrays.append(dict({"name": "", "address": -1}, **counters(array_stats[-1])))
 
-    self.MODIFIED[pos] = access_type
-    self.updateLRU(pos)  
-    return result, latency
\ No newline at end of file
+    return {"instructions": instructions, "arrays": arrays}
\ No newline at end of file
@@ -0,0 +1,274 @@
+from bisect import bisect_left, bisect_right
+from math   import lcm
+from .cache import Cache
+
+# Analytic (simulation-free) model of the fully associative LRU cache in cache.py.
+# Each MEM/VMEM instruction generates the affine address stream addr + k*byte_stride,
+# k = 0 .. niters-1 (only the first byte of each access is used, as in the simulator).
+# Streams on the same array with the same stride share cache blocks: the one ahead
+# (leader) brings the block, the others (followers) hit if their reuse distance,
+# measured in distinct blocks touched meanwhile, fits in the cache.
+# Cost does not depend on niters: it grows with the number of memory instructions S and of
+# stream groups G (O(S*G) at worst, when groups interleave in program order).
+# Secondary misses (accesses to a block still being filled) depend on timing: they are
+# counted as hits, and second_misses is reported as None.
+# Programs with nested-loop address streams (Instruction.loops) are not modelled: their address
+# trace is replayed through the simulated Cache for two periods of the loop nest (iterations
+# after which all streams repeat their pattern, shifted by the outer strides; at most
+# MAX_PERIOD), and the misses of the second period are repeated for the remaining iterations.
+
+MAX_PERIOD = 1024   # iterations of the replayed period of nested-loop programs
+
+def get_memory_streams(instruction_list):
+    # list of (static_idx, access_type, array name, initial address, byte stride)
+    #   access_type = 0 for load, 1 for store (same convention as Cache.access)
+    streams = []
+    for idx, inst in enumerate(instruction_list):
+        if inst.type == "MEM" or inst.type == "VMEM":
+            access_type = 0 if inst.oper == "LOAD" else 1
+            streams.append((idx, access_type, inst.source2, inst.addr, inst.byte_stride))
+    return streams
+
+def get_stream_groups(streams, blk_size):
+    # Group streams that walk over the same sequence of cache blocks
+    #   stride == 0         : one fixed block
+    #   |stride| <= blk_size: contiguous block range, unit = cache block
+    #   |stride| >  blk_size: one new block per access, unit = multiple of stride,
+    #                         streams share blocks only if they have the same phase
+    groups = {}
+    for stream in streams:
+        groups.setdefault(get_group_key(stream, blk_size), []).append(stream)
+    return groups
+
+def get_group_key(stream, blk_size):
+    _, _, array, addr, stride = stream
+    if stride == 0:
+        return (array, 0, addr // blk_size)
+    if abs(stride) <= blk_size:
+        return (array, stride, 0)
+    return (array, stride, (addr % abs(stride)) // blk_size)
+
+def get_groups_between(positions, keys, key, first_idx, last_idx):
+    # number of other stream groups accessed between two instructions of the same iteration
+    #   positions: static index of each stream (increasing), keys: group key of each stream
+    between = set(keys[bisect_right(positions, first_idx):bisect_left(positions, last_idx)])
+    between.discard(key)
+    return len(between)
+
+def estimate_cache_misses(instruction_list, niters, n_blocks, blk_size):
+
+    streams = get_memory_streams(instruction_list)
+
+    out = {"reads": 0, "read_misses": 0, "writes": 0, "write_misses": 0,
+           "second_misses": None, "MM_Reads": 0, "MM_Writes": 0}
+
+    inst_misses, write_backs = get_instruction_misses(instruction_list, niters, n_blocks, blk_size)
+
+    for (idx, access_type, _, _, _) in streams:
+        if access_type == 0:
+            out["reads"]        += niters
+            out["read_misses"]  += inst_misses[idx]
+        else:
+            out["writes"]       += niters
+            out["write_misses"] += inst_misses[idx]
+
+    out["MM_Reads"]  = out["read_misses"] + out["write_misses"]
+    out["MM_Writes"] = write_backs
+    return out
+
+def get_instruction_misses(instruction_list, niters, n_blocks, blk_size):
+    # returns list of estimated primary misses per static instruction, and number of write-backs
+
+    streams = get_memory_streams(instruction_list)
+    misses  = [0] * len(instruction_list)
+
+    if n_blocks <= 0 or niters <= 0:  # no cache: no misses are accounted
+        return misses, 0
+
+    if any(instruction_list[stream[0]].loops for stream in streams):
+        return extrapolate_cache_misses(instruction_list, streams, niters, n_blocks, blk_size)
+
+    groups    = get_stream_groups(streams, blk_size)
+    positions = [stream[0] for stream in streams]
+    keys      = [get_group_key(stream, blk_size) for stream in streams]
+
+    # new blocks brought to the cache per iteration, by all streams, and
+    # blocks being used at the same time (working set of one iteration)
+    rate = 0
+    live = 0
+    for (_, stride, _), members in groups.items():
+        rate += min(1, abs(stride) / blk_size)
+        unit_sz = blk_size if abs(stride) <= blk_size else abs(stride)
+        live += len(set(s[3] // unit_sz for s in members))
+
+    # blocks reused every iteration (stride 0, or several accesses per block)
+    # are evicted before reuse if the per-iteration working set exceeds the cache
+    thrashing = live > n_blocks
+
+    dirty  = 0        # misses on blocks whose last access is a store (modified when evicted)
+
+    for key, members in groups.items():
+        stride = key[1]
+
+        group_misses = sum(misses)
+
+        if stride == 0:
+            members = sorted(members)
+            misses[members[0][0]] += niters if thrashing else 1
+            for prev, member in zip(members[:-1], members[1:]):
+                if thrashing and get_groups_between(positions, keys, key, prev[0], member[0]) >= n_blocks:
+                    misses[member[0]] += niters
+            if members[-1][1] == 1:  # last access is a store: evicted block is dirty
+                dirty += sum(misses) - group_misses
+            continue
+
+        unit_sz = blk_size if abs(stride) <= blk_size else abs(stride)
+        step    = 1 if stride > 0 else -1
+
+        # leader is the stream ahead; lag (in iterations) of the others behind it
+        lead   = max(members, key=lambda s: s[3] / stride)
+        ranked = sorted(members, key=lambda s: ((lead[3] - s[3]) / stride, s[0]))
+
+        cov_lo, cov_hi = None, None
+        prev_lag, prev_idx = None, None
+        for member in ranked:
+            idx, _, _, addr, _ = member
+            lag  = (lead[3] - addr) / stride
+
+            if abs(stride) <= blk_size:
+                u_first = addr // unit_sz
+                u_last  = (addr + (niters-1)*stride) // unit_sz
+            else:
+                u_first = addr // unit_sz
+                u_last  = u_first + (niters-1)*step
+            lo, hi = min(u_first, u_last), max(u_first, u_last)
+            length = hi - lo + 1
+
+            if cov_lo is None:  # leader: compulsory misses on every unit it touches
+                cov_lo, cov_hi = lo, hi
+                misses[idx] += niters if thrashing else length
+            else:
+                overlap   = max(0, min(hi, cov_hi) - max(lo, cov_lo) + 1)
+                new_units = length - overlap
+                cov_lo, cov_hi = min(lo, cov_lo), max(hi, cov_hi)
+
+                # distinct blocks touched between last use by the previous stream and use by this one
+                if lag == prev_lag:   # same address, same iteration
+                    distance = get_groups_between(positions, keys, key, prev_idx, idx)
+                else:
+                    reuse_lag = lag - (unit_sz / abs(stride) - 1)
+                    distance  = max(0, reuse_lag) * rate + live - 1
+                    if thrashing:
+                        distance = n_blocks
+
+                if distance >= n_blocks:   # block evicted before reuse
+                    new_units = niters if thrashing else length
+                misses[idx] += new_units
+
+            prev_lag, prev_idx = lag, idx
+
+        if ranked[-1][1] == 1:  # trailing stream is a store: evicted blocks are dirty
+            dirty += sum(misses) - group_misses
+
+    total = sum(misses)
+    evictions = max(0, total - n_blocks)
+    write_backs = round(evictions * dirty / total) if total > 0 else 0
+    return misses, write_backs
+
+def get_replay_period(instruction_list, streams):
+    # iterations after which the nested-loop streams repeat their pattern: lcm of the periods of
+    #   the streams at the deepest loop level where it does not exceed MAX_PERIOD
+    nested = [instruction_list[stream[0]].stream for stream in streams if instruction_list[stream[0]].loops]
+    for level in range(max(len(stream.trips) for stream in nested), 0, -1):
+        period = 1
+        for stream in nested:
+            period = lcm(period, stream.get_period(min(level, len(stream.trips))))
+        if period <= MAX_PERIOD:
+            return period
+    return MAX_PERIOD
+
+def extrapolate_cache_misses(instruction_list, streams, niters, n_blocks, blk_size):
+    # misses per static instruction and write-backs of nested-loop programs: replay of two periods
+    #   (the first one warms the cache), the second one stands for the next ones. Cost does not
+    #   depend on niters
+    period = get_replay_period(instruction_list, streams)
+    if niters <= 2*period:
+        out, misses = replay_cache_misses(instruction_list, niters, n_blocks, blk_size)
+        return misses, out["MM_Writes"]
+    periods, rest = divmod(niters, period)
+    _, _, marks = replay_cache_misses(instruction_list, 2*period, n_blocks, blk_size,
+                                      marks=(period, period + rest, 2*period))
+    (first, first_wb), (partial, partial_wb), (second, second_wb) = marks
+    misses = [a + (periods-1)*(b - a) + (c - a) for a, b, c in zip(first, second, partial)]
+    return misses, first_wb + (periods-1)*(second_wb - first_wb) + (partial_wb - first_wb)
+
+def simulate_cache_misses(instruction_list, niters, n_blocks, blk_size):
+    # Replay the address trace in program order through the simulated Cache,
+    #  without timing: one access per cycle and zero miss latency, so that
+    #  secondary misses never occur (the analytic model counts them as hits)
+    return replay_cache_misses(instruction_list, niters, n_blocks, blk_size)[0]
+
+def replay_cache_misses(instruction_list, niters, n_blocks, blk_size, marks=()):
+    # as simulate_cache_misses; also returns list of primary misses per static instruction
+    #   and, if marks (increasing iteration counts) are given, (misses, write-backs) after each one
+
+    streams = get_memory_streams(instruction_list)
+    misses  = [0] * len(instruction_list)
+
+    out = {"reads": 0, "read_misses": 0, "writes": 0, "write_misses": 0,
+           "second_misses": 0, "MM_Reads": 0, "MM_Writes": 0}
+
+    cache = Cache(n_blocks, blk_size, 0, 0) if n_blocks > 0 else None
+    # address trace of each stream (nested loops included), generated a loop level at a time
+    addresses = [instruction_list[idx].stream.get_addresses(niters) if cache is not None else None
+                 for (idx, _, _, _, _) in streams]
+    cycle    = 0
+    recorded = []
+    for k in range(niters):
+        while len(recorded) < len(marks) and k == marks[len(recorded)]:
+            recorded.append((misses[:], out["MM_Writes"]))
+        for (idx, access_type, _, _, _), stream in zip(streams, addresses):
+            if access_type == 0:
+                out["reads"] += 1
+            else:
+                out["writes"] += 1
+            if cache is None:
+                continue
+            result, _ = cache.access(access_type, stream[k], cycle)
+            cycle += 1
+            if result == 1 or result == 3:
+                misses[idx] += 1
+                if access_type == 0:
+                    out["read_misses"] += 1
+                else:
+                    out["write_misses"] += 1
+            if result == 3:
+                out["MM_Writes"] += 1
+            elif result == 2:
+                out["second_misses"] += 1
+
+    out["MM_Reads"] = out["read_misses"] + out["write_misses"]
+    if marks:
+        recorded += [(misses[:], out["MM_Writes"])] * (len(marks) - len(recorded))
+        return out, misses, recorded
+    return out, misses
+
+def validate_cache_model(instruction_list, niters, n_blocks, blk_size, timed=None):
+    # Compare analytic estimates against a replay through the simulated Cache (simulated: same
+    #   access order, no timing) and, if given, the results of Scheduler.get_results (timed:
+    #   out-of-order accesses, secondary misses, write buffer); errors are relative to timed
+    #   when given. Keys that the model does not estimate (None) have no error.
+    model     = estimate_cache_misses(instruction_list, niters, n_blocks, blk_size)
+    simulated = simulate_cache_misses(instruction_list, niters, n_blocks, blk_size)
+
+    out = {}
+    for key in model:
+        entry     = {"model": model[key], "simulated": simulated[key]}
+        reference = simulated[key]
+        if timed is not None:
+            entry["timed"] = reference = timed[key]
+        error = model[key] - reference if model[key] is not None else None
+        entry["error"]          = error
+        entry["relative_error"] = (error / reference if reference else 0.0) if error is not None else None
+        out[key] = entry
+    return out
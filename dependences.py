@@ -0,0 +1,433 @@
+from bisect import bisect_left
+from fractions import Fraction
+
+# Data dependence graph of the loop body: recurrences, and an edit-aware model of the
+# dependence information of a Program (interactive editing of instruction_list).
+# Recurrences: every loop-carried dependence cycle lies inside one strongly connected
+#   component of the producer -> consumer graph, found in O(V+E) (Tarjan). The latency bound
+#   of a component is its maximum cycle ratio (latency / iterations of the cycle), found in
+#   O(V*E) without listing cycles (Karp): an edge from a producer that is not before its
+#   consumer in the body crosses one iteration, and edges inside an iteration form a DAG.
+#   The cycle reaching that ratio (critical cycle) is recovered from the edges that are tight
+#   for it. Elementary cycles can be exponentially many: only a bounded number of them
+#   (MAX_CYCLES) is listed, for drawing (Program.cyclic_paths: critical cycle first, each
+#   cycle starting and ending at its lowest instruction ID).
+# Edits (DependenceModel: insert, delete, replace one instruction at a time):
+#   - only readers of the registers written by the old or new instruction can change
+#     producer: only their dependence lists (and offsets) are solved again. Instruction IDs
+#     after an inserted/deleted one are renumbered (and all offsets: n changes).
+#   - cycles are cached per component, keyed by its edges between stable instruction uids:
+#     only components whose edges changed are listed again, and only components with
+#     edited instructions get their critical cycle (latency bound) computed again.
+
+MAX_CYCLES = 64      # cycles listed per component (besides the critical one)
+MAX_STEPS  = 10000   # paths extended per component while listing cycles
+
+def get_dependence_graph(dependences: list) -> list:
+    # consumers of each instruction (producer -> consumer edges, once each, in program order)
+    graph = [[] for _ in dependences]
+    for inst_id, dep_list in enumerate(dependences):
+        for dep in dep_list:
+            if dep[0] >= 0 and inst_id not in graph[dep[0]]:
+                graph[dep[0]].append(inst_id)
+    return graph
+
+def get_components(graph: list) -> list:
+    # strongly connected components containing some cycle (several instructions, or one that
+    #   depends on itself), as sorted lists of instruction IDs, sorted by lowest ID
+    n = len(graph)
+    index, low, on_stack = [None]*n, [0]*n, [False]*n
+    stack, components, counter = [], [], 0
+    for root in range(n):
+        if index[root] is not None:
+            continue
+        work = [(root, 0)]   # (instruction, next edge to follow): iterative Tarjan
+        while work:
+            v, i = work.pop()
+            if i == 0:
+                index[v] = low[v] = counter
+                counter += 1
+                stack.append(v)
+                on_stack[v] = True
+            else:            # back from the consumer reached through edge i-1
+                low[v] = min(low[v], low[graph[v][i-1]])
+            for j in range(i, len(graph[v])):
+                w = graph[v][j]
+                if index[w] is None:
+                    work.append((v, j+1))
+                    work.append((w, 0))
+                    break
+                if on_stack[w]:
+                    low[v] = min(low[v], index[w])
+            else:
+                if low[v] == index[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = False
+                        component.append(w)
+                        if w == v:
+                            break
+                    if len(component) > 1 or v in graph[v]:
+                        components.append(sorted(component))
+    return sorted(components)
+
+def get_elementary_cycles(component: list, graph: list) -> list:
+    # elementary cycles of a component, each one starting and ending at its lowest ID:
+    #   at most MAX_CYCLES, after extending at most MAX_STEPS paths
+    members = set(component)
+    cycles  = []
+    steps   = 0
+    for start in component:
+        paths = [[start]]
+        while paths:
+            path   = paths.pop()
+            steps += 1
+            for w in graph[path[-1]]:
+                if w == start:
+                    cycles.append(path + [start])
+                    if len(cycles) >= MAX_CYCLES:
+                        return cycles
+                elif w > start and w in members and w not in path:
+                    paths.append(path + [w])
+            if steps >= MAX_STEPS:
+                return cycles
+    return cycles
+
+def get_exact(latencies: list) -> list:
+    # non-integer latencies as fractions, so that cycle ratios can be compared exactly
+    return [lat if isinstance(lat, int) else Fraction(lat) for lat in latencies]
+
+def get_cycle_ratio(component: list, graph: list, latencies: list) -> tuple:
+    # maximum latency / iterations of the cycles of a component, as (latency, iterations):
+    #   Karp's maximum mean cycle, where a step crosses one iteration edge (from a producer
+    #   not before its consumer), preceded by a longest path inside the iteration.
+    #   F[k][v]: longest walk that ends at v by crossing exactly k iterations
+    members  = set(component)
+    m        = len(component)
+    none     = None
+    F        = [{v: 0 for v in component}]
+    for k in range(m):
+        G = dict(F[k])       # longest walk inside iteration k (component is in program order)
+        for u in component:
+            if G[u] is not none:
+                for v in graph[u]:
+                    if v > u and v in members and (G[v] is none or G[u] + latencies[u] > G[v]):
+                        G[v] = G[u] + latencies[u]
+        Fk = {v: none for v in component}
+        for u in component:
+            if G[u] is not none:
+                for v in graph[u]:
+                    if v <= u and v in members and (Fk[v] is none or G[u] + latencies[u] > Fk[v]):
+                        Fk[v] = G[u] + latencies[u]
+        F.append(Fk)
+
+    best = None
+    for v in component:
+        if F[m][v] is none:
+            continue
+        worst = None
+        for k in range(m):
+            if F[k][v] is not none and (worst is None or
+                                        (F[m][v] - F[k][v]) * worst[1] < worst[0] * (m - k)):
+                worst = (F[m][v] - F[k][v], m - k)
+        if worst is not None and (best is None or worst[0] * best[1] > best[0] * worst[1]):
+            best = worst
+    return best
+
+def get_critical_cycle(component: list, graph: list, latencies: list) -> list:
+    # a cycle of the component with the maximum ratio, starting and ending at its lowest ID:
+    #   with edge weights den*latency - num*iterations (ratio num/den), no cycle is positive;
+    #   longest-path potentials make every edge of a zero-weight (critical) cycle tight
+    latencies = get_exact(latencies)
+    num, den  = get_cycle_ratio(component, graph, latencies)
+    members   = set(component)
+    edges     = [(u, v, den*latencies[u] - (num if v <= u else 0))
+                 for u in component for v in graph[u] if v in members]
+    dist = {v: 0 for v in component}
+    for _ in range(len(component) + 1):
+        changed = False
+        for u, v, w in edges:   # edges of u in program order: inside an iteration, in order
+            if dist[u] + w > dist[v]:
+                dist[v]  = dist[u] + w
+                changed  = True
+        if not changed:
+            break
+    tight = {v: [] for v in component}
+    for u, v, w in edges:
+        if dist[u] + w == dist[v]:
+            tight[u].append(v)
+
+    state = {v: 0 for v in component}   # 0: not visited, 1: on current path, 2: done
+    for root in component:
+        if state[root]:
+            continue
+        path, work = [], [(root, 0)]
+        while work:
+            v, i = work.pop()
+            if i == 0:
+                state[v] = 1
+                path.append(v)
+            if i < len(tight[v]):
+                work.append((v, i+1))
+                w = tight[v][i]
+                if state[w] == 1:   # cycle: from w to v, back to w
+                    cycle = path[path.index(w):]
+                    low   = cycle.index(min(cycle))
+                    cycle = cycle[low:] + cycle[:low]
+                    return cycle + [cycle[0]]
+                if state[w] == 0:
+                    work.append((w, 0))
+            else:
+                state[v] = 2
+                path.pop()
+    return []
+
+def get_cyclic_paths(component: list, graph: list, latencies: list) -> tuple:
+    # (critical cycle, paths to draw: the critical cycle and some more cycles)
+    critical = get_critical_cycle(component, graph, latencies)
+    return critical, [critical] + [path for path in get_elementary_cycles(component, graph)
+                                   if path != critical][:MAX_CYCLES]
+
+def get_path_latency(path: list, instrs: list) -> tuple:
+    # (latency, iterations) of a cyclic path
+    latency = sum( instrs[i].latency for i in path[:-1] )
+    iters   = sum( a >= b            for a,b in zip(path[:-1], path[1:]) )
+    return (latency, iters)
+
+class DependenceModel:
+
+    def __init__(self, program) -> None:
+        # program: already loaded (load_instruction_list); its dependence info is updated in place
+        self.program   = program
+        self.uids      = list(range(program.n))   # stable ID of the instruction at each position
+        self.next_uid  = program.n
+        self.var_idx   = {var: i for i, var in enumerate(program.variables)}
+        self.const_idx = {const: i for i, const in enumerate(program.constants)}
+        self.var_uses  = {}   # register -> number of operands naming it
+        self.const_uses= {}   # constant -> number of instructions using it
+        self.writers   = {}   # register -> positions of the instructions writing it, in order
+        self.readers   = {}   # register -> positions of the instructions reading it
+        self.edited    = set()   # uids of instructions replaced since the last update
+        self.touched   = set()   # registers whose readers or writers changed
+        for pos, instr in enumerate(program.instruction_list):
+            self.add_uses(pos, instr)
+
+        self.recomputed= 0       # components listed again by the last update
+        self.reused    = 0       # components taken from the cache by the last update
+
+        # cache: edges of a component (uid pairs) -> [listed cycles, critical cycle (uid paths),
+        #   (latency, iters) of the cycles to draw], seeded with the critical cycles of the program
+        self.components = {}
+        graph = get_dependence_graph(program.inst_dependence_list)
+        for component in program.recurrences:
+            critical = [path for path in program.cyclic_paths if path[0] in component][0]
+            self.components[self.get_edges(component, graph)] = \
+                [self.get_uid_paths(get_elementary_cycles(component, graph)), self.get_uid_paths([critical])[0], None]
+
+    def get_uid_paths(self, paths: list) -> list:
+        return [[self.uids[i] for i in path] for path in paths]
+
+    def get_edges(self, component: list, graph: list) -> frozenset:
+        members = set(component)
+        return frozenset((self.uids[p], self.uids[c]) for p in component for c in graph[p] if c in members)
+
+    def add_uses(self, pos: int, instr) -> None:
+        program = self.program
+        for var in (instr.destin, instr.source1, instr.source2, instr.source3):
+            if var:
+                if var not in self.var_idx:
+                    self.var_idx[var] = len(program.variables)
+                    program.variables.append(var)
+                self.var_uses[var] = self.var_uses.get(var, 0) + 1
+        if instr.constant:
+            if instr.constant not in self.const_idx:
+                self.const_idx[instr.constant] = len(program.constants)
+                program.constants.append(instr.constant)
+            self.const_uses[instr.constant] = self.const_uses.get(instr.constant, 0) + 1
+        if instr.destin:
+            writers = self.writers.setdefault(instr.destin, [])
+            writers.insert(bisect_left(writers, pos), pos)
+            self.touched.add(instr.destin)
+        for var in (instr.source1, instr.source2, instr.source3):
+            if var:
+                self.readers.setdefault(var, set()).add(pos)
+                self.touched.add(var)
+
+    def remove_uses(self, pos: int, instr) -> None:
+        # call before the dependence list of instr is removed or solved again
+        program = self.program
+        if instr.destin:
+            self.writers[instr.destin].remove(pos)
+            self.touched.add(instr.destin)
+        for var in (instr.source1, instr.source2, instr.source3):
+            if var:
+                self.readers[var].discard(pos)
+                self.touched.add(var)
+        for var in (instr.destin, instr.source1, instr.source2, instr.source3):
+            if var:
+                self.var_uses[var] -= 1
+                if not self.var_uses[var]:   # name no longer used: renumber the following ones
+                    idx = self.var_idx.pop(var)
+                    program.variables.pop(idx)
+                    self.renumber(idx, constants=False)
+        if instr.constant:
+            self.const_uses[instr.constant] -= 1
+            if not self.const_uses[instr.constant]:
+                idx = self.const_idx.pop(instr.constant)
+                program.constants.pop(idx)
+                self.renumber(idx, constants=True)
+
+    def renumber(self, removed: int, constants: bool) -> None:
+        # variables (or constants) after the removed one move one place back
+        names = self.const_idx if constants else self.var_idx
+        for name, idx in names.items():
+            if idx > removed:
+                names[name] = idx - 1
+        for dep_list in self.program.inst_dependence_list:
+            for dep in dep_list:
+                if (dep[0] == -1) == constants and dep[1] > removed:
+                    dep[1] -= 1
+
+    def shift(self, pos: int, delta: int) -> None:
+        # instructions at positions >= pos move delta places
+        for writers in self.writers.values():
+            for k in range(bisect_left(writers, pos), len(writers)):
+                writers[k] += delta
+        for var, readers in self.readers.items():
+            self.readers[var] = {r + delta if r >= pos else r for r in readers}
+        for dep_list in self.program.inst_dependence_list:
+            for dep in dep_list:
+                if dep[0] >= pos:
+                    dep[0] += delta
+
+    def solve(self, pos: int) -> list:
+        # dependence list of the instruction at pos (as Program.load_instruction_list)
+        instr    = self.program.instruction_list[pos]
+        dep_list = []
+        if instr.constant:
+            dep_list.append([-1, self.const_idx[instr.constant]])
+        for var in (instr.source1, instr.source2, instr.source3):
+            if var:
+                writers = self.writers.get(var)
+                if not writers:         # read-only variable
+                    prod_idx = -3
+                else:                   # last writer before pos or, if none, last one (loop-carried)
+                    k = bisect_left(writers, pos)
+                    prod_idx = writers[k-1] if k else writers[-1]
+                dep_list.append([prod_idx, self.var_idx[var]])
+        return dep_list
+
+    def get_offsets(self, pos: int) -> list:
+        # dependence offsets of the instruction at pos (as Program.generate_dependence_info)
+        n = self.program.n
+        return [pos - dep[0] if dep[0] < pos else pos - dep[0] + n
+                for dep in self.program.inst_dependence_list[pos] if dep[0] >= 0]
+
+    def check_index(self, pos: int, last: int) -> None:
+        if not 0 <= pos <= last:
+            raise IndexError(f"instruction index {pos} out of range (0..{last})")
+
+    def insert(self, pos: int, instr) -> None:
+        program = self.program
+        self.check_index(pos, program.n)
+        self.shift(pos, 1)
+        program.instruction_list.insert(pos, instr)
+        program.inst_dependence_list.insert(pos, [])
+        program.n += 1
+        self.uids.insert(pos, self.next_uid)
+        self.next_uid += 1
+        self.add_uses(pos, instr)
+
+        for reader in {pos} | self.readers.get(instr.destin, set()):
+            program.inst_dependence_list[reader] = self.solve(reader)
+        program.dependence_edges = [self.get_offsets(i) for i in range(program.n)]   # n changed
+
+    def delete(self, pos: int) -> None:
+        program = self.program
+        self.check_index(pos, program.n - 1)
+        instr = program.instruction_list[pos]
+        self.remove_uses(pos, instr)
+        program.inst_dependence_list[pos] = []   # remaining ones may refer to pos: solved below
+        del program.instruction_list[pos]
+        del program.inst_dependence_list[pos]
+        del self.uids[pos]
+        program.n -= 1
+        self.shift(pos + 1, -1)
+
+        for reader in self.readers.get(instr.destin, set()):
+            program.inst_dependence_list[reader] = self.solve(reader)
+        program.dependence_edges = [self.get_offsets(i) for i in range(program.n)]   # n changed
+
+    def replace(self, pos: int, instr) -> None:
+        program = self.program
+        self.check_index(pos, program.n - 1)
+        old = program.instruction_list[pos]
+        self.remove_uses(pos, old)
+        program.inst_dependence_list[pos] = []
+        program.instruction_list[pos] = instr
+        self.add_uses(pos, instr)
+        self.edited.add(self.uids[pos])   # same uid: its latency may have changed
+
+        readers = {pos} | self.readers.get(old.destin, set()) | self.readers.get(instr.destin, set())
+        for reader in readers:
+            program.inst_dependence_list[reader] = self.solve(reader)
+        for reader in readers:
+            program.dependence_edges[reader] = self.get_offsets(reader)
+
+    def update(self) -> None:
+        # after some edits: lists of names, recurrences and critical latencies
+        program = self.program
+        for var in self.touched:
+            read_only = bool(self.readers.get(var)) and not self.writers.get(var)
+            if read_only and var not in program.read_only:
+                program.read_only.append(var)
+            elif not read_only and var in program.read_only:
+                program.read_only.remove(var)
+        self.touched = set()
+
+        program.loop_carried = list(dict.fromkeys(
+            (dep[0], program.variables[dep[1]])
+            for inst_id, dep_list in enumerate(program.inst_dependence_list)
+            for dep in dep_list if dep[0] >= inst_id))
+        program.find_arrays()
+
+        graph     = get_dependence_graph(program.inst_dependence_list)
+        latencies = [instr.latency for instr in program.instruction_list]
+        positions = {uid: pos for pos, uid in enumerate(self.uids)}
+        components, cyclic_paths = {}, []
+        self.recomputed, self.reused = 0, 0
+        program.recurrences = get_components(graph)
+        for component in program.recurrences:
+            edges = self.get_edges(component, graph)
+            entry = self.components.get(edges)
+            if entry is None:
+                entry = [self.get_uid_paths(get_elementary_cycles(component, graph)), None, None]
+                self.recomputed += 1
+            else:
+                self.reused += 1
+                if self.edited.intersection(self.uids[i] for i in component):
+                    entry[1] = None   # latencies may have changed
+            if entry[1] is None:
+                entry[1] = self.get_uid_paths([get_critical_cycle(component, graph, latencies)])[0]
+                entry[2] = None
+            critical = [positions[uid] for uid in entry[1]]
+            cycles   = [critical] + [path for path in ([positions[uid] for uid in path] for path in entry[0])
+                                     if path != critical][:MAX_CYCLES]
+            if entry[2] is None:
+                entry[2] = [get_path_latency(path, program.instruction_list) for path in cycles]
+            components[edges] = entry
+            cyclic_paths += cycles
+        self.components = components
+        self.edited     = set()
+
+        program.cyclic_paths = cyclic_paths
+        program.inst_cyclic  = [i for component in program.recurrences for i in component]
+
+    def get_critical_latencies(self) -> tuple:
+        # as Program.get_critical_latencies, from the latencies cached per component
+        #   (the critical cycle of each component is one of them)
+        path_latencies = [latency for entry in self.components.values() for latency in entry[2]]
+        max_latency    = max([latency / iters for latency, iters in path_latencies] + [0])
+        min_iters      = max([iters for _, iters in path_latencies] + [0])
+        return (max_latency, min_iters, path_latencies)
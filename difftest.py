@@ -0,0 +1,264 @@
+import argparse
+import importlib
+import importlib.util
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tarfile
+import tempfile
+from multiprocessing import Pool
+
+# Differential testing of simulation engines against a reference engine.
+# An engine is any object with the Scheduler interface:
+#     get_timeline(processJSON, niters) -> str   and   get_results(processJSON, niters) -> str
+# (engines that only reproduce part of the results, e.g. batch.BatchScheduler, may omit
+# get_timeline and list the keys of get_results they reproduce in result_keys)
+# Engines are given by a spec string:
+#     ""             : the Scheduler of this package (default candidate)
+#     path/to/rvcat  : the package in that directory, e.g. a git worktree of a frozen commit
+#     git:revision   : this package at a git revision (exported to a temporary directory)
+#     module:name    : object module.name (a class is instantiated)
+# The reference must be given explicitly: the package compared with itself never diverges.
+# Timelines hold the state of every instruction in every cycle, so comparing them cycle by
+# cycle (state strings, ports, critical-path marks, addresses) locates the first diverging
+# cycle and instruction; results of get_results are then compared key by key.
+#
+#   python -m rvcat.difftest --reference git:v1.0 --candidate mymodule:FastScheduler --cases 500 --jobs 8
+
+REFERENCE_EXCEPTION = "reference exception"   # field of cases not compared (not divergences)
+
+PORTS   = 4
+ARRAYS  = ["A", "B", "C"]
+REGS    = ["x1", "x2", "x3", "x4", "x5", "x6"]
+
+def random_kernel(rng) -> dict:
+    # random Process JSON covering dependence patterns (intra-iteration, loop-carried,
+    # read-only), port masks, memory strides and cache/window configurations
+    instrs = []
+    for i in range(rng.randint(2, 8)):
+        ports = rng.randint(1, 2**PORTS - 1)
+        lat   = rng.choice([1, 1, 2, 3, 4, 6])
+        if rng.random() < 0.35:
+            oper    = rng.choice(["LOAD", "STORE"])
+            vector  = rng.random() < 0.2   # reverse vector accesses fall below address 0: not supported
+            stride  = rng.choice([0, 1, 1, 2, 4, 8] if vector else [-1, 0, 1, 1, 2, 4, 8])
+            const   = rng.choice(["", "1"]) if stride < 0 else rng.choice(["", "1", "2", "4"])
+            instr = {"type": "VMEM" if vector else "MEM", "oper": oper,
+                     "size": rng.choice(["word", "long", "byte"]),
+                     "destin":  rng.choice(REGS) if oper == "LOAD" else "",
+                     "source1": rng.choice(REGS), "source2": rng.choice(ARRAYS),
+                     "constant": const, "stride": stride, "lanes": 4 if vector else 1}
+        elif rng.random() < 0.1:
+            instr = {"type": "BRANCH", "oper": "BNE", "source1": rng.choice(REGS),
+                     "source2": rng.choice(REGS), "stride": rng.choice([1, 1, 2])}
+        else:
+            instr = {"type": rng.choice(["INT", "FLOAT"]), "oper": "ADD",
+                     "destin": rng.choice(REGS), "source1": rng.choice(REGS),
+                     "source2": rng.choice(REGS + [""]),
+                     "constant": rng.choice(["", "", "4"])}
+        instr["text"]    = f"i{i}"
+        instr["latency"] = lat
+        instr["ports"]   = ports
+        instrs.append(instr)
+
+    issue_time = rng.randint(1, 8)   # miss penalty must exceed the issue time (zero latency stalls)
+    return {"name":       "random",
+            "dispatch":   rng.randint(1, 4),
+            "retire":     rng.randint(1, 4),
+            "ROBsize":    rng.randint(2, 16),
+            "mPenalty":   rng.randint(issue_time+1, 30),
+            "mIssueTime": issue_time,
+            "sched":      rng.choice(["greedy", "optimal"]),
+            "blkSize":    rng.choice([4, 8, 16, 32, 64]),
+            "nBlocks":    rng.choice([0, 1, 2, 4, 8, 32]),
+            "instruction_list": instrs}
+
+def export_revision(spec: str) -> str:
+    # git:revision spec -> directory with the files of this package at that revision
+    package = os.path.dirname(os.path.abspath(__file__))
+    revision = spec[len("git:"):]
+    prefix  = subprocess.run(["git", "rev-parse", "--show-prefix"], cwd=package, check=True,
+                             capture_output=True, text=True).stdout.strip()
+    archive = subprocess.run(["git", "archive", "--format=tar", f"{revision}:{prefix}"], cwd=package,
+                             check=True, capture_output=True).stdout
+    directory = tempfile.mkdtemp(prefix="rvcat_reference_")
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(directory)
+    return directory
+
+def load_engine(spec: str):
+    if spec == "":
+        from .scheduler import Scheduler
+        return Scheduler()
+
+    if os.path.isdir(spec):   # a copy of the rvcat package
+        name = "rvcat_engine_" + str(abs(hash(os.path.abspath(spec))))
+        if name not in sys.modules:
+            module_spec = importlib.util.spec_from_file_location(name, os.path.join(spec, "__init__.py"),
+                                                                 submodule_search_locations=[spec])
+            module = importlib.util.module_from_spec(module_spec)
+            sys.modules[name] = module
+            module_spec.loader.exec_module(module)
+        return sys.modules[name]._scheduler
+
+    module_name, _, attr = spec.partition(":")
+    engine = getattr(importlib.import_module(module_name), attr)
+    return engine() if isinstance(engine, type) else engine
+
+def first_divergence(expected: dict, actual: dict):
+    # compare two get_timeline outputs; returns None or description of first diverging cycle
+    first = None
+
+    def report(cycle, instr, field, exp, act):
+        nonlocal first
+        if first is None or cycle < first["cycle"]:
+            first = {"cycle": cycle, "iteration": instr[0], "instruction": instr[1],
+                     "field": field, "expected": exp, "actual": act}
+
+    exp_instrs = expected["instructions"]
+    act_instrs = actual.get("instructions", [])
+    for i, exp in enumerate(exp_instrs):
+        if i >= len(act_instrs):
+            report(exp[2], exp, "missing instruction", exp, None)
+            break
+        act = act_instrs[i]
+        if exp[2] != act[2]:
+            report(min(exp[2], act[2]), exp, "dispatch cycle", exp[2], act[2])
+            continue
+        stages_e, stages_a = exp[4], act[4]
+        for c in range(max(len(stages_e), len(stages_a))):
+            if c >= len(stages_e) or c >= len(stages_a) or stages_e[c] != stages_a[c]:
+                report(exp[2]+c, exp, "state", stages_e[c:c+1], stages_a[c:c+1])
+                break
+        if exp[3] != act[3]:
+            report(exp[2], exp, "port", exp[3], act[3])
+        if exp[5] != act[5]:
+            diff = [c for c in exp[5] if c not in act[5]] + [c for c in act[5] if c not in exp[5]]
+            report(exp[2]+min(diff), exp, "critical path", exp[5], act[5])
+        if exp[6] != act[6]:
+            report(exp[2], exp, "address", exp[6], act[6])
+
+    if first is None and len(act_instrs) > len(exp_instrs):
+        act = act_instrs[len(exp_instrs)]
+        report(act[2], act, "extra instruction", None, act)
+    if first is None and expected["cycles"] != actual.get("cycles"):
+        report(min(expected["cycles"], actual.get("cycles", 0)), [-1, -1], "total cycles",
+               expected["cycles"], actual.get("cycles"))
+    return first
+
+def compare_results(expected: dict, actual: dict):
+    # compare get_results outputs on the keys of the reference (other keys are extensions)
+    for key, value in expected.items():
+        if key == "profile":
+            continue
+        if actual.get(key) != value:
+            return {"field": key, "expected": value, "actual": actual.get(key)}
+    return None
+
+def compare_engines(reference, candidate, processJSON, niters: int):
+    # engines without get_timeline are compared on results only; an engine with a
+    #   result_keys attribute is compared on those keys of get_results only.
+    #   A case that the reference can not run is reported as a "reference exception"
+    try:
+        exp = json.loads(reference.get_timeline(processJSON, niters))
+    except Exception as error:
+        return {"field": REFERENCE_EXCEPTION, "expected": repr(error), "actual": None}
+    if hasattr(candidate, "get_timeline"):
+        try:
+            act = json.loads(candidate.get_timeline(processJSON, niters))
+        except Exception as error:
+            return {"field": "exception", "expected": None, "actual": repr(error)}
+
+        divergence = first_divergence(exp, act)
+        if divergence:
+            return divergence
+
+    try:
+        exp = json.loads(reference.get_results(processJSON, niters))
+    except Exception as error:
+        return {"field": REFERENCE_EXCEPTION, "expected": repr(error), "actual": None}
+    try:
+        act = json.loads(candidate.get_results(processJSON, niters))
+    except Exception as error:
+        return {"field": "exception", "expected": None, "actual": repr(error)}
+    if hasattr(candidate, "result_keys"):
+        exp = {key: exp[key] for key in candidate.result_keys if key in exp}
+    return compare_results(exp, act)
+
+engines = None   # (reference, candidate) loaded once per worker process
+
+def init_worker(reference_spec: str, candidate_spec: str) -> None:
+    global engines
+    engines = (load_engine(reference_spec), load_engine(candidate_spec))
+
+def run_case(seed: int):
+    rng         = random.Random(seed)
+    processJSON = random_kernel(rng)
+    niters      = rng.randint(1, 12)
+    divergence  = compare_engines(engines[0], engines[1], processJSON, niters)
+    if divergence is None:
+        return None
+    return dict(divergence, seed=seed, niters=niters, process=processJSON)
+
+def run(reference_spec: str, candidate_spec: str = "", cases: int = 100, first_seed: int = 0,
+        jobs: int = 0, progress = None) -> list:
+    # returns list of divergences (one per failing seed), sorted by seed, including the cases
+    #   the reference could not run (field REFERENCE_EXCEPTION, not counted as diverging)
+    if not reference_spec:
+        raise ValueError("a reference engine is required (package directory, git:revision or module:name)")
+    if reference_spec.startswith("git:"):
+        reference_spec = export_revision(reference_spec)
+    seeds = range(first_seed, first_seed + cases)
+    failures = []
+    diverging = 0
+    if jobs == 1:
+        init_worker(reference_spec, candidate_spec)
+        results = map(run_case, seeds)
+    else:
+        pool = Pool(jobs or None, initializer=init_worker, initargs=(reference_spec, candidate_spec))
+        results = pool.imap_unordered(run_case, seeds, chunksize=4)
+
+    for done, result in enumerate(results, 1):
+        if result is not None:
+            failures.append(result)
+            diverging += result["field"] != REFERENCE_EXCEPTION
+        if progress:
+            progress(done, cases, diverging)
+
+    if jobs != 1:
+        pool.close()
+        pool.join()
+    return sorted(failures, key=lambda f: f["seed"])
+
+def main(argv = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m rvcat.difftest",
+                                     description="compare a simulation engine against a reference, cycle by cycle")
+    parser.add_argument("--reference", required=True,
+                        help="reference engine spec: package directory, git:revision or module:name")
+    parser.add_argument("--candidate", default="", help="engine under test: package directory or module:name")
+    parser.add_argument("--cases",     type=int, default=100, help="number of random kernels")
+    parser.add_argument("--seed",      type=int, default=0,   help="first random seed")
+    parser.add_argument("--jobs",      type=int, default=0,   help="worker processes (default: all CPUs)")
+    args = parser.parse_args(argv)
+
+    def progress(done, total, failed):
+        if done % max(1, total // 100) and done != total:
+            return
+        print(f"\r{done}/{total} cases, {failed} diverging", end="", file=sys.stderr)
+
+    failures = run(args.reference, args.candidate, args.cases, args.seed, args.jobs, progress)
+    skipped  = [failure for failure in failures if failure["field"] == REFERENCE_EXCEPTION]
+    failures = [failure for failure in failures if failure["field"] != REFERENCE_EXCEPTION]
+    print(file=sys.stderr)
+    if skipped:
+        print(f"{len(skipped)} cases not compared (reference exception), first seed {skipped[0]['seed']}: "
+              f"{skipped[0]['expected']}", file=sys.stderr)
+    for failure in failures[:10]:
+        print(json.dumps(failure))
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
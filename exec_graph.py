@@ -1,10 +1,13 @@
 from math import inf
 
+dfs_nodes = None   # nodes explored by old_priority while a Profiler is active (None: not counted)
+
 def old_priority(isps):
       _ais    = [inf]               # assigned instructions
       _aps    = [-1]                # assigned ports
       nis     = len(isps)           # number of instructions
       isps_is = sorted(isps.keys()) # instructions indexes
+      nodes   = 0
 
       def dfs(n=0, ais=[], aps=[]):
           if n == nis:
@@ -24,16 +27,29 @@ def old_priority(isps):
           if not assigned:
                 dfs(n+1, ais, aps)
 
+      global dfs_nodes
+      if dfs_nodes is not None:   # profiling: recursive calls go through a counting wrapper
+          search = dfs
+          def dfs(n=0, ais=[], aps=[]):
+              nonlocal nodes
+              nodes += 1
+              search(n, ais, aps)
+
       dfs()
+
+      if dfs_nodes is not None:
+          dfs_nodes += nodes
       return dict(zip(_ais, _aps))
 
 def generate_execution_graph (static_instructions, N, window_size, DepEdges):
+   return extend_execution_graph ([], static_instructions, N, window_size, DepEdges)
 
-   ExecGraph = []
+# Append nodes of dynamic instructions len(ExecGraph)//3 .. N-1 (used to extend a resumed simulation)
+def extend_execution_graph (ExecGraph, static_instructions, N, window_size, DepEdges):
         
    # First Node contains a fake arch on dispatch node and retire node, 
    # that will be removed after inserting values
-   for i in range(0,N):  # each dynamic instruction executed, except first one
+   for i in range(len(ExecGraph)//3, N):  # each dynamic instruction executed, except first one
 
       # Insert node corresponding to dispatch stage of current instruction
       DispatchEdges = [ [(i-1)*3 , 0] ]   # Dispatch node depends on dispatch of previous instruction
@@ -64,19 +80,29 @@ def get_iteration_idx( n, index ):
 
 def longest_path (ExecGraph):
       N = len(ExecGraph)
-      dist = [-10**9 for i in range(N)]  # initialize distances to all vertices as infinite
-      path = [  []   for i in range(N)]  # initialize longest path to all vertices as EMPTY
+      dist   = [-10**9 for i in range(N)]  # initialize distances to all vertices as infinite
+      parent = [None for i in range(N)]    # (vertex, edge) preceding each vertex on its longest path
 
       dist[N-1] = 0
-      path[N-1] = [[N-1, 1]]
       for u in range(N-1,0,-1):
           for node in ExecGraph[u]:
               if dist[node[0]] < dist[u] + node[1]:
-                    dist[node[0]] = dist[u] + node[1]
-                    new_path      = path[u] + [node]
-                    path[node[0]] = new_path
-
-      return path[0]
+                    dist[node[0]]   = dist[u] + node[1]
+                    parent[node[0]] = (u, node)
+
+      if N > 1 and parent[0] is None:   # first vertex not reachable: empty path
+          return []
+
+      # follow parents from first vertex back to the last one: path from last vertex to first one
+      path = []
+      v    = 0
+      while v != N-1:
+          u, node = parent[v]
+          path.append(node)
+          v = u
+      path.append([N-1, 1])
+      path.reverse()
+      return path
 
 def critical_path_statistics_json (N, instr_list, path):
     total_lat = 0
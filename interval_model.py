@@ -0,0 +1,154 @@
+import json
+import os
+from . import cache_model as cm
+from . import dependences as dp
+
+# Interval-style (mechanistic) performance model: a preview engine between the instant
+# bounds of Program.get_performance_analysis and the cycle simulation of Scheduler.get_results.
+# Base cycles per iteration are the maximum of the steady-state limits imposed by
+#   dispatch/retire width, port pressure, recurrences (loop-carried dependence cycles) and
+#   the instruction window (ROB entries held while one iteration is in flight, Little's law).
+# Each expected cache miss (cache_model) then adds the part of mPenalty that the ROB cannot
+# hide: the window covers ROBsize/n iterations ahead of a blocked load, and misses falling
+# in the same window overlap. Main-memory bandwidth (mIssueTime cycles per block read or
+# written back) is a separate limit.
+
+# Correction factors. WINDOW_FACTOR is fitted with calibrate() (default configs, 100
+# iterations: mean absolute error 7.6% on the reference suite); STALL_FACTOR and FILL_FACTOR
+# are uncalibrated defaults: the error hardly changes around 1.0 (7.2% at best), too little
+# to fit them on the few kernels of the suite.
+WINDOW_FACTOR = 0.8   # scales the ROB-occupancy limit
+STALL_FACTOR  = 1.0   # scales the exposed miss latency
+FILL_FACTOR   = 1.0   # scales the pipeline fill time (latency of the first iteration)
+
+KERNELS_DIR = os.path.join(os.path.dirname(__file__), "kernels")
+
+def get_iteration_depth(program, latencies):
+    # longest dependence chain inside one loop iteration (loop-carried dependences excluded)
+    depth = [0] * program.n
+    for inst_id in range(program.n):
+        start = 0
+        for dep in program.inst_dependence_list[inst_id]:
+            if 0 <= dep[0] < inst_id:
+                start = max(start, depth[dep[0]])
+        depth[inst_id] = start + latencies[inst_id]
+    return max(depth, default=0)
+
+def get_recurrence_cycles(program, latencies):
+    # same as Program.get_critical_latencies, but with latencies including expected misses
+    max_latency = 0
+    graph = dp.get_dependence_graph(program.inst_dependence_list)
+    for component in program.recurrences:
+        latency, iters = dp.get_cycle_ratio(component, graph, latencies)
+        max_latency = max(max_latency, latency / iters)
+    return max_latency
+
+def estimate_performance(program, process, niters):
+    # program must be loaded with process.instruction_list and its memory addresses assigned
+
+    n = program.n
+    latencies = [instr.latency for instr in program.instruction_list]
+    misses    = [0] * n
+    traffic   = 0
+
+    if process.nBlocks > 0 and niters > 0:
+        misses, write_backs = cm.get_instruction_misses(program.instruction_list, niters,
+                                                        process.nBlocks, process.blkSize)
+        traffic = sum(misses) + write_backs
+
+    depth = get_iteration_depth(program, latencies)
+
+    # misses of instructions in recurrences cannot be hidden: they lengthen the recurrence
+    rec_latencies = latencies[:]
+    for inst_id in program.inst_cyclic:
+        rec_latencies[inst_id] += process.mPenalty * misses[inst_id] / niters
+
+    bounds = {
+        "dispatch": n / process.dispatch,
+        "retire":   n / process.retire,
+        "ports":    program.get_port_cycles(),
+        "latency":  get_recurrence_cycles(program, rec_latencies),
+        "window":   WINDOW_FACTOR * n * (depth + 2) / process.ROBsize
+    }
+    base  = max(bounds, key=bounds.get)
+    cycles_per_iter = bounds[base]
+
+    # latency of misses not hidden by the instructions that fit in the window
+    lookahead = process.ROBsize / n * cycles_per_iter if n else 0
+    overlap   = max(1, sum(misses) / niters * process.ROBsize / n) if n and niters else 1
+    stall     = 0
+    for inst_id in range(n):
+        if misses[inst_id] and inst_id not in program.inst_cyclic:
+            exposed = max(0, latencies[inst_id] + process.mPenalty - lookahead)
+            stall  += misses[inst_id] / niters * exposed
+    stall = STALL_FACTOR * stall / overlap
+
+    bounds["miss_stall"] = stall
+    bounds["memory"]     = traffic * process.mIssueTime / niters if niters else 0
+
+    if bounds["memory"] > cycles_per_iter + stall or stall > cycles_per_iter:
+        category = "MEMORY"
+    elif base == "latency":
+        category = "LATENCY"
+    elif base == "window":
+        category = "WINDOW"
+    else:
+        category = "THROUGHPUT"
+
+    cycles_per_iter = max(cycles_per_iter + stall, bounds["memory"])
+    fill_cycles     = FILL_FACTOR * (depth + 2 + (process.mPenalty if traffic else 0))
+    total_cycles    = cycles_per_iter * max(0, niters - 1) + fill_cycles
+
+    out = {}
+    out["total_iterations"]     = niters
+    out["total_instructions"]   = n * niters
+    out["total_cycles"]         = total_cycles
+    out["ipc"]                  = n * niters / total_cycles if total_cycles else 0.0
+    out["cycles_per_iteration"] = total_cycles / niters if niters else 0.0
+    out["steady_cycles_per_iteration"] = cycles_per_iter
+    out["performance-bound"]    = category
+    out["bounds"]               = bounds
+    return out
+
+def load_reference_suite(path = KERNELS_DIR):
+    # returns list of Process JSON objects of the reference kernels
+    suite = []
+    for file_name in sorted(os.listdir(path)):
+        if file_name.endswith(".json"):
+            with open(os.path.join(path, file_name)) as f:
+                suite.append(json.load(f))
+    return suite
+
+def calibrate(suite = None, niters: int = 100, configs = None):
+    # Compare the preview against the simulator on the reference suite.
+    #  configs: list of dicts overriding Process fields, to cover several machines
+    #  returns per-run errors and the mean absolute relative error of cycles per iteration
+    from .program   import Process, _program
+    from .scheduler import _scheduler
+
+    if suite is None:
+        suite = load_reference_suite()
+    if configs is None:
+        configs = [{}, {"ROBsize": 8}, {"nBlocks": 0}, {"nBlocks": 4, "mPenalty": 40}]
+
+    runs = []
+    for kernel in suite:
+        for config in configs:
+            processJSON = dict(kernel, **config)
+            simulated = json.loads(_scheduler.get_results(processJSON, niters))
+
+            process = Process.from_json(processJSON)
+            _program.load_instruction_list(process.instruction_list)
+            _program.assign_memory_addresses(niters)
+            preview = estimate_performance(_program, process, niters)
+
+            error = preview["cycles_per_iteration"] - simulated["cycles_per_iteration"]
+            runs.append({"name":      kernel.get("name", ""),
+                         "config":    config,
+                         "simulated": simulated["cycles_per_iteration"],
+                         "preview":   preview["cycles_per_iteration"],
+                         "bound":     preview["performance-bound"],
+                         "relative_error": error / simulated["cycles_per_iteration"]})
+
+    mean_error = sum(abs(run["relative_error"]) for run in runs) / len(runs) if runs else 0.0
+    return {"runs": runs, "mean_abs_relative_error": mean_error}
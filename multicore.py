@@ -0,0 +1,208 @@
+from .program   import Process, _program
+from .cache     import Cache
+from .scheduler import Scheduler
+
+# Multi-core mode: C copies of the Scheduler pipeline run the same kernel in lockstep, each one
+# with a private cache, sharing the main memory model:
+#   - MemoryChannels: one or more channels (banks), interleaved by address; each channel accepts
+#     one request every mIssueTime cycles, as the single channel of Cache
+#   - SharedCache (optional): last-level cache shared by all cores, between the private caches
+#     and memory; a hit costs llc_latency cycles instead of the main memory penalty
+# Each core works on a private copy of the arrays (shared_data=False) or on the same arrays
+# (shared_data=True, no coherence is modelled). Cores without cache (nBlocks = 0) do not
+# access memory.
+
+class MemoryChannels:
+
+    def __init__(self, n_channels: int, issue_time: int, interleave: int) -> None:
+        self.n_channels  = n_channels
+        self.issue_time  = issue_time
+        self.interleave  = interleave     # bytes of consecutive addresses mapped to a channel
+        self.last_access = [-issue_time] * n_channels
+        self.reads       = [0] * n_channels
+        self.writes      = [0] * n_channels
+
+    def get_channel(self, address: int) -> int:
+        return (address // self.interleave) % self.n_channels
+
+    def read(self, address: int, current_cycle: int) -> int:
+        # returns latency until request is sent
+        ch = self.get_channel(address)
+        self.last_access[ch] = max(self.last_access[ch] + self.issue_time, current_cycle)
+        self.reads[ch] += 1
+        return self.last_access[ch] - current_cycle
+
+    def write(self, address: int, current_cycle: int) -> None:
+        ch = self.get_channel(address)
+        self.last_access[ch] = max(self.last_access[ch] + self.issue_time, current_cycle)
+        self.writes[ch] += 1
+
+    def json(self, cycles: int, blk_size: int) -> dict:
+        channels = []
+        for ch in range(self.n_channels):
+            requests = self.reads[ch] + self.writes[ch]
+            channels.append({"reads":       self.reads[ch],
+                             "writes":      self.writes[ch],
+                             "utilization": requests * self.issue_time / cycles})
+        requests = sum(self.reads) + sum(self.writes)
+        return {"channels":   channels,
+                "bandwidth":  requests * blk_size / cycles,   # bytes per cycle
+                "saturation": max(ch["utilization"] for ch in channels)}
+
+class SharedCache(Cache):
+    # shared last-level cache: tags and replacement state of Cache, misses go to the memory channels
+
+    def __init__(self, cache_sz, block_sz, memory: MemoryChannels, MissLatency, latency) -> None:
+        super().__init__(cache_sz, block_sz, MissLatency, memory.issue_time)
+        self.memory  = memory
+        self.latency = max(1, latency)   # a hit completes after at least one cycle
+        self.hits    = 0
+        self.misses  = 0
+
+    def allocate(self, block, current_cycle) -> int:
+        pos = self.get_victim()
+        if self.VALID[pos] == 1 and self.MODIFIED[pos] == 1:
+            self.memory.write(int(self.TAGS[pos]) * self.BLOCK_SIZE, current_cycle)
+        self.fill(pos, block)
+        self.MODIFIED[pos] = 0
+        return pos
+
+    def read(self, block, current_cycle) -> tuple:
+        # returns result and latency as Cache.next_level_read
+        pos = self.search(block)
+        if pos >= 0:
+            self.hits += 1
+            self.POLICY.touch(pos)
+            return 4, max(self.latency, self.DATA[pos] - current_cycle)
+        self.misses += 1
+        latency = self.memory.read(block * self.BLOCK_SIZE, current_cycle)
+        pos     = self.allocate(block, current_cycle)
+        self.DATA[pos] = current_cycle + latency + self.MEM_latency
+        return 1, latency
+
+    def write(self, block, current_cycle) -> None:
+        pos = self.search(block)
+        if pos < 0:
+            pos = self.allocate(block, current_cycle)
+            self.DATA[pos] = current_cycle
+        else:
+            self.POLICY.touch(pos)
+        self.MODIFIED[pos] = 1
+
+class PrivateCache(Cache):
+    # private cache of a core, whose misses go to the shared last-level cache or memory channels
+
+    def __init__(self, cache_sz, block_sz, MissLatency, memory: MemoryChannels, llc, **options) -> None:
+        super().__init__(cache_sz, block_sz, MissLatency, memory.issue_time, **options)
+        self.memory   = memory
+        self.llc      = llc
+        self.llc_hits = 0
+
+    def next_level_read(self, block, current_cycle):
+        if self.llc is None:
+            return 1, self.memory.read(block * self.BLOCK_SIZE, current_cycle)
+        result, latency = self.llc.read(block, current_cycle)
+        self.llc_hits += result == 4
+        return result, latency
+
+    def next_level_write(self, block, current_cycle):
+        if self.llc is None:
+            self.memory.write(block * self.BLOCK_SIZE, current_cycle)
+        else:
+            self.llc.write(block, current_cycle)
+
+class Core(Scheduler):
+
+    def __init__(self, core_id: int, memory: MemoryChannels, llc, offset: int) -> None:
+        super().__init__()
+        self.core_id = core_id
+        self.memory  = memory
+        self.llc     = llc
+        self.offset  = offset     # added to all addresses of this core
+        self.addrs   = []
+
+    def configure(self, processJSON, niters: int, layout_iters: int = 0) -> list:
+        ports = super().configure(processJSON, niters, layout_iters)
+        self.addrs = [instr.addr + self.offset for instr in _program.instruction_list]
+        if self.nBlocks > 0:
+            self.cache = PrivateCache(self.nBlocks, self.blkSize, self.mPenalty, self.memory, self.llc,
+                                      **self.cache_options)
+        return ports
+
+    def next_address(self, instr, static_idx: int) -> int:
+        # as Scheduler.next_address, with addresses private to this core
+        if instr.loops:
+            return super().next_address(instr, static_idx) + self.offset
+        addr = self.addrs[static_idx]
+        self.addrs[static_idx] = addr + instr.byte_stride
+        return addr
+
+def simulate_multicore(processJSON, niters: int = 3, cores: int = 2, channels: int = 1, interleave: int = 0,
+                       llc_blocks: int = 0, llc_latency: int = 10, shared_data: bool = False) -> dict:
+    # interleave: bytes per channel before moving to next one (default: cache block size)
+
+    process = Process.from_json(processJSON)
+    memory  = MemoryChannels(channels, process.mIssueTime, interleave or process.blkSize)
+    llc     = SharedCache(llc_blocks, process.blkSize, memory, process.mPenalty, llc_latency) if llc_blocks else None
+
+    # private data of each core starts at a block boundary after the data of the previous core
+    _program.load_instruction_list(process.instruction_list)
+    _program.assign_memory_addresses(niters)
+    footprint = max([addr + size for addr, _, size in _program.array_addrs] + [0])
+    footprint = -(-footprint // process.blkSize) * process.blkSize
+
+    procs   = [Core(c, memory, llc, 0 if shared_data else c*footprint) for c in range(cores)]
+    runs    = [core.simulation(processJSON, niters, step_cycles=1) for core in procs]
+    results = [None] * cores
+    active  = list(range(cores))
+    cycle   = 0
+    while active:
+        first = cycle % len(active)   # rotate priority of cores for memory accesses within a cycle
+        for c in active[first:] + active[:first]:
+            update = next(runs[c])
+            if update["done"]:
+                results[c] = update["results"]
+        active = [c for c in active if results[c] is None]
+        cycle += 1
+
+    total_cycles = max(out["total_cycles"] for out in results)
+    out = {}
+    out["cores"]        = cores
+    out["total_cycles"] = total_cycles
+    out["ipc"]          = sum(r["total_instructions"] for r in results) / total_cycles
+    out["iterations_per_cycle"] = cores * niters / total_cycles
+    out["per_core"]     = []
+    loads = [instr.oper == "LOAD" for instr in _program.instruction_list]
+    for core, r in zip(procs, results):
+        read_misses, write_misses = r["read_misses"], r["write_misses"]
+        if core.cache is not None:   # private cache misses, including those served by the LLC
+            misses       = [(loads[instr["id"]], instr["misses"]) for instr in r["memory"]["instructions"]]
+            read_misses  = sum(n for load, n in misses if load)
+            write_misses = sum(n for load, n in misses if not load)
+        out["per_core"].append({"core":                 core.core_id,
+                                "total_cycles":         r["total_cycles"],
+                                "ipc":                  r["ipc"],
+                                "cycles_per_iteration": r["cycles_per_iteration"],
+                                "read_misses":          read_misses,
+                                "write_misses":         write_misses,
+                                "llc_hits":             core.cache.llc_hits if core.cache is not None else 0,
+                                "MM_Reads":             r["MM_Reads"],
+                                "MM_Writes":            r["MM_Writes"]})
+    out["memory"] = memory.json(total_cycles, process.blkSize)
+    if llc is not None:
+        out["llc"] = {"hits": llc.hits, "misses": llc.misses}
+    return out
+
+def get_scaling(processJSON, niters: int = 3, core_counts = (1, 2, 4, 8, 16, 32, 64), **options) -> list:
+    # multicore scaling curve: speedup of total throughput relative to one core
+    curve = []
+    base  = None
+    for cores in core_counts:
+        out  = simulate_multicore(processJSON, niters, cores, **options)
+        base = base or out["iterations_per_cycle"] / cores
+        curve.append({"cores":      cores,
+                      "ipc":        out["ipc"],
+                      "speedup":    out["iterations_per_cycle"] / base,
+                      "efficiency": out["iterations_per_cycle"] / base / cores,
+                      "saturation": out["memory"]["saturation"]})
+    return curve
@@ -0,0 +1,104 @@
+import json
+import time
+from .       import exec_graph as ex
+from .cache  import Cache
+from .stalls import StallCounters
+
+# Opt-in instrumentation of the simulator hot paths.
+# While a Profiler is active, the instrumented functions are replaced by timing wrappers
+# (instance attributes for Scheduler methods, module/class attributes for the rest), and
+# restored afterwards: when profiling is off the simulator runs the original code.
+
+MAX_TRACE_EVENTS = 1000000   # limit of recorded calls for the Chrome trace export
+
+class Profiler:
+
+    def __init__(self, scheduler) -> None:
+        self.scheduler  = scheduler
+        self.phases     = {}    # phase name -> [calls, seconds]
+        self.events     = []    # (phase name, start time, end time) of each call
+        self.patched    = []
+        self.start_time = 0.0
+        self.elapsed    = 0.0
+        self.cycles     = 0
+        self.dfs_nodes  = 0
+        self.outer_dfs  = None
+
+    def __enter__(self):
+        sched = self.scheduler
+        self.patch(sched, "next_cycle",              "next_cycle")
+        self.patch(sched, "dispatch",                "dispatch")
+        self.patch(sched, "generate_timeline_state", "generate_timeline_state")
+        self.patch(ex,    "generate_execution_graph","generate_execution_graph")
+        self.patch(ex,    "exec_graph_update",       "exec_graph_update")
+        self.patch(ex,    "longest_path",            "longest_path")
+        self.patch(ex,    "old_priority",            "optimal_schedule_dfs")
+        self.patch(Cache, "access",                  "cache_access")
+        self.patch(StallCounters, "update",          "stall_counters")
+        self.outer_dfs  = ex.dfs_nodes   # count of an enclosing Profiler (None: not profiling)
+        ex.dfs_nodes    = 0              # counted only while profiling (see exec_graph.old_priority)
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.elapsed   = time.perf_counter() - self.start_time
+        self.dfs_nodes = ex.dfs_nodes
+        ex.dfs_nodes   = None if self.outer_dfs is None else self.outer_dfs + self.dfs_nodes
+        self.cycles    = self.scheduler.cycles
+        for owner, name, original in reversed(self.patched):
+            if original is None:   # was a method found through the class
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self.patched = []
+
+    def patch(self, owner, name: str, phase: str) -> None:
+        original = vars(owner).get(name)
+        setattr(owner, name, self.wrap(phase, getattr(owner, name)))
+        self.patched.append((owner, name, original))
+
+    def wrap(self, phase: str, func):
+        stats  = self.phases.setdefault(phase, [0, 0.0])
+        events = self.events
+        clock  = time.perf_counter
+
+        def wrapper(*args, **kwargs):
+            t0     = clock()
+            result = func(*args, **kwargs)
+            t1     = clock()
+            stats[0] += 1
+            stats[1] += t1 - t0
+            if len(events) < MAX_TRACE_EVENTS:
+                events.append((phase, t0, t1))
+            return result
+        return wrapper
+
+    def call(self, phase: str, func, *args):
+        # time a single call that is not instrumented (e.g., JSON serialisation)
+        return self.wrap(phase, func)(*args)
+
+    def json(self) -> dict:
+        out = {}
+        out["wall_time"] = self.elapsed
+        out["cycles"]    = self.cycles
+        out["cycles_per_second"]   = self.cycles / self.elapsed if self.elapsed else 0.0
+        out["dfs_nodes"]           = self.dfs_nodes
+        out["dfs_nodes_per_cycle"] = self.dfs_nodes / self.cycles if self.cycles else 0.0
+        out["phases"] = {}
+        for phase, (calls, seconds) in self.phases.items():
+            if calls:
+                out["phases"][phase] = {"calls":    calls,
+                                        "time":     seconds,
+                                        "per_call": seconds / calls,
+                                        "fraction": seconds / self.elapsed if self.elapsed else 0.0}
+        return out
+
+    def export_trace(self, file_name: str) -> None:
+        # write recorded calls in Chrome trace-event format (chrome://tracing, Perfetto)
+        trace = []
+        for phase, t0, t1 in self.events:
+            trace.append({"name": phase, "ph": "X", "pid": 0, "tid": 0,
+                          "ts":  (t0 - self.start_time) * 1e6,
+                          "dur": (t1 - t0) * 1e6})
+        with open(file_name, "w") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
@@ -1,4 +1,8 @@
 import json
+from .addresses import AddressStream
+from . import cache_model as cm
+from . import dependences as dp
+from . import interval_model as im
 
 global _program
 
@@ -16,10 +20,14 @@ class Instruction:
         self.constant = ""
         self.stride   = 1
         self.lanes    = 1
+        self.loops    = []   # nested loops: [trips, stride] per level, innermost first (see addresses)
         self.latency  = 0
+        self.occupancy= 1    # cycles the port is busy (reciprocal throughput): 1 if pipelined
         self.ports    = 0
         self.addr     = 0    # value initialized when program is loaded
         self.byte_stride = 4 # value initialized when program is loaded
+        self.data_size   = 4 # bytes per element, initialized when program is loaded
+        self.stream      = None # AddressStream, initialized when program is loaded
 
     def from_json(data: dict):
         instr = Instruction()
@@ -34,9 +42,11 @@ class Instruction:
         instr.constant   = data.get("constant", "")
         instr.lanes      = data.get("lanes", 1)
         instr.stride     = data.get("stride", 1)
+        instr.loops      = data.get("loops", [])
         instr.addr       = data.get("addr", 0)
         instr.byte_stride= data.get("byte_stride", 4)
         instr.latency    = data.get("latency", 0)
+        instr.occupancy  = data.get("occupancy", 1)
         instr.ports      = data.get("ports", 0)
         return instr
 
@@ -53,7 +63,9 @@ class Instruction:
             "constant": self.constant,
             "lanes":    self.lanes,
             "stride":   self.stride,
+            "loops":    self.loops,
             "latency":  self.latency,
+            "occupancy":self.occupancy,
             "ports":    self.ports
         }
     
@@ -64,12 +76,21 @@ class Process:
         self.dispatch = 1
         self.retire   = 1
         self.ROBsize  = 20 
+        self.LQsize   = 0      # load queue entries (0: limited by ROB only)
+        self.SQsize   = 0      # store queue entries (0: limited by ROB only)
         self.instruction_list = []
         self.mPenalty   = 1
         self.mIssueTime = 1
         self.sched      = "greedy"
         self.blkSize    = 16
         self.nBlocks    = 0
+        self.replacement   = "lru"          # cache replacement policy (see replacement.py)
+        self.writePolicy   = "write-back"   # or "write-through"
+        self.writeAllocate = True
+        self.writeBuffer   = 4              # write buffer entries (write-through, no-write-allocate)
+        self.seed          = 0              # random replacement
+        self.memDependences= False          # loads depend on older in-flight stores to the same address
+        self.forwardLatency= 1              # store-to-load forwarding latency (0: wait until store retires)
 
     def from_json(data: dict):
         process = Process()
@@ -77,26 +98,52 @@ class Process:
         process.dispatch         = data.get("dispatch", 1)
         process.retire           = data.get("retire", 1)
         process.ROBsize          = data.get("ROBsize", 20)
+        process.LQsize           = data.get("LQsize", 0)
+        process.SQsize           = data.get("SQsize", 0)
         process.instruction_list = data.get("instruction_list", [])
         process.mPenalty         = data.get("mPenalty", 1) 
         process.mIssueTime       = data.get("mIssueTime", 1)
         process.sched            = data.get("sched", "greedy")
         process.blkSize          = data.get("blkSize", 16)
         process.nBlocks          = data.get("nBlocks", 0)
+        process.replacement      = data.get("replacement", "lru")
+        process.writePolicy      = data.get("writePolicy", "write-back")
+        process.writeAllocate    = data.get("writeAllocate", True)
+        process.writeBuffer      = data.get("writeBuffer", 4)
+        process.seed             = data.get("seed", 0)
+        process.memDependences   = data.get("memDependences", False)
+        process.forwardLatency   = data.get("forwardLatency", 1)
         return process
 
+    def cache_options(self) -> dict:
+        # keyword arguments of Cache for replacement and write policies
+        return {"replacement":    self.replacement,
+                "write_policy":   self.writePolicy,
+                "write_allocate": self.writeAllocate,
+                "write_buffer":   self.writeBuffer,
+                "seed":           self.seed}
+
     def json(self) -> dict:
         return {
             "name":             self.name,
             "dispatch":         self.dispatch,
             "retire":           self.retire,
             "ROBsize":          self.ROBsize,
+            "LQsize":           self.LQsize,
+            "SQsize":           self.SQsize,
             "instruction_list": self.instruction_list,
             "mPenalty":         self.mPenalty,
             "mIssueTime":       self.mIssueTime,
             "sched":            self.sched,
             "blkSize":          self.blkSize,
-            "nBlocks":          self.nBlocks
+            "nBlocks":          self.nBlocks,
+            "replacement":      self.replacement,
+            "writePolicy":      self.writePolicy,
+            "writeAllocate":    self.writeAllocate,
+            "writeBuffer":      self.writeBuffer,
+            "seed":             self.seed,
+            "memDependences":   self.memDependences,
+            "forwardLatency":   self.forwardLatency
         }
 
 class Program:
@@ -117,7 +164,9 @@ class Program:
         self.inst_dependence_list = []  ## list of instruction data dependencies
         self.dependence_edges     = []  ## list of dependence offsets
         self.cyclic_paths         = []  # list of cyclic paths (a list of inst_ids)
+        self.recurrences          = []  # strongly connected components with cycles (lists of inst_ids)
         self.inst_cyclic          = []  # list of inst_ids in cyclic paths (only once)
+        self.editor               = None  # DependenceModel, created by the first edit
 
     def __getitem__(self, i: int):
         return self.instruction_list[i%self.n]
@@ -126,6 +175,7 @@ class Program:
     def load_instruction_list(self, instrs) -> None:
 
         self.instruction_list = []
+        self.editor           = None
         for instr_dict in instrs:
             self.instruction_list.append(Instruction.from_json(instr_dict))
         self.n            = len(self.instruction_list)
@@ -267,14 +317,19 @@ class Program:
         self.get_cyclic_paths()
 
         Insts = []
-        for cyc_path in self.cyclic_paths:
-          for iID in cyc_path:
+        for component in self.recurrences:   # every instruction of a component is in some cycle
+          for iID in component:
             Insts.append  (iID)
 
         self.inst_cyclic = list(set(Insts))  
         # list of inst_ids in cyclic paths (only once)
 
+        self.find_arrays()
+
+    def find_arrays(self) -> None:
+
         # get list of array variables in program order
+        self.loop_stride = 1 # by default, loop stride is 1
         Arrays = []
         for inst in self.instruction_list:
             if inst.type == "MEM" or inst.type == "VMEM":
@@ -293,6 +348,8 @@ class Program:
         # for use in memory trace generation
         # for simplicity, we assign addresses to all array names in program order, starting from 0
         # accesses to an array determin the arrays size
+        # instructions with loops (strides in elements) access a nested-loop stream
+        #   starting at the constant offset, or after it if some strides are negative
         
         iterations = N // self.loop_stride  # number of loop iterations to execute
 
@@ -306,8 +363,15 @@ class Program:
                     if (arrayName == inst.source2):
                         const = 0 if inst.constant == "" else int(inst.constant)
                         dataSize = 4 if inst.size == "word" else (8 if inst.size == "long" else 1)
+                        inst.data_size   = dataSize
                         inst.byte_stride = dataSize*inst.lanes*inst.stride
-                        if inst.stride < 0: # if stride is negative, then it is a reverse access starting from the end of the array
+                        if inst.loops:
+                           levels = [[trips, stride*dataSize] for trips, stride in inst.loops]
+                           inst.byte_stride = levels[0][1]
+                           low, high = AddressStream(0, levels).get_extent(N)
+                           inst.addr = init_addr + const*dataSize - low
+                           array_size = max(array_size, inst.addr+high+dataSize*inst.lanes-init_addr)
+                        elif inst.stride < 0: # if stride is negative, then it is a reverse access starting from the end of the array
                            inst.addr = init_addr + (N-const)*dataSize
                            last_addr = inst.addr + (iterations-1)*inst.byte_stride
                            array_size = max(array_size, inst.addr+dataSize*inst.lanes-init_addr)
@@ -319,6 +383,7 @@ class Program:
                            inst.addr = init_addr + const*dataSize
                            last_addr = inst.addr + inst.byte_stride
                            array_size = max(array_size, last_addr+dataSize*inst.lanes-init_addr)
+                        inst.stream = AddressStream(inst.addr, levels if inst.loops else [[0, inst.byte_stride]])
 
             self.array_addrs.append([init_addr, dataSize, array_size])
             init_addr += array_size  # assign next array to the next free address after current array
@@ -346,52 +411,22 @@ class Program:
 
     def get_cyclic_paths(self) -> None:
 
-        # return list of cyclic dependence paths: [[3, 3], [2, 0, 2]],
-        # numbers are instr-IDs: same ID appears at begin & end
-
-        start_instrs = []
-
-        for inst_id in range(self.n):
-            some_prev_dependence = False
-            for dep in self.inst_dependence_list[inst_id]:
-                if (dep[0] >= 0) and (dep[0] < inst_id):
-                    some_prev_dependence = True
-            if not some_prev_dependence:
-                start_instrs.append(inst_id)
-
-        # dependency graph in reverse order: from producer to consumer
-        dependency_graph = {i:[] for i in range(self.n)}
-        for inst_id in range(self.n):
-            for dep in self.inst_dependence_list[inst_id]:
-                if (dep[0] >= 0):
-                    dependency_graph[dep[0]].append(inst_id)
-
-        cyc_paths = []
-        paths     = [ [i]  for i in start_instrs]
-        visited   = { i:[] for i in range(self.n)}
-
-        while paths:
-            path = paths.pop()
-            last = path[-1]
-            for dep_id in dependency_graph[last]:
-                if dep_id not in visited[last]:
-                    paths.append(path+[dep_id])
-                    visited[last].append(dep_id)
-                else:
-                    if len(set(path)) != len(path):  # some inst_id appears twice
-                        path = path[path.index(last):]
-                        if path not in cyc_paths:
-                            cyc_paths.append(path)
+        # return list of cyclic dependence paths: [[3, 3], [0, 2, 0]],
+        # numbers are instr-IDs: same ID (the lowest one) appears at begin & end
+        # per strongly connected component of the dependence graph: the critical cycle (maximum
+        # latency per iteration) and a bounded number of other cycles (see dependences.py)
 
+        graph     = dp.get_dependence_graph(self.inst_dependence_list)
+        latencies = [instr.latency for instr in self.instruction_list]
+        self.recurrences  = dp.get_components(graph)
         self.cyclic_paths = []
-        for path in cyc_paths:
-            path = path[:-1]                 # remove last element (repeated as the first one)
-            min_val   = min(path)            # find minimum value
-            min_index = path.index(min_val)  # find position of minimum value
-            path = path[min_index:]+path[:min_index+1]
-            self.cyclic_paths.append(path)
+        for component in self.recurrences:
+            self.cyclic_paths += dp.get_cyclic_paths(component, graph, latencies)[1]
 
     def get_critical_latencies (self):
+        if self.editor is not None:   # edited program: latencies cached per component
+            return self.editor.get_critical_latencies()
+
         max_latency    = 0   # maximum latency per iteration
         min_iters      = 0   # minimum number of iterations for cyclic path
         path_latencies = []  # (latency,iters) of cyclic paths
@@ -408,6 +443,36 @@ class Program:
 
         return (max_latency, min_iters, path_latencies)
 
+    def get_port_cycles (self) -> float:
+        # minimum cycles per iteration imposed by port pressure: for every subset of ports,
+        # instructions that can only execute on ports of the subset share its issue bandwidth
+        # (each one keeps a port busy for its occupancy cycles)
+        from itertools import combinations
+
+        all_ports = 0
+        for instr in self.instruction_list:
+            all_ports |= instr.ports
+        used_ports = [i for i in range(32) if (all_ports >> i) & 1]
+
+        port_cycles = 0
+        for r in range(1, len(used_ports) + 1):
+            for subset in combinations(used_ports, r):
+                mask = 0
+                for p in subset:
+                    mask |= (1 << p)
+
+                uses = 0
+                for instr in self.instruction_list:
+                    instr_mask = instr.ports
+                    if (mask & instr_mask) == instr_mask:
+                        uses += instr.occupancy
+
+                cycles = uses / len(subset)
+                if cycles > port_cycles:
+                    port_cycles = cycles
+
+        return port_cycles
+
     def show_memory_trace(self) -> str:
         out = "............................. Memory Trace Description ..........................."
         out += "\n...............................................................................\n\n"
@@ -429,7 +494,8 @@ class Program:
         colors = ["lightblue", "greenyellow", "lightyellow", 
                   "lightpink", "lightgrey",   "lightcyan", "lightcoral"]
 
-        self.load_instruction_list(instrs)
+        if instrs is not None:   # None: program already loaded (and maybe edited)
+            self.load_instruction_list(instrs)
 
         recurrent_paths = self.cyclic_paths
 
@@ -647,22 +713,7 @@ class Program:
         # All combinations of this ports
         from itertools import combinations
 
-        port_cycles = 0
-        for r in range(1, n_ports + 1):
-            for subset in combinations(used_ports, r):
-                mask = 0
-                for p in subset:
-                    mask |= (1 << p)
-
-                uses = 0
-                for instr in self.instruction_list:
-                    instr_mask = instr.ports
-                    if (mask & instr_mask) == instr_mask:
-                        uses += 1
-
-                cycles = uses / len(subset)
-                if cycles > port_cycles:
-                    port_cycles = cycles
+        port_cycles = self.get_port_cycles()
 
         max_cycles = max(port_cycles, dw_cycles, rw_cycles)
 
@@ -696,12 +747,14 @@ class Program:
                     mask |= (1 << p)
 
                 uses = 0
+                count= 0
                 inst_str= ""
                 for i in range(self.n):
                     instr = self.instruction_list[i]
                     instr_mask = instr.ports
                     if (mask & instr_mask) == instr_mask:
-                        uses += 1
+                        uses += instr.occupancy
+                        count+= 1
                         inst_str += f"{i},"
 
                 cycles = uses / len(subset)
@@ -714,9 +767,86 @@ class Program:
                         mask_bit *= 2
 
                     text = f"Ports: {port_str[:-1]}, Instr.: {inst_str[:-1]} -->"
-                    text+= f"{uses} instr. per iter. / {len(subset)} instr. per cycle = {cycles:0.2f}"
+                    if uses == count:
+                        text+= f"{uses} instr. per iter. / {len(subset)} instr. per cycle = {cycles:0.2f}"
+                    else:  # non-pipelined instructions: port busy cycles
+                        text+= f"{uses} busy cycles per iter. / {len(subset)} ports = {cycles:0.2f}"
                     analysis["Throughput-Bottlenecks"].append(text)
 
         return json.dumps(analysis, indent=2)
 
+    def get_unroll_analysis(self, processJSON, max_factor: int = 8, simulate: bool = False,
+                            niters: int = 240, jobs: int = 1, tolerance: float = 0.05) -> str:
+
+        # Unroll-factor advisor: bounds (and, if simulate, simulated cycles, on jobs worker
+        #   processes) per original iteration of the loop unrolled 1..max_factor times, and the
+        #   smallest factor within tolerance of the best throughput bound (see unroll.py)
+        from .unroll import advise_unroll
+        process  = Process.from_json(processJSON)
+        analysis = advise_unroll(processJSON, max_factor, simulate, niters, jobs, tolerance)
+        self.load_instruction_list(process.instruction_list)
+        return json.dumps(analysis, indent=2)
+
+    def get_performance_preview(self, processJSON, niters: int = 3) -> str:
+
+        # Fast interval-model estimate of Scheduler.get_results (same keys for cycles and IPC)
+        process = Process.from_json(processJSON)
+        self.load_instruction_list(process.instruction_list)
+        self.assign_memory_addresses(niters)
+
+        preview = im.estimate_performance(self, process, niters)
+        preview["name"] = process.name
+        return json.dumps(preview)
+
+    def get_cache_analysis(self, processJSON, niters: int = 3, validate: bool = False) -> str:
+
+        # Simulation-free estimate of cache statistics, same keys as Scheduler.get_results
+        process = Process.from_json(processJSON)
+        self.load_instruction_list(process.instruction_list)
+        self.assign_memory_addresses(niters)
+
+        analysis = cm.estimate_cache_misses(self.instruction_list, niters, process.nBlocks, process.blkSize)
+        analysis["total_iterations"] = niters
+
+        if validate:  # compare against a replay of the address trace and a timed simulation
+            from .scheduler import Scheduler   # scheduler imports this module
+            instruction_list = self.instruction_list
+            timed = json.loads(Scheduler().get_results(processJSON, niters))   # loads the program again
+            analysis["validation"] = cm.validate_cache_model(instruction_list, niters, process.nBlocks,
+                                                             process.blkSize, timed)
+        return json.dumps(analysis)
+
+    def edit_instruction_list(self, edits) -> str:
+
+        # Incremental reanalysis of the loaded program after single-instruction edits, in order:
+        #   {"op": "insert", "index": i, "instruction": {...}}  (new instruction at position i)
+        #   {"op": "delete", "index": i}
+        #   {"op": "replace","index": i, "instruction": {...}}
+        # Only affected dependences and recurrences are recomputed (see dependences.py);
+        # then show_graphviz(None, ...) draws the edited program without loading it again.
+        if self.editor is None:
+            self.editor = dp.DependenceModel(self)
+        try:
+            for edit in edits:
+                op, index = edit.get("op", ""), edit.get("index", 0)
+                if op == "insert":
+                    self.editor.insert(index, Instruction.from_json(edit["instruction"]))
+                elif op == "delete":
+                    self.editor.delete(index)
+                elif op == "replace":
+                    self.editor.replace(index, Instruction.from_json(edit["instruction"]))
+                else:
+                    raise ValueError(f"unknown edit operation '{op}' (use insert, delete or replace)")
+        finally:   # edits applied before an error are kept
+            self.editor.update()
+
+        max_latency, min_iters, path_latencies = self.get_critical_latencies()
+        analysis = {"n":                self.n,
+                    "cyclic_paths":     [{"path": path, "latency": latency, "iters": iters}
+                                         for path, (latency, iters) in zip(self.cyclic_paths, path_latencies)],
+                    "LatencyTime":      max_latency,
+                    "min_iters":        min_iters,
+                    "components":       {"recomputed": self.editor.recomputed, "reused": self.editor.reused}}
+        return json.dumps(analysis)
+
 _program = Program()
@@ -0,0 +1,162 @@
+import random
+from collections import OrderedDict
+
+# Replacement policies of the (fully associative) Cache. Cache fills invalid lines first,
+# in line order, and asks the policy for a victim only when all lines are valid.
+# Interface:
+#   touch(line)  : access to a line already in the cache (hit or secondary miss)
+#   insert(line) : a new block has been stored in the line
+#   victim()     : line to replace
+#   get_state() / set_state(state) : JSON-serialisable state (simulation checkpoints)
+# All operations are O(1), except tree-PLRU (O(log n), as the hardware).
+
+class LRU:
+
+    def __init__(self, n_lines: int, seed: int = 0) -> None:
+        self.order = OrderedDict.fromkeys(range(n_lines))   # least recently used first
+
+    def touch(self, line: int) -> None:
+        self.order.move_to_end(line)
+
+    insert = touch
+
+    def victim(self) -> int:
+        return next(iter(self.order))
+
+    def get_state(self):
+        return list(self.order)
+
+    def set_state(self, state) -> None:
+        self.order = OrderedDict.fromkeys(state)
+
+class FIFO:
+
+    def __init__(self, n_lines: int, seed: int = 0) -> None:
+        self.n_lines = n_lines
+        self.next    = 0      # oldest line (lines are filled in order)
+
+    def touch(self, line: int) -> None:
+        pass
+
+    def insert(self, line: int) -> None:
+        if line == self.next:
+            self.next = (self.next + 1) % self.n_lines
+
+    def victim(self) -> int:
+        return self.next
+
+    def get_state(self):
+        return self.next
+
+    def set_state(self, state) -> None:
+        self.next = state
+
+class Random:
+
+    def __init__(self, n_lines: int, seed: int = 0) -> None:
+        self.n_lines = n_lines
+        self.rng     = random.Random(seed)
+
+    def touch(self, line: int) -> None:
+        pass
+
+    insert = touch
+
+    def victim(self) -> int:
+        return self.rng.randrange(self.n_lines)
+
+    def get_state(self):
+        return self.rng.getstate()
+
+    def set_state(self, state) -> None:
+        version, internal, gauss = state   # tuples become lists in JSON
+        self.rng.setstate((version, tuple(internal), gauss))
+
+class TreePLRU:
+    # binary tree of bits over the lines (padded to a power of 2): each bit points to the
+    #   half that was not used last; victim() follows the bits from the root
+
+    def __init__(self, n_lines: int, seed: int = 0) -> None:
+        self.n_lines = n_lines
+        self.leaves  = 1
+        while self.leaves < n_lines:
+            self.leaves *= 2
+        self.bits    = [0] * self.leaves   # node i has children 2i, 2i+1 (root: 1)
+
+    def touch(self, line: int) -> None:
+        node = self.leaves + line
+        while node > 1:
+            parent = node // 2
+            self.bits[parent] = 1 - (node & 1)   # point away from the used child
+            node = parent
+
+    insert = touch
+
+    def victim(self) -> int:
+        node = 1
+        while node < self.leaves:
+            child = 2*node + self.bits[node]
+            # skip subtrees without real lines (padding when n_lines is not a power of 2)
+            if self.first_line(child) >= self.n_lines:
+                child = 2*node + 1 - self.bits[node]
+            node = child
+        return node - self.leaves
+
+    def first_line(self, node: int) -> int:
+        while node < self.leaves:
+            node *= 2
+        return node - self.leaves
+
+    def get_state(self):
+        return self.bits[:]
+
+    def set_state(self, state) -> None:
+        self.bits = state[:]
+
+class SRRIP:
+    # static re-reference interval prediction with 2-bit RRPV: new blocks get RRPV 2, hits 0,
+    #   the victim is a line with RRPV 3 (all RRPVs are incremented until there is one).
+    #   Lines are kept in one insertion-ordered bucket per RRPV; incrementing all RRPVs
+    #   is a rotation of the buckets.
+
+    MAX_RRPV = 3
+
+    def __init__(self, n_lines: int, seed: int = 0) -> None:
+        self.buckets = [dict() for _ in range(self.MAX_RRPV + 1)]
+        self.where   = [None] * n_lines            # bucket of each line
+        for line in range(n_lines):
+            self.move(line, self.MAX_RRPV)
+
+    def move(self, line: int, rrpv: int) -> None:
+        if self.where[line] is not None:
+            del self.where[line][line]
+        self.buckets[rrpv][line] = None
+        self.where[line] = self.buckets[rrpv]
+
+    def touch(self, line: int) -> None:
+        self.move(line, 0)
+
+    def insert(self, line: int) -> None:
+        self.move(line, self.MAX_RRPV - 1)
+
+    def victim(self) -> int:
+        while not self.buckets[self.MAX_RRPV]:   # increment all RRPVs (at most MAX_RRPV times)
+            merged = self.buckets[self.MAX_RRPV]
+            self.buckets = [merged] + self.buckets[:self.MAX_RRPV]
+        return next(iter(self.buckets[self.MAX_RRPV]))
+
+    def get_state(self):
+        return [list(bucket) for bucket in self.buckets]
+
+    def set_state(self, state) -> None:
+        self.buckets = [dict.fromkeys(lines) for lines in state]
+        for bucket in self.buckets:
+            for line in bucket:
+                self.where[line] = bucket
+
+POLICIES = {"lru": LRU, "fifo": FIFO, "random": Random, "plru": TreePLRU, "srrip": SRRIP}
+
+def get_policy(name: str, n_lines: int, seed: int = 0):
+    if name not in POLICIES:
+        raise ValueError(f"unknown replacement policy '{name}' (use one of {', '.join(POLICIES)})")
+    return POLICIES[name](n_lines, seed)
@@ -0,0 +1,148 @@
+import math
+import random
+from .program   import _program
+from .scheduler import Scheduler
+
+# Sampled simulation for very long runs (systematic sampling, as in SMARTS): the run is split
+# in periods of niters/samples iterations. Most iterations of a period are fast-forwarded with
+# a functional model, that only advances the addresses of memory instructions and updates the
+# cache contents (Cache.warm); a window of consecutive iterations at a random position in the
+# period (seeded: avoids aliasing with periodic behaviour, e.g. cache blocks) is simulated in
+# detail, starting with an empty pipeline and the warm cache: warmup_iters to 2*warmup_iters
+# iterations (random) to fill the pipeline, sample_iters measured iterations, and warmup_iters
+# more iterations so that the measured ones compete for memory as in a long run (the last
+# iterations of a simulation drain faster: nothing follows them). A window is measured from the
+# retirement of its first to its last measured iteration. Pending memory and write-buffer
+# activity is carried from the end of a window to the start of the next one (steady-state
+# backlog of bandwidth-bound kernels).
+# Cycles per iteration are estimated from the samples, with a confidence interval (Student's
+# t) from their variance. The timing pattern of a kernel (e.g. bursts of retirements after
+# each miss) starts again with the pipeline in every window: with a fixed warmup all windows
+# would measure the same phase of it and agree on a biased value, the random warmup spreads the
+# windows over the phases so that this error shows in their variance. The carried backlog
+# correlates consecutive windows: the variance of the mean is scaled by (1+r)/(1-r), r being the
+# lag-1 autocorrelation of the samples (when positive), and the degrees of freedom reduced.
+# Limit: the functional warming does not reproduce the replacement order of blocks that are in
+# flight in a timed run, and a few short windows can all fall in the same phase of a kernel
+# with long phases (e.g. the inner-loop boundaries of a naive matmul): use more samples there.
+
+CONFIDENCE = 0.95
+T_95       = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,   # by degrees
+              2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,    # of freedom
+              2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+Z_95       = 1.960   # more than 30 degrees of freedom
+
+class SampleScheduler(Scheduler):
+    # Scheduler whose simulations continue from the functional state (addresses and cache)
+
+    def __init__(self, layout_iters: int) -> None:
+        super().__init__()
+        self.layout_iters = layout_iters   # arrays are laid out for the whole run
+        self.cursors      = []             # address of each instruction on next iteration
+        self.iteration    = 0              # next iteration (nested-loop addresses)
+        self.warm_cache   = None
+        self.end_cycle    = 0              # last cycle of the previous detailed simulation
+
+    def start(self, processJSON) -> None:
+        super().configure(processJSON, 1, self.layout_iters)
+        self.cursors    = [instr.addr for instr in _program.instruction_list]
+        self.iteration  = 0
+        self.warm_cache = self.cache
+        self.end_cycle  = 0
+
+    def configure(self, processJSON, niters: int, layout_iters: int = 0) -> list:
+        ports = super().configure(processJSON, niters, self.layout_iters)
+        for instr, addr in zip(_program.instruction_list, self.cursors):
+            instr.addr = addr
+        self.first_iter = self.iteration
+        if self.warm_cache is not None:
+            self.warm_cache.shift_timing(self.end_cycle)   # keep memory backlog
+            self.cache = self.warm_cache
+        return ports
+
+    def fast_forward(self, iterations: int) -> None:
+        # functional simulation of iterations, memory accesses in program order
+        memory = [(k, 1 if instr.oper == "STORE" else 0, instr.byte_stride, instr.stream if instr.loops else None)
+                  for k, instr in enumerate(_program.instruction_list) if instr.type in ("MEM", "VMEM")]
+        cursors = self.cursors
+        cache   = self.warm_cache
+        first   = self.iteration
+        self.iteration += iterations
+        if cache is None:
+            for k, _, stride, _ in memory:
+                cursors[k] += iterations * stride
+            return
+        for iteration in range(first, first + iterations):
+            for k, access_type, stride, stream in memory:
+                if stream is not None:   # nested loops
+                    cache.warm(access_type, stream.get_address(iteration))
+                    continue
+                cache.warm(access_type, cursors[k])
+                cursors[k] += stride
+
+    def sample(self, processJSON, warmup_iters: int, sample_iters: int, drain_iters: int) -> tuple:
+        # detailed simulation of warmup, measured and drain iterations, addresses continue
+        #   where the simulation stops: (cycles per measured iteration, misses per iteration)
+        niters = warmup_iters + sample_iters + drain_iters
+        out    = self.simulate(processJSON, niters, warmup=warmup_iters)
+        start  = self.iter_end[warmup_iters-1] if warmup_iters else 0
+        cpi    = (self.iter_end[warmup_iters+sample_iters-1] - start) / sample_iters
+        misses = (out["read_misses"] + out["write_misses"]) / (niters - warmup_iters)
+        self.end_cycle  = self.cycles
+        self.cursors    = [instr.addr for instr in _program.instruction_list]
+        self.iteration += niters
+        return cpi, misses
+
+def simulate_sampled(processJSON, niters: int, samples: int = 30, sample_iters: int = 20,
+                     warmup_iters: int = 10, seed: int = 0) -> dict:
+    period = niters // max(samples, 1)
+    detail = 3*warmup_iters + sample_iters   # longest window
+    if samples < 2 or period <= detail:   # not enough iterations to sample: simulate all
+        out = Scheduler().simulate(processJSON, niters)
+        cpi = out["cycles_per_iteration"]
+        return {"total_iterations": niters, "sampled": False, "samples": 1, "period": niters,
+                "sample_iterations": niters, "warmup_iterations": 0, "detailed_iterations": niters,
+                "cycles_per_iteration": cpi, "stdev": 0.0, "confidence": CONFIDENCE,
+                "ci_low": cpi, "ci_high": cpi, "relative_error": 0.0,
+                "estimated_total_cycles": out["total_cycles"], "ipc": out["ipc"],
+                "misses_per_iteration": (out["read_misses"] + out["write_misses"]) / niters}
+
+    rng   = random.Random(seed)
+    sched = SampleScheduler(niters)
+    sched.start(processJSON)
+    cpis, misses, detailed = [], [], 0
+    for _ in range(samples):
+        warmup = warmup_iters + rng.randrange(warmup_iters + 1)   # random phase of the window
+        window = warmup + sample_iters + warmup_iters
+        offset = rng.randrange(period - window + 1)
+        sched.fast_forward(offset)
+        cpi, miss = sched.sample(processJSON, warmup, sample_iters, warmup_iters)
+        sched.fast_forward(period - window - offset)
+        cpis.append(cpi)
+        misses.append(miss)
+        detailed += window
+
+    mean  = sum(cpis) / samples
+    var   = sum((x - mean)**2 for x in cpis) / (samples - 1)
+    stdev = math.sqrt(var)
+    lag1  = sum((cpis[k] - mean) * (cpis[k+1] - mean) for k in range(samples - 1)) / (samples - 1)
+    r     = min(lag1 / var, 0.9) if var > 0 and lag1 > 0 else 0.0
+    dof   = max(1, round((samples - 1) * (1 - r) / (1 + r)))   # effective degrees of freedom
+    t     = T_95[dof-1] if dof <= len(T_95) else Z_95
+    half  = t * math.sqrt(var * (1 + r) / (1 - r) / samples)
+    return {"total_iterations":       niters,
+            "sampled":                True,
+            "samples":                samples,
+            "period":                 period,
+            "sample_iterations":      sample_iters,
+            "warmup_iterations":      warmup_iters,
+            "detailed_iterations":    detailed,
+            "cycles_per_iteration":   mean,
+            "stdev":                  stdev,
+            "confidence":             CONFIDENCE,
+            "ci_low":                 mean - half,
+            "ci_high":                mean + half,
+            "relative_error":         half / mean,
+            "estimated_total_cycles": mean * niters,
+            "ipc":                    sched.num_instr / mean,
+            "misses_per_iteration":   sum(misses) / samples}
@@ -1,11 +1,18 @@
 from .window   import Window, InstrState
 from .program  import Process, _program
 from .cache    import Cache
+from .stalls   import StallCounters
+from .profiler import Profiler
+from .timeseries import PipelineSeries
+from .trace    import Tracer, get_sink
 from .         import exec_graph as ex
+from collections import deque
 import json
 
 global _scheduler
 
+CHECKPOINT_VERSION = 1   # layout of simulation snapshots (see get_state); older ones are rejected
+
 class Scheduler:
 
     def __init__(self) -> None:
@@ -26,8 +33,25 @@ class Scheduler:
         self.n          = 0
         self.dispatched = 0
         self.pc         = 0
+        self.first_iter = 0
         self.cycles     = 0
+        self.port_busy  = {}
+        self.mem_deps   = False
+        self.fwd_latency= 1
+        self.store_table= {}
+        self.lq_size    = 0
+        self.sq_size    = 0
+        self.loads      = 0
+        self.stores     = 0
+        self.lq_last    = deque()
+        self.sq_last    = deque()
+        self.queue_stall= None
         self.DepEdges   = []
+        self.checkpoints     = {}   # simulation snapshots, by configuration (see get_results)
+        self.max_checkpoints = 8
+        self.profiler        = None # Profiler of last run with profile=True
+        self.run_id          = 0    # id of the last started simulation (see simulation)
+        self.iter_end        = []   # cycle when each iteration of the last simulation retired
 
     def next_cycle(self) -> int:
 
@@ -37,6 +61,10 @@ class Scheduler:
 
         issue_queue = {}
         used_ports  = {port:False for port in range(32) if (self.port_mask >> port) & 1}
+        if self.port_busy:  # ports still busy with non-pipelined instructions issued earlier
+            self.port_busy = {port: until for port, until in self.port_busy.items() if until > self.cycles}
+            for port in self.port_busy:
+                used_ports[port] = True
         ReadMisses  = []
         SecondMisses= []
         WriteMisses = []
@@ -62,7 +90,7 @@ class Scheduler:
             elif instr.state == InstrState.LOAD or instr.state == InstrState.STORE:
                 instr.latency -= 1
                 if instr.latency == 0:
-                    if instr.substate == InstrState.WAIT_DATA_READY or instr.substate == InstrState.WAIT_CACHE_2ND or self.cache is None:
+                    if instr.substate == InstrState.WAIT_DATA_READY or instr.substate == InstrState.WAIT_CACHE_2ND or self.cache is None or instr.forwarded:
                         instr.state    = InstrState.WRITE_BACK
                         instr.substate = InstrState.NONE
                     elif instr.substate == InstrState.MM_UPDATE:
@@ -83,7 +111,7 @@ class Scheduler:
                         instr.substate = InstrState.WAIT_MM_RDY_UPDT
                         instr.latency = self.mIssueTime
                     else:
-                        result, instr.latency = self.cache.access(instr.memory-1, instr.memAddr, self.cycles)
+                        result, instr.latency = self.cache.access(instr.memory-1, instr.memAddr, self.cycles, static_idx)
                         instr.exec_lat += instr.latency   # add extra latency in case of cache miss
                         if result == 0:  # HIT
                             instr.state    = InstrState.WRITE_BACK
@@ -109,6 +137,8 @@ class Scheduler:
                             else:
                                 instr.substate = InstrState.WAIT_MM_RDY_UPDT
                                 instr.latency = self.mIssueTime
+                        elif result == 4:  # Primary miss served by shared last-level cache (multicore)
+                            instr.substate = InstrState.WAIT_CACHE_2ND
                         else:  # Secondary miss
                             SecondMisses.append(instr.d_idx)
                             instr.substate = InstrState.WAIT_CACHE_2ND
@@ -132,18 +162,35 @@ class Scheduler:
                                 instr.substate = InstrState.WAIT_DATA
                                 break
 
+                    if instr.mem_dep >= 0 and instr.substate != InstrState.WAIT_DATA:   # older store to same address
+                        store = self.window.get_instr( instr.mem_dep )   # forwards its data once computed,
+                        if store and (self.fwd_latency <= 0 or store.state == InstrState.DISPATCH or   # even on a miss
+                                      self.cycles < store.exec_cycle + _program.instruction_list[store.s_idx].latency):
+                            instr.substate = InstrState.WAIT_DATA
+
                 if instr.substate != InstrState.WAIT_DATA:
                     port_mask = _program.instruction_list[static_idx].ports
                     latency   = _program.instruction_list[static_idx].latency
+                    occupancy = _program.instruction_list[static_idx].occupancy
+                    if instr.mem_dep >= 0:   # store still in the window: forward its data, no cache access
+                        store = self.window.get_instr( instr.mem_dep )
+                        instr.forwarded = self.fwd_latency > 0 and store is not None
+                        if instr.forwarded:
+                            latency = self.fwd_latency
+                            instr.data_lat = store.data_lat
                     required_ports= [port for port in range(32) if (port_mask >> port) & 1]
                     if not sched:  # Greedy scheduling algorithm
                       if xw:
                         for port in required_ports:
                             if not used_ports[port]:
                                 used_ports[port] = True
+                                if occupancy > 1:
+                                    self.port_busy[port] = self.cycles + occupancy
                                 instr.exec_cycle = self.cycles
                                 instr.latency    = latency
                                 instr.exec_lat  += latency
+                                if instr.memory == 2:
+                                    instr.data_lat = instr.exec_lat
                                 if instr.memory > 0:
                                     instr.state = InstrState.LOAD if instr.memory == 1 else InstrState.STORE
                                 else:
@@ -160,6 +207,8 @@ class Scheduler:
                         instr.exec_lat += 1
 
                     else:   # Optimal scheduling: first priority is age, second is using most ports
+                      if self.port_busy:
+                          required_ports = [port for port in required_ports if not used_ports[port]]
                       issue_queue[window_idx] = required_ports
                       instr.latency           = latency
 
@@ -177,6 +226,9 @@ class Scheduler:
                     port             = issd_isps[w_idx]
                     instr.port_used  = port
                     used_ports[port] = True
+                    occupancy        = _program.instruction_list[instr.s_idx].occupancy
+                    if occupancy > 1:
+                        self.port_busy[port] = self.cycles + occupancy
                     instr.exec_cycle = self.cycles
                     if instr.memory > 0:
                         instr.state = InstrState.LOAD if instr.memory == 1 else InstrState.STORE
@@ -196,6 +248,7 @@ class Scheduler:
 
     def dispatch(self):
         dw = self.dispWidth
+        self.queue_stall = None
         while self.dispatched < self.n and dw and not self.window.is_full():
             static_idx = self.pc % self.num_instr
             instr_mem  = 0
@@ -203,83 +256,142 @@ class Scheduler:
             instr      = _program[static_idx]
             if instr.type == "MEM" or instr.type == "VMEM":
                 instr_mem  = 1 if instr.oper == "LOAD" else 2
-                addr       = instr.addr
-                instr.addr = addr + instr.byte_stride
-    
+                if self.queue_full(instr_mem):
+                    break
+                addr       = self.next_address(instr, static_idx)
+
             self.window.push(self.cycles, self.pc, static_idx, instr_mem, addr)
+            if instr_mem:
+                self.dispatch_memory(self.window[self.window.count-1])
             self.pc += 1
             dw      -= 1
             self.dispatched +=1
 
         self.cycles += 1
 
-    def generate_timeline_state ( self, dynamic_idx, stages, critical_path):
-        
+    def next_address(self, instr, static_idx: int) -> int:
+        # address accessed by the memory instruction being dispatched (at self.pc); advances its
+        #   stream. Overridden by multicore.Core (addresses private to each core)
+        if instr.loops:   # nested loops: address of this iteration
+            return instr.stream.get_address(self.first_iter + self.pc // self.num_instr)
+        addr       = instr.addr
+        instr.addr = addr + instr.byte_stride
+        return addr
+
+    def queue_full(self, instr_mem: int) -> bool:
+        # True if the load (1) or store (2) queue has no free entry: dispatch stalls (cause in queue_stall)
+        if instr_mem == 1:
+            if self.lq_size and self.loads == self.lq_size:
+                self.queue_stall = InstrState.WAIT_LOAD_QUEUE
+                return True
+        elif self.sq_size and self.stores == self.sq_size:
+            self.queue_stall = InstrState.WAIT_STORE_QUEUE
+            return True
+        return False
+
+    def dispatch_memory(self, instr) -> None:
+        # allocate load/store queue entry of a dispatched memory instruction. The entry was freed by
+        #   the load (store) dispatched LQsize (SQsize) loads (stores) earlier: queue_dep
+        if instr.memory == 1:
+            self.loads += 1
+            if self.lq_size:
+                if len(self.lq_last) == self.lq_size:
+                    instr.queue_dep = self.lq_last[0]
+                self.lq_last.append(instr.d_idx)
+        else:
+            self.stores += 1
+            if self.sq_size:
+                if len(self.sq_last) == self.sq_size:
+                    instr.queue_dep = self.sq_last[0]
+                self.sq_last.append(instr.d_idx)
+        if self.mem_deps:
+            self.memory_dependence(instr)
+
+    def memory_dependence(self, instr) -> None:
+        # address-based dependences (memDependences), using a table of the stores in the window:
+        #   a dispatched store registers each byte it writes, and a dispatched load depends on the
+        #   youngest store writing any of the bytes it reads (partial and misaligned overlaps too)
+        static = _program.instruction_list[instr.s_idx]
+        data   = range(instr.memAddr, instr.memAddr + static.data_size*static.lanes)
+        if instr.memory == 2:
+            for addr in data:
+                self.store_table[addr] = instr.d_idx
+        else:
+            instr.mem_dep = max([self.store_table.get(addr, -1) for addr in data])
+
+    def retire_memory(self, ExecGraph, instr) -> None:
+        # a retiring load/store frees its queue entry, and its dispatch depends on the retirement
+        #   of the instruction that freed the entry it took.
+        # memDependences: a retiring store leaves the store table; a retiring load with a memory
+        #   dependence adds its edge to the execution graph: from the store execution (latency until
+        #   its data was computed) if the data was forwarded, or from the store retirement if the
+        #   load read the cache
+        if instr.memory == 1:
+            self.loads  -= 1
+        else:
+            self.stores -= 1
+        if instr.queue_dep >= 0:
+            ExecGraph[instr.d_idx*3].append( [instr.queue_dep*3+2, 0] )
+        if not self.mem_deps:
+            return
+        if instr.memory == 2:
+            static = _program.instruction_list[instr.s_idx]
+            for addr in range(instr.memAddr, instr.memAddr + static.data_size*static.lanes):
+                if self.store_table.get(addr) == instr.d_idx:
+                    del self.store_table[addr]
+        elif instr.mem_dep >= 0:
+            j = instr.mem_dep
+            if instr.forwarded:
+                ExecGraph[instr.d_idx*3+1].append( [j*3+1, instr.data_lat] )
+            else:
+                ExecGraph[instr.d_idx*3+1].append( [j*3+2, 0] )
+
+    def generate_timeline_state ( self, dynamic_idx, states, critical):
+        # states: state symbol of the instruction on each cycle, from dispatch to retirement
+        #   (preceded by the cycles it could not be dispatched for lack of a load/store queue entry)
+        # critical: latency of each execution graph node on the critical path (-1: not on it)
+        # returns stage string (queue waits, D, WAIT_DATA cycles, execute stage, R) and critical cycles
+
+        states       = "".join(states)
+        queue        = states[:len(states) - len(states.lstrip(InstrState.WAIT_LOAD_QUEUE._value_ +
+                                                               InstrState.WAIT_STORE_QUEUE._value_))]
+        states       = states[len(queue):]
+        end          = states.index(InstrState.RETIRE._value_, 1)   # end of execute stage
+        waits        = states[1:end]
+        decode_waits = len(waits) - len(waits.lstrip(InstrState.WAIT_DATA._value_))
+        node         = dynamic_idx*3
         criticalList = []
 
         # Decode Stage
-        decode_stage = "D"
-        stages.pop(0)
-
-        if len(critical_path) > 0:
-          node = critical_path[-1]
-          idx  = node[0] // 3
-          stage= node[0] % 3
-          if idx == dynamic_idx and stage == 0:
-            if node[1] == 1:
-                criticalList.append(0)  # Decode stage is in critical path
-            critical_path.pop(-1)
-
-        cycle = 1
-        while stages[0] == InstrState.WAIT_DATA:
-            decode_stage += stages[0].value
-            stages.pop(0)
-            cycle = cycle+1
-        
+        if critical[node] == 1:
+            criticalList.append(0)  # Decode stage is in critical path
+
         # Execute Stage
-        execute_stage = ""
-        count = 0
-
-        if len(critical_path) > 0:
-          node = critical_path[-1]
-          idx  = node[0] // 3
-          stage= node[0] % 3
-          if idx == dynamic_idx and stage == 1:
-            count = node[1]-1
-            criticalList.append(cycle)  # Execute stage is in critical path
-            critical_path.pop(-1)
-        
-        while stages[0] != InstrState.RETIRE:
-            execute_stage += stages[0].value
-            stages.pop(0)
-            cycle = cycle+1
-            if count > 0:
-                count = count-1
-                criticalList.append(cycle)  # Execute stage is in critical path
-        
+        cycle = 1 + decode_waits
+        if critical[node+1] >= 0:  # Execute stage is in critical path (latency cycles, within stage)
+            criticalList.append(cycle)
+            criticalList.extend(range(cycle+1, cycle+1 + min(critical[node+1]-1, end-cycle)))
+
         # Retire Stage
-        retire_stage = "R"
-        if len(critical_path) > 0:
-          node = critical_path[-1]
-          idx  = node[0] // 3
-          stage= node[0] % 3
-          if idx == dynamic_idx and stage == 2:
-              critical_path.pop(-1)
-              if node[1] == 1:
-                criticalList.append(cycle)  # Execute stage is in critical path
-
-        return (decode_stage + execute_stage + retire_stage, criticalList)
-
-    def generate_timeline(self, ports):
+        if critical[node+2] == 1:
+            criticalList.append(end)
+
+        if queue:
+            criticalList = [cycle + len(queue) for cycle in criticalList]
+        return (queue + "D" + waits + "R", criticalList)
+
+    def generate_timeline(self, series = None):
+        # returns, per dynamic instruction: state symbol on each cycle, [dispatch cycle, port, address];
+        #   and critical path. series: PipelineSeries updated on each cycle (optional)
         rw              = self.retrWidth
         retired         = 0
         self.dispatched = 0
         self.cycles     = 0
         last_ret_cycle  = 0
         last_disp_cycle = 0
+        none            = InstrState.NONE
 
-        timeline      = {i:[] for i in range(self.n + self.window.size + rw)}
-        port_timeline = {port:[] for port in ports}
+        states        = [[] for i in range(self.n)]
         INSTR_Info    = []
 
         ExecGraph     = ex.generate_execution_graph( self.num_instr, self.n, self.window_size, self.DepEdges )
@@ -287,9 +399,6 @@ class Scheduler:
         while retired < self.n:
             retires, used_ports, _,_,_,_ = self.next_cycle()
 
-            for port, used in used_ports.items():
-                port_timeline[port].append(used)
-
             for i in range(retires):
                 r_instr     = self.window[i]
                 dynamic_idx = r_instr.d_idx
@@ -302,30 +411,40 @@ class Scheduler:
                 last_ret_cycle  = self.cycles
                 exec_latency    = r_instr.exec_lat
 
-                INSTR_Info.append([r_instr.exec_cycle, r_instr.port_used, r_instr.memAddr])
+                INSTR_Info.append([r_instr.disp_cycle, r_instr.port_used, r_instr.memAddr])
 
-                timeline[ dynamic_idx ].append((self.cycles, r_instr.state))
+                states[ dynamic_idx ].append(r_instr.state._value_)
 
                 ex.exec_graph_update ( ExecGraph, dynamic_idx, disp_latency, exec_latency, ret_latency ) 
+                if r_instr.memory:
+                    self.retire_memory( ExecGraph, r_instr )
 
                 retired += 1
                 if retired >= self.n:
                     break
 
             self.window.pop(retires)
+            dispatched = self.dispatched
             self.dispatch()
+            if series is not None:
+                series.sample(self.window, used_ports, retires, self.dispatched - dispatched)
+            if self.queue_stall is not None:   # next instruction waits for a load/store queue entry
+                states[self.pc].append(self.queue_stall._value_)
 
             for instr in self.window:
-                if instr.substate != InstrState.NONE:
-                    timeline[instr.d_idx].append((self.cycles, instr.substate))
+                if instr.substate is not none:
+                    states[instr.d_idx].append(instr.substate._value_)
                 else:
-                    timeline[instr.d_idx].append((self.cycles, instr.state))
+                    states[instr.d_idx].append(instr.state._value_)
 
         critical_path = ex.longest_path(ExecGraph)
 
-        return timeline, port_timeline, INSTR_Info, critical_path
+        return states, INSTR_Info, critical_path
 
-    def get_timeline(self, processJSON, niters: int = 3) -> str:
+    def configure(self, processJSON, niters: int, layout_iters: int = 0) -> list:
+        # load program and processor configuration, reset simulation state
+        # layout_iters: number of iterations used to lay out arrays in memory (default: niters)
+        # returns list of used ports
 
         process = Process.from_json(processJSON)
         _program.load_instruction_list(process.instruction_list)
@@ -341,20 +460,33 @@ class Scheduler:
         self.sched      = process.sched
         self.blkSize    = process.blkSize
         self.nBlocks    = process.nBlocks
+        self.cache_options = process.cache_options()
+        self.mem_deps   = process.memDependences
+        self.fwd_latency= process.forwardLatency
 
-        _program.assign_memory_addresses(self.iterations)
+        _program.assign_memory_addresses(max(niters, layout_iters))
         
         # Always creat a new cache object to reset cache state, even if nBlocks is 0 (no cache)
         if self.nBlocks > 0:
-            self.cache  = Cache(self.nBlocks, self.blkSize, self.mPenalty, self.mIssueTime)
+            self.cache  = Cache(self.nBlocks, self.blkSize, self.mPenalty, self.mIssueTime, **self.cache_options)
         else:
             self.cache = None
             
         self.num_instr  = _program.n
         self.n          = niters*self.num_instr
         self.pc         = 0
+        self.first_iter = 0    # loop iterations before this simulation (nested-loop addresses)
         self.cycles     = 0
         self.dispatched = 0
+        self.port_busy  = {}   # port -> cycle when it is free again (non-pipelined instructions)
+        self.store_table= {}   # element address -> dynamic index of youngest store in the window
+        self.lq_size    = process.LQsize
+        self.sq_size    = process.SQsize
+        self.loads      = 0    # occupied load/store queue entries (loads/stores in the window)
+        self.stores     = 0
+        self.lq_last    = deque(maxlen=self.lq_size)   # last LQsize (SQsize) dispatched loads (stores)
+        self.sq_last    = deque(maxlen=self.sq_size)
+        self.queue_stall= None # cause of a dispatch stall in last dispatch(): full load/store queue
 
         all_ports = 0
         for instr in _program.instruction_list:
@@ -364,22 +496,46 @@ class Scheduler:
         # list of used ports and number of used ports
         ports        = [i for i in range(32) if (all_ports >> i) & 1]
         self.n_ports = len(ports)
+        return ports
+
+    def get_timeline(self, processJSON, niters: int = 3, profile: bool = False, timeseries: int = 0) -> str:
+        # timeseries: number of bins of the pipeline utilisation time series (0: none, see timeseries)
+        if not profile:
+            return json.dumps(self.build_timeline(processJSON, niters, timeseries))
+        return self.profile_run(self.build_timeline, processJSON, niters, timeseries)
+
+    def profile_run(self, run, *args) -> str:
+        # run simulation with instrumentation on, and add a "profile" section to results.
+        # The Profiler is kept in self.profiler (e.g., for Profiler.export_trace)
+        self.profiler = Profiler(self)
+        with self.profiler:
+            out = run(*args)
+            self.profiler.call("json", json.dumps, out)
+        out["profile"] = self.profiler.json()
+        return json.dumps(out)
 
-        timeline, _, INSTR_Info, critical_path = self.generate_timeline(ports) 
+    def build_timeline(self, processJSON, niters: int = 3, timeseries: int = 0) -> dict:
 
-        instructions = []    # List of timeline.instructions
+        ports  = self.configure(processJSON, niters)
+        series = PipelineSeries(ports, timeseries) if timeseries else None
+
+        states, INSTR_Info, critical_path = self.generate_timeline(series)
 
-        for i, cycles in timeline.items():
+        critical = [-1] * (3*self.n)   # latency of critical path nodes, indexed by node
+        for node, latency in critical_path:
+            if node < len(critical):
+                critical[node] = latency
+
+        instructions = []    # List of timeline.instructions
 
-            if not cycles or i >= self.n:
-                break
+        for i in range(self.n):
 
-            stages, criticalList = self.generate_timeline_state( i, [s for _,s in cycles], critical_path)
+            stages, criticalList = self.generate_timeline_state( i, states[i], critical)
 
             instr = [
                 i // self.num_instr,   # loop iteration
                 i % self.num_instr,    # instruction Index
-                cycles[0][0]-1,        # starting cycle
+                INSTR_Info[i][0] - stages.index(InstrState.DISPATCH._value_),   # starting cycle
                 INSTR_Info[i][1],      # port
                 stages,                # states
                 criticalList,          # critical states
@@ -391,58 +547,204 @@ class Scheduler:
         timelineJson["cycles"]       = self.cycles
         timelineJson["instructions"] = instructions
         timelineJson["arrays"]       = _program.arrays
-
-        return json.dumps(timelineJson)
-
-    def get_results(self, processJSON, niters: int = 3) -> str:
-
-        process = Process.from_json(processJSON)
-        _program.load_instruction_list(process.instruction_list)
-
-        self.iterations = niters
-        self.window_size= process.ROBsize
-        self.window     = Window(process.ROBsize)
-        self.DepEdges   = _program.dependence_edges
-        self.dispWidth  = process.dispatch
-        self.retrWidth  = process.retire
-        self.mPenalty   = process.mPenalty
-        self.mIssueTime = process.mIssueTime
-        self.sched      = process.sched
-        self.blkSize    = process.blkSize
-        self.nBlocks    = process.nBlocks
-
-        _program.assign_memory_addresses(self.iterations)
-        
-        if self.nBlocks > 0:
-            self.cache  = Cache(self.nBlocks, self.blkSize, self.mPenalty, self.mIssueTime)
+        if series is not None:
+            timelineJson["timeseries"] = series.json()
+
+        return timelineJson
+
+    def dispatch_limited(self) -> bool:
+        # True if next dispatch() is limited by the number of instructions to execute (n):
+        #  up to this point, the simulation is identical to one with a larger n
+        free = self.window.size - self.window.count
+        return self.dispatched + min(self.dispWidth, free) > self.n
+
+    def get_state(self, counters: dict, stalls, ExecGraph) -> dict:
+        # serialisable snapshot of the full simulator state (see get_results)
+        state = {}
+        state["version"]    = CHECKPOINT_VERSION
+        state["iterations"] = self.iterations
+        state["n"]          = self.n
+        state["pc"]         = self.pc
+        state["dispatched"] = self.dispatched
+        state["cycles"]     = self.cycles
+        state["window"]     = self.window.get_state()
+        state["port_busy"]  = dict(self.port_busy)
+        state["store_table"]= dict(self.store_table)
+        state["queues"]     = [self.loads, self.stores, list(self.lq_last), list(self.sq_last)]
+        state["cache"]      = self.cache.get_state() if self.cache is not None else None
+        state["addresses"]  = [instr.addr for instr in _program.instruction_list]
+        state["counters"]   = dict(counters, port_usage=dict(counters["port_usage"]), iter_end=counters["iter_end"][:])
+        state["stalls"]     = stalls.get_state()
+        # graph nodes are only modified when an instruction retires: keep nodes of retired ones
+        state["exec_graph"] = [[edge[:] for edge in node] for node in ExecGraph[:counters["retired"]*3]]
+        return state
+
+    def set_state(self, state: dict, stalls) -> tuple:
+        # restore snapshot on a configured scheduler; returns counters and execution graph
+        self.pc         = state["pc"]
+        self.dispatched = state["dispatched"]
+        self.cycles     = state["cycles"]
+        self.window.set_state(state["window"])
+        self.port_busy  = {int(port): until for port, until in state["port_busy"].items()}
+        self.store_table= {int(addr): d_idx for addr, d_idx in state["store_table"].items()}
+        self.loads, self.stores = state["queues"][0], state["queues"][1]
+        self.lq_last = deque(state["queues"][2], maxlen=self.lq_size)
+        self.sq_last = deque(state["queues"][3], maxlen=self.sq_size)
+        if self.cache is not None:
+            self.cache.set_state(state["cache"])
+        for instr, addr in zip(_program.instruction_list, state["addresses"]):
+            instr.addr = addr
+        counters = dict(state["counters"])
+        counters["port_usage"] = {int(port): usage for port, usage in state["counters"]["port_usage"].items()}
+        counters["iter_end"]   = counters["iter_end"][:]
+        stalls.set_state(state["stalls"])
+        ExecGraph = [[edge[:] for edge in node] for node in state["exec_graph"]]
+        ex.extend_execution_graph( ExecGraph, self.num_instr, self.n, self.window_size, self.DepEdges )
+        return counters, ExecGraph
+
+    def get_baseline(self, counters: dict, stalls) -> dict:
+        # counters at the start of the measured region (see simulation, warmup)
+        return dict(counters, cycles=self.cycles, port_usage=dict(counters["port_usage"]), stalls=stalls.get_state(),
+                    cache=self.cache.get_statistics_state() if self.cache is not None else None)
+
+    def get_checkpoint_key(self, processJSON, layout_iters: int) -> str:
+        return json.dumps([processJSON, layout_iters], sort_keys=True)
+
+    def get_checkpoint(self, processJSON, layout_iters: int = 0) -> str:
+        # JSON snapshot stored by the last get_results(..., resume=True) for this configuration
+        return json.dumps(self.checkpoints.get(self.get_checkpoint_key(processJSON, layout_iters)))
+
+    def set_checkpoint(self, processJSON, checkpointJSON: str, layout_iters: int = 0) -> None:
+        checkpoint = json.loads(checkpointJSON)
+        if checkpoint.get("version") != CHECKPOINT_VERSION:
+            raise ValueError(f"checkpoint version {checkpoint.get('version')} is not supported "
+                             f"(expected {CHECKPOINT_VERSION})")
+        self.checkpoints[self.get_checkpoint_key(processJSON, layout_iters)] = checkpoint
+
+    def get_results(self, processJSON, niters: int = 3, resume: bool = False, layout_iters: int = 0,
+                    profile: bool = False, warmup: int = 0, timeseries: int = 0, trace: str = "") -> str:
+        # warmup: iterations excluded from statistics (pipeline fill, cold cache); see simulation
+        # timeseries: number of bins of the pipeline utilisation time series (0: none)
+        # trace: file where pipeline events are written (see trace.get_sink for formats)
+        args = (processJSON, niters, resume, layout_iters, warmup, timeseries)
+        if trace:
+            args = (trace, self.simulate) + args
+        run  = self.trace_run if trace else self.simulate
+        if not profile:
+            return json.dumps(run(*args))
+        return self.profile_run(run, *args)
+
+    def trace_run(self, file_name: str, run, *args):
+        # run simulation sending pipeline events to a trace file (see trace.Tracer)
+        with Tracer(self, get_sink(file_name)):
+            return run(*args)
+
+    def get_results_batch(self, processJSON, configs: list, niters: int = 3) -> str:
+        # summary results (batch.SUMMARY_KEYS) for a list of configurations, each one a dict of
+        #   Process fields overriding processJSON, simulated together (requires NumPy)
+        from .batch import simulate_batch
+        return json.dumps(simulate_batch(processJSON, configs, niters))
+
+    def get_results_multicore(self, processJSON, niters: int = 3, cores: int = 2, channels: int = 1,
+                              interleave: int = 0, llc_blocks: int = 0, llc_latency: int = 10,
+                              shared_data: bool = False) -> str:
+        # C cores running the kernel in lockstep with shared memory channels (see multicore)
+        from .multicore import simulate_multicore
+        return json.dumps(simulate_multicore(processJSON, niters, cores, channels, interleave,
+                                             llc_blocks, llc_latency, shared_data))
+
+    def get_results_sampled(self, processJSON, niters: int, samples: int = 30, sample_iters: int = 20,
+                            warmup_iters: int = 10, seed: int = 0) -> str:
+        # estimate of cycles per iteration (with confidence interval) for very long runs, simulating
+        #   in detail only periodic windows of sample_iters iterations, with warmup_iters to
+        #   2*warmup_iters iterations before each one and warmup_iters after it (see sampling)
+        from .sampling import simulate_sampled
+        return json.dumps(simulate_sampled(processJSON, niters, samples, sample_iters, warmup_iters, seed))
+
+    def simulate(self, processJSON, niters: int = 3, resume: bool = False, layout_iters: int = 0,
+                 warmup: int = 0, timeseries: int = 0) -> dict:
+        for update in self.simulation(processJSON, niters, resume, layout_iters, warmup=warmup,
+                                      timeseries=timeseries):
+            pass
+        return update["results"]
+
+    def simulation(self, processJSON, niters: int = 3, resume: bool = False, layout_iters: int = 0,
+                   step_cycles: int = 0, partial: bool = False, warmup: int = 0, timeseries: int = 0):
+
+        # Generator version of simulate: every step_cycles simulated cycles (never if 0) yields
+        #   {"done": False, "retired", "total", "cycles", "progress"} (+ "partial" statistics),
+        #   and finally {"done": True, ..., "results": <get_results dictionary>}.
+        # To cancel, stop iterating (and close the generator). Starting another simulation on
+        #   this scheduler supersedes a pending one, which then stops at its next step.
+        # resume: start from the snapshot of a previous run of the same configuration with
+        #   niters or fewer iterations, and store a new snapshot for later extensions.
+        #   Resumed results are identical to a full run only if the address layout is
+        #   the same: use the same layout_iters (e.g., maximum niters) for all runs.
+        # warmup: the first warmup iterations are simulated but not measured: IPC, ports, misses,
+        #   memory, critical path and stalls cover only the cycles after the last instruction of
+        #   iteration warmup-1 retires. total_* fields always cover the whole run.
+        # timeseries: if not 0, results include a "timeseries" of pipeline utilisation in at most
+        #   that many bins (see timeseries.PipelineSeries), from the first simulated cycle
+
+        if not 0 <= warmup < niters:
+            raise ValueError(f"warmup ({warmup}) must be smaller than the number of iterations ({niters})")
+
+        self.run_id += 1
+        run_id = self.run_id
+        ports  = self.configure(processJSON, niters, layout_iters)
+
+        if self.cache is not None:
+            self.cache.set_statistics(_program.n, _program.array_addrs)
+
+        counters = {"retired": 0, "last_ret_cycle": 0, "last_disp_cycle": 0,
+                    "MM_writes": 0, "Reads": 0, "RdMisses": 0, "Writes": 0, "WrMisses": 0, "S2Misses": 0, "Forwarded": 0,
+                    "port_usage": {port:0 for port in ports}, "iter_end": []}
+        stalls   = StallCounters(self.num_instr, self.retrWidth)
+        warm_n   = warmup * self.num_instr
+
+        key        = self.get_checkpoint_key(processJSON, layout_iters)
+        checkpoint = self.checkpoints.get(key) if resume else None
+        if checkpoint is not None and warm_n and checkpoint["counters"]["retired"] > warm_n:
+            checkpoint = None   # snapshot is past the end of the warm-up: no baseline for statistics
+
+        baseline = None if warm_n else self.get_baseline(counters, stalls)   # no warm-up: from cycle 0
+
+        if checkpoint is not None and checkpoint["n"] <= self.n:
+            counters, ExecGraph = self.set_state(checkpoint, stalls)
+            self.dispatch()   # snapshot was taken just before dispatch stage
+            if self.queue_stall is not None:
+                stalls.dispatch_stall(self.pc % self.num_instr, self.queue_stall)
         else:
-            self.cache = None
+            ExecGraph  = ex.generate_execution_graph( self.num_instr, self.n, self.window_size, self.DepEdges )
+
+        retired         = counters["retired"]
+        last_ret_cycle  = counters["last_ret_cycle"]
+        last_disp_cycle = counters["last_disp_cycle"]
+        MM_writes, Reads, RdMisses = counters["MM_writes"], counters["Reads"], counters["RdMisses"]
+        Writes, WrMisses, S2Misses = counters["Writes"], counters["WrMisses"], counters["S2Misses"]
+        Forwarded       = counters["Forwarded"]
+        port_usage      = counters["port_usage"]
+        iter_end        = counters["iter_end"]     # cycle when last instruction of each iteration retires
+        next_iter       = (len(iter_end) + 1) * self.num_instr
+        snapshot        = None
+        next_step       = self.cycles + step_cycles
+        series          = PipelineSeries(ports, timeseries, self.cycles) if timeseries else None
 
-        self.num_instr  = _program.n
-        self.n          = niters*self.num_instr
-        self.pc         = 0
-        self.cycles     = 0
-        self.dispatched = 0
-
-        retired         = 0
-        last_ret_cycle  = 0
-        last_disp_cycle = 0
-        MM_writes, Reads, RdMisses, Writes, WrMisses, S2Misses = 0, 0, 0, 0, 0, 0
-
-        all_ports = 0
-        for instr in _program.instruction_list:
-            all_ports |= instr.ports
-        self.port_mask = all_ports
-
-        # list of used ports and number of used ports
-        ports        = [i for i in range(32) if (all_ports >> i) & 1]
-        self.n_ports = len(ports)
-        port_usage   = {port:0 for port in ports}
+        while retired < self.n:
 
-        ExecGraph  = ex.generate_execution_graph( self.num_instr, self.n, self.window_size, self.DepEdges )
+            if step_cycles and self.cycles >= next_step:
+                next_step = self.cycles + step_cycles
+                update    = {"done": False, "retired": retired, "total": self.n,
+                             "cycles": self.cycles, "progress": retired / self.n}
+                if partial:
+                    update["partial"] = self.get_partial_statistics(retired, port_usage, Reads, RdMisses,
+                                                                    Writes, WrMisses, S2Misses)
+                yield update
+                if self.run_id != run_id:   # superseded by a newer simulation
+                    return
 
-        while retired < self.n:
             retires, used_ports, ReadMisses, SecondMisses, WriteMisses, MMupdates = self.next_cycle()
+            stalls.update(self.window, retires)
 
             for idx in ReadMisses:
                 if idx < self.n:
@@ -476,44 +778,153 @@ class Scheduler:
                 last_ret_cycle  = self.cycles
                 exec_latency    = r_instr.exec_lat
                 ex.exec_graph_update ( ExecGraph, dynamic_idx, disp_latency, exec_latency, ret_latency )
+                if r_instr.memory:
+                    self.retire_memory( ExecGraph, r_instr )
 
                 if r_instr.memory != 0:  # LOAD or STORE
                     if r_instr.memory == 1:  # LOAD
                         Reads += 1
+                        Forwarded += r_instr.forwarded
                     elif r_instr.memory == 2:  # STORE
                         Writes += 1
 
                 retired += 1
+                if retired == next_iter:
+                    iter_end.append(self.cycles)
+                    next_iter += self.num_instr
                 if retired >= self.n:
                     break
 
             self.window.pop(retires)
-            self.dispatch()
 
+            if resume and snapshot is None and self.dispatch_limited():
+                counters = {"retired": retired, "last_ret_cycle": last_ret_cycle, "last_disp_cycle": last_disp_cycle,
+                            "MM_writes": MM_writes, "Reads": Reads, "RdMisses": RdMisses,
+                            "Writes": Writes, "WrMisses": WrMisses, "S2Misses": S2Misses, "Forwarded": Forwarded,
+                            "port_usage": port_usage, "iter_end": iter_end}
+                snapshot = self.get_state(counters, stalls, ExecGraph)
+
+            if series is None:
+                self.dispatch()
+            else:
+                dispatched = self.dispatched
+                self.dispatch()
+                series.sample(self.window, used_ports, retires, self.dispatched - dispatched)
+            if self.queue_stall is not None:   # next instruction waits for a load/store queue entry
+                stalls.dispatch_stall(self.pc % self.num_instr, self.queue_stall)
+
+            if baseline is None and retired >= warm_n:   # end of warm-up: measured region starts next cycle
+                baseline = self.get_baseline({"MM_writes": MM_writes, "Reads": Reads, "RdMisses": RdMisses,
+                                              "Writes": Writes, "WrMisses": WrMisses, "S2Misses": S2Misses,
+                                              "Forwarded": Forwarded, "port_usage": port_usage}, stalls)
+
+        if snapshot is not None:
+            self.checkpoints.pop(key, None)
+            if len(self.checkpoints) >= self.max_checkpoints:   # forget oldest configuration
+                self.checkpoints.pop(next(iter(self.checkpoints)))
+            self.checkpoints[key] = snapshot
+
+        # statistics of measured region: counters minus their value at the end of the warm-up
         critical_path   = ex.longest_path(ExecGraph)
-        cycles_per_iter = self.cycles / self.iterations
-        IPC             = self.n      / self.cycles
+        critical_path   = [node for node in critical_path if node[0] >= 3*warm_n] if warm_n else critical_path
+        cycles          = self.cycles - baseline["cycles"]
+        cycles_per_iter = cycles / (self.iterations - warmup)
+        IPC             = (self.n - warm_n) / cycles
+        RdMisses       -= baseline["RdMisses"]
+        WrMisses       -= baseline["WrMisses"]
+        MM_writes      -= baseline["MM_writes"]
 
         out = {}
         out["total_iterations"]     = self.iterations
         out["total_instructions"]   = self.n
         out["total_cycles"]         = self.cycles
+        out["warmup"]               = {"iterations": warmup, "cycles": baseline["cycles"]}
         out["ipc"]                  = IPC
         out["cycles_per_iteration"] = cycles_per_iter
         out["ports"] = {}
         for port in ports:
-           usage = port_usage[port]/self.cycles
+           usage = (port_usage[port] - baseline["port_usage"][port])/cycles
            out["ports"][str(port)] = usage*100
 
-        out["reads"]          = Reads
+        out["reads"]          = Reads - baseline["Reads"]
         out["read_misses"]    = RdMisses
-        out["writes"]         = Writes
+        out["writes"]         = Writes - baseline["Writes"]
         out["write_misses"]   = WrMisses
-        out["second_misses"]  = S2Misses
+        out["second_misses"]  = S2Misses - baseline["S2Misses"]
         out["MM_Reads"]       = RdMisses+WrMisses
+        if self.mem_deps:  # loads served by store-to-load forwarding (included in reads)
+            out["forwarded_loads"] = Forwarded - baseline["Forwarded"]
         out["MM_Writes"]      = MM_writes
-
-        out["critical_path"]   = ex.critical_path_statistics_json(self.num_instr, _program.instruction_list, critical_path)
-        return json.dumps(out)
+        if self.cache is not None:  # stores sent to memory through the write buffer, not allocated on miss
+            noalloc_misses, buffer_writes = baseline["cache"]["counters"]
+            out["write_misses"] += self.cache.NOALLOC_MISSES - noalloc_misses
+            out["MM_Writes"]    += self.cache.BUFFER_WRITES - buffer_writes
+
+        if self.cache is not None:  # breakdown of cache accesses per static instruction and per array
+            out["memory"] = self.cache.get_statistics([instr.text for instr in _program.instruction_list],
+                                                      _program.arrays, baseline["cache"])
+
+        out["critical_path"]    = ex.critical_path_statistics_json(self.num_instr, _program.instruction_list, critical_path)
+        out["stalls"]           = stalls.json(_program.instruction_list, baseline["stalls"])
+        out["iteration_cycles"] = get_iteration_series(iter_end, warmup)
+        self.iter_end           = iter_end
+        if series is not None:
+            out["timeseries"]   = series.json()
+        yield {"done": True, "retired": self.n, "total": self.n, "cycles": self.cycles, "progress": 1.0,
+               "results": out}
+
+    def get_partial_statistics(self, retired, port_usage, Reads, RdMisses, Writes, WrMisses, S2Misses) -> dict:
+        # statistics of the simulation so far (misses are counted when they happen, reads
+        #   and writes when the instruction retires)
+        cycles = max(self.cycles, 1)
+        out = {}
+        out["retired_instructions"] = retired
+        out["ipc"]                  = retired / cycles
+        out["cycles_per_iteration"] = cycles * self.num_instr / retired if retired else 0.0
+        out["ports"]                = {str(port): usage*100/cycles for port, usage in port_usage.items()}
+        out["reads"]                = Reads
+        out["read_misses"]          = RdMisses
+        out["writes"]               = Writes
+        out["write_misses"]         = WrMisses
+        out["second_misses"]        = S2Misses
+        return out
+
+    async def get_results_async(self, processJSON, niters: int = 3, step_cycles: int = 1000,
+                                progress = None, partial: bool = False) -> str:
+        # asyncio variant of get_results: gives control back to the event loop every step_cycles
+        #   cycles, calling progress(update) if given (see simulation). Cancelling the task
+        #   stops the simulation; returns None if superseded by another simulation.
+        import asyncio   # not imported with the package: slow to load on Pyodide
+        run = self.simulation(processJSON, niters, step_cycles=step_cycles, partial=partial)
+        try:
+            for update in run:
+                if update["done"]:
+                    return json.dumps(update["results"])
+                if progress:
+                    progress(update)
+                await asyncio.sleep(0)
+        finally:
+            run.close()
+        return None
+
+def get_iteration_series(iter_end: list, first: int = 0, max_bins: int = 64, tolerance: float = 0.02) -> dict:
+    # cycles of each iteration from first on (iter_end: cycle when each iteration retires),
+    #   averaged in at most max_bins bins of consecutive iterations. Converged if the mean
+    #   cycles per iteration of both halves of the series differ by less than tolerance.
+    series = [iter_end[i] - (iter_end[i-1] if i else 0) for i in range(first, len(iter_end))]
+    width  = max(-(-len(series) // max_bins), 1)
+    bins   = [sum(series[i:i+width]) / len(series[i:i+width]) for i in range(0, len(series), width)]
+    out    = {"bin_width": width, "bins": bins}
+    half   = len(series) // 2
+    if half:
+        first_half  = sum(series[:half]) / half
+        second_half = sum(series[half:]) / (len(series) - half)
+        out["first_half"]      = first_half
+        out["second_half"]     = second_half
+        out["relative_change"] = abs(second_half - first_half) / second_half
+        out["converged"]       = out["relative_change"] < tolerance
+    else:
+        out["converged"]       = False
+    return out
 
 _scheduler = Scheduler()
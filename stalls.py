@@ -0,0 +1,115 @@
+from .window import InstrState
+
+# Top-down style stall accounting for Scheduler.get_results, without any timeline.
+# Every cycle:
+#   - unused retire slots (retire width - retired instructions) are lost slots, and a cycle
+#     with no retirement is a lost cycle; both are blamed on the state of the oldest
+#     instruction in the window (the one blocking retirement), or on an empty window.
+#   - each instruction in the window with a wait substate adds one wait slot to that cause.
+#   - a cycle in which dispatch stops before an instruction for lack of a load/store queue
+#     entry is a dispatch stall cycle of that instruction (see Scheduler.queue_full).
+# Counters are preallocated per static instruction and per cause (InstrState member).
+# Note: WAIT_BANDWIDTH and WAIT_RESOURCE share the same symbol, so Enum makes them the same
+#   member (also WAIT_MM_REQ_UPDT/WAIT_MM_REQUEST, WAIT_MM_RDY_UPDT/WAIT_MM_READY).
+
+class StallCounters:
+
+    def __init__(self, num_instr: int, retire_width: int) -> None:
+        self.causes      = list(InstrState)   # aliases are not listed
+        self.cause_idx   = {state._value_: i for i, state in enumerate(self.causes)}  # str keys hash faster than Enum
+        self.num_instr   = num_instr
+        self.retire_width= retire_width
+        self.cycles      = 0
+        self.wait_slots  = [[0]*len(self.causes) for _ in range(num_instr)]
+        self.lost_slots  = [[0]*len(self.causes) for _ in range(num_instr+1)]  # last row: empty window
+        self.lost_cycles = [[0]*len(self.causes) for _ in range(num_instr+1)]
+        self.disp_cycles = [[0]*len(self.causes) for _ in range(num_instr)]
+
+    # serialisable state, used for simulation checkpoints
+    def get_state(self) -> dict:
+        return {"cycles":      self.cycles,
+                "wait_slots":  [row[:] for row in self.wait_slots],
+                "lost_slots":  [row[:] for row in self.lost_slots],
+                "lost_cycles": [row[:] for row in self.lost_cycles],
+                "disp_cycles": [row[:] for row in self.disp_cycles]}
+
+    def set_state(self, state: dict) -> None:
+        self.cycles      = state["cycles"]
+        self.wait_slots  = [row[:] for row in state["wait_slots"]]
+        self.lost_slots  = [row[:] for row in state["lost_slots"]]
+        self.lost_cycles = [row[:] for row in state["lost_cycles"]]
+        self.disp_cycles = [row[:] for row in state["disp_cycles"]]
+
+    # call after next_cycle(), before retired instructions are popped from window
+    def update(self, window, retires: int) -> None:
+        self.cycles += 1
+        cause_idx  = self.cause_idx
+        wait_slots = self.wait_slots
+        none       = InstrState.NONE
+        buffer, first, size = window.buffer, window.first, window.size   # avoid Window.__getitem__
+
+        for window_idx in range(first+retires, first+window.count):
+            instr = buffer[window_idx % size]
+            if instr.substate is not none:
+                wait_slots[instr.s_idx][cause_idx[instr.substate._value_]] += 1
+
+        lost = self.retire_width - retires
+        if lost <= 0:
+            return
+
+        if retires < window.count:
+            head  = window[retires]
+            row   = head.s_idx
+            cause = head.substate if head.substate != InstrState.NONE else head.state
+        else:
+            row   = self.num_instr
+            cause = InstrState.NONE
+
+        self.lost_slots[row][cause_idx[cause._value_]] += lost
+        if retires == 0:
+            self.lost_cycles[row][cause_idx[cause._value_]] += 1
+
+    # call after dispatch(), if an instruction could not be dispatched for the given cause
+    def dispatch_stall(self, static_idx: int, cause) -> None:
+        self.disp_cycles[static_idx][self.cause_idx[cause._value_]] += 1
+
+    def get_cause_name(self, i: int) -> str:
+        state = self.causes[i]
+        return "EMPTY" if state == InstrState.NONE else state.name
+
+    # since: get_state() at the start of the measured region (default: reset)
+    def json(self, instr_list, since: dict = None) -> dict:
+        cycles, wait_slots, lost_slots, lost_cycles = self.cycles, self.wait_slots, self.lost_slots, self.lost_cycles
+        disp_cycles = self.disp_cycles
+        if since is not None:
+            def diff(rows, base):
+                return [[a-b for a, b in zip(row, base_row)] for row, base_row in zip(rows, base)]
+            cycles      = cycles - since["cycles"]
+            wait_slots  = diff(wait_slots,  since["wait_slots"])
+            lost_slots  = diff(lost_slots,  since["lost_slots"])
+            lost_cycles = diff(lost_cycles, since["lost_cycles"])
+            disp_cycles = diff(disp_cycles, since["disp_cycles"])
+
+        def summary(row):
+            return {self.get_cause_name(i): row[i] for i in range(len(self.causes)) if row[i]}
+
+        def add(rows):
+            return [sum(col) for col in zip(*rows)] if rows else [0]*len(self.causes)
+
+        out = {}
+        out["retire_slots"] = cycles * self.retire_width
+        out["lost_cycles"]  = summary(add(lost_cycles))
+        out["lost_slots"]   = summary(add(lost_slots))
+        out["wait_slots"]   = summary(add(wait_slots))
+        if any(add(disp_cycles)):   # only with load/store queue limits
+            out["dispatch_stalls"] = summary(add(disp_cycles))
+        out["instructions"] = []
+        for i in range(self.num_instr):
+            out["instructions"].append({"id":          i,
+                                        "instruction": instr_list[i].text,
+                                        "lost_cycles": summary(lost_cycles[i]),
+                                        "lost_slots":  summary(lost_slots[i]),
+                                        "wait_slots":  summary(wait_slots[i])})
+            if any(disp_cycles[i]):
+                out["instructions"][i]["dispatch_stalls"] = summary(disp_cycles[i])
+        return out
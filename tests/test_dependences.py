@@ -0,0 +1,82 @@
+import json
+import random
+import re
+
+from rvcat.program import Program
+
+# Recurrence bounds (maximum cycle ratio per strongly connected component) and incremental
+# reanalysis of edited programs (Program.edit_instruction_list)
+
+def instr(type, dest="", src1="", src2="", const="", lat=1, ports=1, stride=1):
+    return {"type": type, "oper": "ADD", "text": "op", "destin": dest, "source1": src1,
+            "source2": src2, "source3": "", "constant": const, "latency": lat, "ports": ports,
+            "size": "word", "stride": stride, "lanes": 1}
+
+# The recurrence i0 -> i1 -> i2 -> i0 (1+3+2 cycles in one iteration) was missed by the
+#   elementary-cycle enumeration used before, which reported LatencyTime 5.0 (i0 -> i3 -> i0)
+MISSED_RECURRENCE = [
+    instr("FLOAT", "x1", "x3", "x5", lat=1, ports=6),
+    instr("INT",   "x4", "x3", "x1", lat=3, ports=4),
+    instr("FLOAT", "x5", "x2", "x4", lat=2, ports=9),
+    instr("FLOAT", "x3", "x1", "x1", lat=4, ports=12),
+    instr("FLOAT", "x6", "x4", "x2", lat=4, ports=11),
+]
+
+def test_recurrence_bound():
+    program  = Program()
+    analysis = json.loads(program.get_performance_analysis({"name": "recurrence", "dispatch": 2, "retire": 2,
+                                                            "instruction_list": MISSED_RECURRENCE}))
+    assert analysis["LatencyTime"] == 6.0
+    assert analysis["BestTime"] == 6.0
+    assert analysis["performance-bound"] == "LATENCY"
+    assert [0, 1, 2, 0] in program.cyclic_paths
+
+def random_instr(rng):
+    regs = ["a", "b", "c", "d", "e"]
+    return instr(rng.choice(["INT", "INT", "MEM", "BRANCH"]), rng.choice(regs + [""]), rng.choice(regs + [""]),
+                 rng.choice(regs + ["X", ""]), rng.choice(["", "", "4", "8"]), rng.randint(1, 5),
+                 stride=rng.choice([1, 1, 2]))
+
+def summary(program):
+    # analysis results of a loaded program; variable and constant numbers (in dependences and
+    #   graphviz nodes) depend on set order, not on the program: compared by name
+    graph = program.show_graphviz(None, 0, True, True, False, True)
+    deps  = [[(dep, program.constants[var]) if dep == -1 else (dep, program.variables[var]) for dep, var in deps]
+             for deps in program.inst_dependence_list]
+    return {"dependences":  deps,
+            "variables":    sorted(program.variables),
+            "constants":    sorted(program.constants),
+            "read_only":    sorted(program.read_only),
+            "loop_carried": sorted(program.loop_carried),
+            "cyclic_paths": program.cyclic_paths,
+            "inst_cyclic":  sorted(program.inst_cyclic),
+            "critical":     program.get_critical_latencies(),
+            "arrays":       program.arrays,
+            "graphviz":     sorted(re.sub(r"(RdOnly|Const|LoopCar|OutCar)\d+", r"\1", graph).splitlines())}
+
+def test_edits_match_fresh_load():
+    rng = random.Random(1)
+    for _ in range(300):
+        instrs  = [random_instr(rng) for _ in range(rng.randint(0, 7))]
+        program = Program()
+        program.load_instruction_list(instrs)
+        for _ in range(4):
+            edits = []
+            for _ in range(rng.randint(1, 2)):
+                op = rng.choice(["insert", "delete", "replace"])
+                if op == "insert" or not instrs:
+                    index = rng.randint(0, len(instrs))
+                    instrs.insert(index, random_instr(rng))
+                    edits.append({"op": "insert", "index": index, "instruction": instrs[index]})
+                elif op == "delete":
+                    index = rng.randrange(len(instrs))
+                    del instrs[index]
+                    edits.append({"op": "delete", "index": index})
+                else:
+                    index = rng.randrange(len(instrs))
+                    instrs[index] = random_instr(rng)
+                    edits.append({"op": "replace", "index": index, "instruction": instrs[index]})
+            program.edit_instruction_list(edits)
+            fresh = Program()
+            fresh.load_instruction_list(instrs)
+            assert summary(program) == summary(fresh), instrs
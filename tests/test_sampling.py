@@ -0,0 +1,23 @@
+import pytest
+
+from rvcat.interval_model import load_reference_suite
+from rvcat.sampling import simulate_sampled
+from rvcat.scheduler import Scheduler
+
+# Coverage of the confidence interval of sampled simulations: over the kernel suite, the cycles
+# per iteration of the full run (steady state: without the first and last warmup iterations,
+# that fill and drain the pipeline) must fall inside the interval
+
+NITERS = 2000
+WARMUP = 10
+
+@pytest.mark.parametrize("config", [{}, {"nBlocks": 4, "mPenalty": 40}])
+@pytest.mark.parametrize("kernel", load_reference_suite(), ids=lambda kernel: kernel["name"])
+def test_interval_coverage(kernel, config):
+    processJSON = dict(kernel, **config)
+    full = Scheduler()
+    full.simulate(processJSON, NITERS)
+    steady  = (full.iter_end[NITERS-WARMUP-1] - full.iter_end[WARMUP-1]) / (NITERS - 2*WARMUP)
+    sampled = simulate_sampled(processJSON, NITERS, warmup_iters=WARMUP)
+    assert sampled["sampled"]
+    assert sampled["ci_low"] <= steady <= sampled["ci_high"]
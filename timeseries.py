@@ -0,0 +1,89 @@
+from .window import InstrState
+
+# Time series of per-cycle metrics in a fixed number of bins of consecutive cycles.
+# The bin width starts at one cycle; when all bins are full, pairs of adjacent bins are
+# merged and the width doubles, so any run length is summarised in at most max_bins bins
+# (O(bins) memory). Each bin keeps the sum of every metric over its cycles.
+
+class BinnedSeries:
+
+    def __init__(self, names: list, max_bins: int = 128, start_cycle: int = 0) -> None:
+        self.names       = list(names)
+        self.max_bins    = max(max_bins - max_bins % 2, 2)   # even: bins are merged in pairs
+        self.start_cycle = start_cycle
+        self.width       = 1     # cycles per bin (except last one, still filling)
+        self.count       = 0     # full bins
+        self.fill        = 0     # cycles in last bin
+        self.bins        = [[0]*len(self.names) for _ in range(self.max_bins)]
+
+    def add(self, values) -> None:
+        # values of all metrics on one cycle, in the order of names
+        if self.fill == self.width:
+            self.count += 1
+            self.fill   = 0
+            if self.count == self.max_bins:
+                self.merge()
+        row = self.bins[self.count]
+        for i, value in enumerate(values):
+            row[i] += value
+        self.fill += 1
+
+    def merge(self) -> None:
+        half = self.max_bins // 2
+        for i in range(half):
+            first, second = self.bins[2*i], self.bins[2*i+1]
+            self.bins[i]  = [a+b for a, b in zip(first, second)]
+        for i in range(half, self.max_bins):
+            self.bins[i] = [0]*len(self.names)
+        self.count  = half
+        self.width *= 2
+
+    def get_bins(self) -> list:
+        # (first cycle, cycles, sums) of each non-empty bin
+        out = []
+        for i in range(self.count + (self.fill > 0)):
+            cycles = self.width if i < self.count else self.fill
+            out.append((self.start_cycle + i*self.width, cycles, self.bins[i]))
+        return out
+
+    def json(self) -> dict:
+        # per-cycle average of each metric in each bin
+        bins = self.get_bins()
+        out  = {"bin_width": self.width, "cycle": [first for first, _, _ in bins]}
+        for i, name in enumerate(self.names):
+            out[name] = [sums[i] / cycles for _, cycles, sums in bins]
+        return out
+
+# Pipeline utilisation over time, for Scheduler simulation loops: busy fraction of each
+# port (percentage), ROB occupancy, dispatched and retired instructions per cycle, and
+# instructions waiting for a cache miss (outstanding misses)
+
+MISS_STATES = [InstrState.WAIT_MM_REQUEST, InstrState.WAIT_MM_READY, InstrState.WAIT_DATA_READY,
+               InstrState.WAIT_CACHE_2ND, InstrState.MM_UPDATE]   # as trace.MEMORY_STATES
+
+class PipelineSeries(BinnedSeries):
+
+    def __init__(self, ports: list, max_bins: int = 128, start_cycle: int = 0) -> None:
+        self.ports = ports
+        super().__init__([f"port{port}" for port in ports] +
+                         ["rob_occupancy", "dispatch", "retire", "outstanding_misses"], max_bins, start_cycle)
+
+    # call once per cycle, after dispatch
+    def sample(self, window, used_ports, retires: int, dispatched: int) -> None:
+        buffer, first, size = window.buffer, window.first, window.size   # avoid Window.__getitem__
+        request, ready, data, second, update = MISS_STATES   # identity tests: hashing Enum members is slow
+        misses = 0
+        for window_idx in range(first, first+window.count):
+            substate = buffer[window_idx % size].substate
+            if substate is request or substate is ready or substate is data or substate is second or substate is update:
+                misses += 1
+        self.add([100 if used_ports[port] else 0 for port in self.ports] +
+                 [window.count, dispatched, retires, misses])
+
+    def json(self) -> dict:
+        series = super().json()
+        out    = {"bin_width": series["bin_width"], "cycle": series["cycle"],
+                  "ports": {str(port): series[f"port{port}"] for port in self.ports}}
+        for name in self.names[len(self.ports):]:
+            out[name] = series[name]
+        return out
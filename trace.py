@@ -0,0 +1,222 @@
+import json
+from .window  import InstrState
+from .program import _program
+
+# Opt-in pipeline event tracing. While a Tracer is active, Scheduler.next_cycle and dispatch
+# are wrapped (instance attributes, as in Profiler) to compare the state of the instructions
+# in the window before and after each call, and send events to a sink:
+#   dispatch, issue (with port), memory substate changes, writeback and retire.
+# When tracing is off nothing is wrapped, so the simulator runs the original code.
+# Sinks write buffered text to a file:
+#   ChromeTraceSink: Chrome trace-event JSON (chrome://tracing, Perfetto); one track per
+#     window (ROB) entry, one slice per pipeline stage, 1 cycle = 1 us
+#   KanataSink:      Kanata log (Konata pipeline viewer)
+#   NullSink:        discards events
+
+BUFFER_EVENTS = 4096   # events kept in memory before writing them to the file
+
+MEMORY_STATES = {InstrState.WAIT_MM_REQUEST, InstrState.WAIT_MM_READY, InstrState.WAIT_DATA_READY,
+                 InstrState.WAIT_CACHE_2ND, InstrState.MM_UPDATE}
+
+class NullSink:
+
+    def begin(self, window_size: int) -> None:
+        pass
+
+    def dispatch(self, cycle: int, d_idx: int, s_idx: int) -> None:
+        pass
+
+    def issue(self, cycle: int, d_idx: int, port: int) -> None:
+        pass
+
+    def memory(self, cycle: int, d_idx: int, substate: str) -> None:
+        pass
+
+    def writeback(self, cycle: int, d_idx: int) -> None:
+        pass
+
+    def retire(self, cycle: int, d_idx: int) -> None:
+        pass
+
+    def close(self, cycle: int) -> None:
+        pass
+
+class BufferedSink(NullSink):
+
+    def __init__(self, file_name: str) -> None:
+        self.file   = open(file_name, "w")
+        self.buffer = []
+
+    def write(self, line: str) -> None:
+        self.buffer.append(line)
+        if len(self.buffer) >= BUFFER_EVENTS:
+            self.flush()
+
+    def flush(self) -> None:
+        self.file.write("".join(self.buffer))
+        self.buffer = []
+
+    def close(self, cycle: int) -> None:
+        self.flush()
+        self.file.close()
+
+class ChromeTraceSink(BufferedSink):
+
+    def begin(self, window_size: int) -> None:
+        self.window_size = window_size
+        self.stages      = {}    # d_idx -> [stage name, start cycle, args] of open stage
+        self.first       = True
+        self.file.write('{"displayTimeUnit": "ms", "traceEvents": [\n')
+        for slot in range(window_size):
+            self.event({"name": "thread_name", "ph": "M", "pid": 0, "tid": slot, "args": {"name": f"ROB {slot}"}})
+
+    def event(self, event: dict) -> None:
+        self.write(("" if self.first else ",\n") + json.dumps(event))
+        self.first = False
+
+    def stage(self, cycle: int, d_idx: int, name: str, **args) -> None:
+        # close open stage of the instruction and open a new one (if name)
+        if d_idx in self.stages:
+            stage, start, stage_args = self.stages.pop(d_idx)
+            self.event({"name": stage, "ph": "X", "pid": 0, "tid": d_idx % self.window_size,
+                        "ts": start, "dur": cycle - start, "args": stage_args})
+        if name:
+            self.stages[d_idx] = [name, cycle, dict(self.instr_args(d_idx), **args)]
+
+    def instr_args(self, d_idx: int) -> dict:
+        instr = _program.instruction_list[d_idx % _program.n]
+        return {"instruction": d_idx, "iteration": d_idx // _program.n, "text": instr.text}
+
+    def dispatch(self, cycle, d_idx, s_idx):
+        self.stage(cycle, d_idx, "dispatch")
+
+    def issue(self, cycle, d_idx, port):
+        self.stage(cycle, d_idx, "execute", port=port)
+
+    def memory(self, cycle, d_idx, substate):
+        self.stage(cycle, d_idx, substate)
+
+    def writeback(self, cycle, d_idx):
+        self.stage(cycle, d_idx, "writeback")
+
+    def retire(self, cycle, d_idx):
+        self.stage(cycle, d_idx, "")
+
+    def close(self, cycle):
+        for d_idx in list(self.stages):
+            self.stage(cycle, d_idx, "")
+        self.write("\n]}\n")
+        super().close(cycle)
+
+class KanataSink(BufferedSink):
+
+    def begin(self, window_size: int) -> None:
+        self.cycle  = 0
+        self.stages = {}    # d_idx -> open stage
+        self.file.write("Kanata\t0004\nC=\t0\n")
+
+    def stage(self, cycle: int, d_idx: int, name: str) -> None:
+        # end open stage of the instruction and start a new one (if name)
+        if cycle > self.cycle:
+            self.write(f"C\t{cycle - self.cycle}\n")
+            self.cycle = cycle
+        if d_idx in self.stages:
+            self.write(f"E\t{d_idx}\t0\t{self.stages.pop(d_idx)}\n")
+        if name:
+            self.write(f"S\t{d_idx}\t0\t{name}\n")
+            self.stages[d_idx] = name
+
+    def dispatch(self, cycle, d_idx, s_idx):
+        self.write(f"I\t{d_idx}\t{d_idx}\t0\nL\t{d_idx}\t0\t{_program.instruction_list[s_idx].text}\n")
+        self.stage(cycle, d_idx, "D")
+
+    def issue(self, cycle, d_idx, port):
+        self.stage(cycle, d_idx, "X")
+        self.write(f"L\t{d_idx}\t1\tport {port}\n")
+
+    def memory(self, cycle, d_idx, substate):
+        self.stage(cycle, d_idx, substate)
+
+    def writeback(self, cycle, d_idx):
+        self.stage(cycle, d_idx, "W")
+
+    def retire(self, cycle, d_idx):
+        self.stage(cycle, d_idx, "")
+        self.write(f"R\t{d_idx}\t{d_idx}\t0\n")
+
+def get_sink(file_name: str):
+    # sink for a trace file: Kanata log if file_name ends with .kanata or .log, else Chrome JSON
+    if not file_name:
+        return NullSink()
+    if file_name.endswith((".kanata", ".log")):
+        return KanataSink(file_name)
+    return ChromeTraceSink(file_name)
+
+class Tracer:
+
+    def __init__(self, scheduler, sink) -> None:
+        self.scheduler = scheduler
+        self.sink      = sink
+        self.states    = {}     # d_idx -> (state, substate) observed after last call
+        self.patched   = []
+        self.started   = False
+
+    def __enter__(self):
+        self.patch("next_cycle", self.next_cycle)
+        self.patch("dispatch",   self.dispatch)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        for name, original in reversed(self.patched):
+            if original is None:   # was a method found through the class
+                delattr(self.scheduler, name)
+            else:
+                setattr(self.scheduler, name, original)
+        self.patched = []
+        if not self.started:
+            self.sink.begin(self.scheduler.window.size)
+        self.sink.close(self.scheduler.cycles)
+
+    def patch(self, name: str, wrapper) -> None:
+        original = vars(self.scheduler).get(name)
+        self.patched.append((name, original))
+        func = getattr(self.scheduler, name)
+        setattr(self.scheduler, name, lambda: wrapper(func))
+
+    def next_cycle(self, func):
+        result = func()
+        cycle  = self.scheduler.cycles
+        sink   = self.sink
+        states = self.states
+        for instr in self.scheduler.window:
+            d_idx = instr.d_idx
+            if d_idx not in states:   # not dispatched while tracing (resumed simulation)
+                continue
+            state, substate = states[d_idx]
+            if instr.state is not state:
+                if instr.state is InstrState.RETIRE:
+                    sink.retire(cycle, d_idx)
+                    del states[d_idx]
+                    continue
+                if instr.state is InstrState.WRITE_BACK:
+                    sink.writeback(cycle, d_idx)
+                elif state is InstrState.DISPATCH:
+                    sink.issue(cycle, d_idx, instr.port_used)
+            if instr.substate is not substate and instr.substate in MEMORY_STATES:
+                sink.memory(cycle, d_idx, instr.substate.name)
+            states[d_idx] = (instr.state, instr.substate)
+        return result
+
+    def dispatch(self, func):
+        if not self.started:   # the window is created when the simulation is configured
+            self.sink.begin(self.scheduler.window.size)
+            self.started = True
+        cycle      = self.scheduler.cycles
+        dispatched = self.scheduler.dispatched
+        result     = func()
+        window     = self.scheduler.window
+        for i in range(window.count - (self.scheduler.dispatched - dispatched), window.count):
+            instr = window[i]
+            self.states[instr.d_idx] = (instr.state, instr.substate)
+            self.sink.dispatch(cycle, instr.d_idx, instr.s_idx)
+        return result
@@ -0,0 +1,237 @@
+import json
+import re
+from multiprocessing import Pool
+from .program   import Program
+from .scheduler import Scheduler
+
+# Unroll-factor advisor (see Program.get_unroll_analysis): synthesises the loop body unrolled
+# by factor F, as it would be written by hand, and evaluates each factor:
+#   - loop control (branches, and induction variables: x = x + constant) is kept once, with
+#     the constant multiplied by F
+#   - every other instruction is copied F times; copy u writes its own version of each
+#     register (copy 0 keeps the original names, copy u appends _u)
+#   - reductions (loop-carried x = x op y, op associative, x not used elsewhere) get one
+#     accumulator per copy; other loop-carried values are chained from copy u-1 to copy u
+#   - the copies of each instruction are placed together (loads first, as in hand-unrolled
+#     code), unless a chained value requires the copies in order
+#   - memory accesses of copy u are offset by u strides, and strides are multiplied by F
+#     (with nested loops, the innermost level: its trip count must be a multiple of F)
+# A factor is evaluated with the analytic bounds of get_performance_analysis and, optionally,
+# with simulations (run on a pool of worker processes, and cached by configuration).
+
+REDUCTION_OPERS = ("ADD", "MUL", "FMA", "MAX", "MIN")
+MAX_SIMULATIONS = 64     # simulation results kept in SIMULATIONS
+SIMULATIONS     = {}     # (process, niters) JSON -> cycles per iteration
+
+def is_control(instr: dict) -> bool:
+    # branch, or induction variable update (x = x + constant)
+    if instr.get("type") == "BRANCH":
+        return True
+    return (instr.get("type") == "INT" and instr.get("destin", "") != ""
+            and instr.get("destin") == instr.get("source1")
+            and not instr.get("source2", "") and not instr.get("source3", "")
+            and instr.get("constant", "") != "")
+
+def get_sources(instr: dict) -> list:
+    # (field, register) read by the instruction; source2 of a memory access is its array
+    fields = ["source1", "source3"] if instr.get("type") in ("MEM", "VMEM") else ["source1", "source2", "source3"]
+    return [(field, instr[field]) for field in fields if instr.get(field, "")]
+
+def get_loop_carried(instrs: list) -> set:
+    # registers read in the body before being written
+    carried, written = set(), set()
+    for instr in instrs:
+        for _, reg in get_sources(instr):
+            if reg not in written:
+                carried.add(reg)
+        if instr.get("destin", ""):
+            written.add(instr["destin"])
+    return carried & written
+
+def get_reductions(instrs: list) -> set:
+    # loop-carried registers updated by an associative operation that is their only use
+    reductions = set()
+    for reg in get_loop_carried(instrs):
+        writers = [instr for instr in instrs if instr.get("destin", "") == reg]
+        readers = [instr for instr in instrs if reg in [r for _, r in get_sources(instr)]]
+        if len(writers) != 1 or readers != writers:
+            continue
+        instr = writers[0]
+        if instr.get("type") in ("MEM", "VMEM", "BRANCH") or instr.get("oper") not in REDUCTION_OPERS:
+            continue
+        if instr.get("oper") == "FMA" and instr.get("source3", "") != reg:   # accumulator is the addend
+            continue
+        reductions.add(reg)
+    return reductions
+
+def get_data_size(instr: dict) -> int:
+    size = instr.get("size", "")
+    return 4 if size == "word" else (8 if size == "long" else 1)
+
+def unroll_memory(instr: dict, factor: int, u: int) -> dict:
+    # address of copy u: offset by u strides (elements); strides multiplied by factor
+    const = int(instr["constant"]) if instr.get("constant", "") else 0
+    if instr.get("loops"):
+        trips, stride = instr["loops"][0]
+        if trips % factor:
+            raise ValueError(f"trip count of innermost loop ({trips}) is not a multiple of {factor}")
+        offset = u * stride
+        instr["loops"] = [[trips // factor, stride * factor]] + [level[:] for level in instr["loops"][1:]]
+    else:
+        stride = instr.get("stride", 1)
+        offset = u * abs(stride) * instr.get("lanes", 1)   # negative stride: offset from the end
+        instr["stride"] = stride * factor
+        stride = stride * instr.get("lanes", 1)
+    if offset:
+        instr["constant"] = str(const + offset)
+        shift = u * stride * get_data_size(instr)
+        instr["text"] = re.sub(r"(-?\d+)\(", lambda m: f"{int(m.group(1)) + shift}(", instr.get("text", ""), count=1)
+    return instr
+
+def rename_text(text: str, destin: tuple, names: dict) -> str:
+    # destin: (register, new name) of the first operand, if it is the destination;
+    #   names: new names of the source registers
+    def rename(operands):
+        return re.sub(r"[A-Za-z_][\w.]*", lambda m: names.get(m.group(0), m.group(0)), operands)
+
+    mnemonic, space, operands = text.partition(" ")
+    first = re.match(r"\s*([A-Za-z_][\w.]*)", operands)
+    if destin and first and first.group(1) == destin[0]:
+        return mnemonic + space + operands[:first.start(1)] + destin[1] + rename(operands[first.end(1):])
+    return mnemonic + space + rename(operands)
+
+def unroll_instruction_list(instrs: list, factor: int) -> list:
+    # instruction_list of the loop body unrolled factor times (see module comment)
+    if factor < 1:
+        raise ValueError(f"unroll factor must be positive (got {factor})")
+    body       = [instr for instr in instrs if not is_control(instr)]
+    control    = [instr for instr in instrs if is_control(instr)]
+    defined    = {instr["destin"] for instr in body if instr.get("destin", "")}
+    reductions = get_reductions(body)
+
+    def version(reg: str, u: int) -> str:
+        return reg if u == 0 else f"{reg}_{u}"
+
+    copies = [[] for _ in body]   # copies of each body instruction
+    for u in range(factor):
+        current = {}   # register -> its version written earlier in this copy
+        for i, instr in enumerate(body):
+            copy  = dict(instr)
+            names = {}
+            for field, reg in get_sources(instr):
+                if reg in current:
+                    name = current[reg]
+                elif reg not in defined:         # read-only, or induction variable
+                    name = reg
+                elif reg in reductions:          # own accumulator
+                    name = version(reg, u)
+                else:                            # value of previous copy (last copy of previous iteration)
+                    name = version(reg, (u - 1) % factor)
+                copy[field] = name
+                if name != reg:
+                    names[reg] = name
+            destin = None
+            if instr.get("destin", ""):
+                reg = instr["destin"]
+                current[reg]   = version(reg, u)
+                copy["destin"] = current[reg]
+                destin         = (reg, current[reg])
+            copy["text"] = rename_text(instr.get("text", ""), destin, names)
+            if instr.get("type") in ("MEM", "VMEM"):
+                copy = unroll_memory(copy, factor, u)
+            copies[i].append(copy)
+
+    if get_loop_carried(body) - reductions:   # chained values: copy after copy
+        out = [copies[i][u] for u in range(factor) for i in range(len(body))]
+    else:
+        out = [copy for instr_copies in copies for copy in instr_copies]
+
+    for instr in control:
+        copy = dict(instr)
+        if instr.get("type") != "BRANCH" and re.fullmatch(r"-?\d+", instr["constant"]):
+            copy["constant"] = str(int(instr["constant"]) * factor)
+            if copy.get("text", "").endswith(instr["constant"]):
+                copy["text"] = copy["text"][:-len(instr["constant"])] + copy["constant"]
+        out.append(copy)
+    return out
+
+def simulate_variant(job: tuple) -> float:
+    # cycles per iteration of (process, niters), in a worker process
+    processJSON, niters = job
+    return Scheduler().simulate(processJSON, niters)["cycles_per_iteration"]
+
+def simulate_variants(jobs: list, workers: int) -> list:
+    # cycles per iteration of each (process, niters) job: cached results, and the others
+    #   simulated on a pool of workers (in this process if workers <= 1)
+    keys    = [json.dumps(job, sort_keys=True) for job in jobs]
+    pending = [k for k, key in enumerate(keys) if key not in SIMULATIONS]
+    if workers > 1 and len(pending) > 1:
+        with Pool(min(workers, len(pending))) as pool:
+            results = pool.map(simulate_variant, [jobs[k] for k in pending])
+    else:
+        results = [simulate_variant(jobs[k]) for k in pending]
+    for k, result in zip(pending, results):
+        if len(SIMULATIONS) >= MAX_SIMULATIONS:   # forget oldest result
+            SIMULATIONS.pop(next(iter(SIMULATIONS)))
+        SIMULATIONS[keys[k]] = result
+    return [SIMULATIONS[key] for key in keys]
+
+def advise_unroll(processJSON, max_factor: int = 8, simulate: bool = False, niters: int = 240,
+                  workers: int = 1, tolerance: float = 0.05) -> dict:
+    # evaluate unroll factors 1..max_factor; recommend the smallest one whose cycles per
+    #   (original) iteration are within tolerance of the best throughput bound of all factors
+    #   or, if no factor reaches it (e.g., simulated cache misses), of the best factor
+    instrs = processJSON.get("instruction_list", [])
+    name   = processJSON.get("name", "")
+
+    factors, variants = [], []
+    for factor in range(1, max_factor + 1):
+        entry = {"factor": factor}
+        try:
+            unrolled = unroll_instruction_list(instrs, factor)
+        except ValueError as error:
+            entry["applicable"] = False
+            entry["reason"]     = str(error)
+            factors.append(entry)
+            continue
+        variant  = dict(processJSON, name=f"{name} x{factor}", instruction_list=unrolled)
+        analysis = json.loads(Program().get_performance_analysis(variant))
+        entry["applicable"]           = True
+        entry["instructions"]         = len(unrolled)
+        entry["latency_bound"]        = analysis["LatencyTime"] / factor
+        entry["throughput_bound"]     = analysis["ThroughputTime"] / factor
+        entry["performance-bound"]    = analysis["performance-bound"]
+        entry["cycles_per_iteration"] = analysis["BestTime"] / factor
+        factors.append(entry)
+        variants.append((entry, variant))
+
+    if simulate and variants:
+        jobs   = [(variant, max(1, niters // entry["factor"])) for entry, variant in variants]
+        cycles = simulate_variants(jobs, workers)
+        for (entry, _), cpi in zip(variants, cycles):
+            entry["simulated_cycles_per_iteration"] = cpi / entry["factor"]
+
+    key   = "simulated_cycles_per_iteration" if simulate else "cycles_per_iteration"
+    valid = [entry for entry, _ in variants]
+    bound = min(entry["throughput_bound"] for entry in valid)
+    best  = min(entry[key] for entry in valid)
+    base  = valid[0][key] if valid[0]["factor"] == 1 else None
+    for entry in valid:
+        if base:
+            entry["speedup"] = base / entry[key]
+    reached     = best <= bound * (1 + tolerance)
+    target      = bound if reached else best
+    recommended = next(entry for entry in valid if entry[key] <= target * (1 + tolerance))
+
+    unrolled = [variant for entry, variant in variants if entry is recommended][0]["instruction_list"]
+    out = {"name":                 name,
+           "throughput_bound":     bound,
+           "bound_reached":        reached,
+           "tolerance":            tolerance,
+           "simulated":            simulate,
+           "reductions":           sorted(get_reductions([instr for instr in instrs if not is_control(instr)])),
+           "recommended":          recommended["factor"],
+           "cycles_per_iteration": recommended[key],
+           "factors":              factors,
+           "instruction_list":     unrolled}   # unrolled body of the recommended factor
+    return out
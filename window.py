@@ -19,6 +19,8 @@ class InstrState(Enum):
     WAIT_DATA_READY = ":"
     WAIT_CACHE_2ND  = "2"
     MM_UPDATE       = "U"
+    WAIT_LOAD_QUEUE = "l"   # not dispatched: load queue is full
+    WAIT_STORE_QUEUE= "s"   # not dispatched: store queue is full
     UNKNOWN         = "?"
     NONE            = " "
 
@@ -35,6 +37,31 @@ class InstrInstance:
         self.memory   = mType   # 0 for non-memory instruction, 1 for load, 2 for store
         self.memAddr  = addr
         self.exec_lat = 0       # statistic of total execution latency, including waiting for resources
+        self.mem_dep  = -1      # load: dynamic index of youngest older store to the same address (-1: none)
+        self.forwarded= False   # load: data forwarded from the store, without cache access
+        self.queue_dep= -1      # load/store: dynamic index of the instruction that freed its queue entry
+        self.data_lat = 0       # store: execution latency until its data can be forwarded (without cache
+                                #   miss); forwarded load: the one of its store
+
+    # serialisable state, used for simulation checkpoints
+    STATE_FIELDS = ["d_idx", "s_idx", "port_used", "disp_cycle", "exec_cycle", "latency", "memory",
+                    "memAddr", "exec_lat", "mem_dep", "forwarded", "queue_dep", "data_lat"]
+
+    def get_state(self) -> dict:
+        state = {name: getattr(self, name) for name in InstrInstance.STATE_FIELDS}
+        for name in ("latency", "memAddr", "exec_lat", "data_lat"):   # may be NumPy integers
+            state[name] = int(state[name])
+        state["state"]    = self.state.name
+        state["substate"] = self.substate.name
+        return state
+
+    def from_state(state: dict):
+        instr = InstrInstance(state["disp_cycle"], state["d_idx"], state["s_idx"], state["memory"], state["memAddr"])
+        for name in InstrInstance.STATE_FIELDS:
+            setattr(instr, name, state[name])
+        instr.state    = InstrState[state["state"]]
+        instr.substate = InstrState[state["substate"]]
+        return instr
 
 def __repr__(self) -> str:
         return f"{self.d_idx}: <{self.s_idx}, {self.cycle}>"
@@ -79,6 +106,17 @@ class Window:
                 return False
         return True
 
+    def get_state(self) -> list:
+        return [self[i].get_state() for i in range(self.count)]
+
+    def set_state(self, state: list) -> None:
+        self.buffer = [None] * self.size
+        self.first  = 0
+        self.count  = len(state)
+        self.last   = self.count % self.size
+        for i, instr_state in enumerate(state):
+            self.buffer[i] = InstrInstance.from_state(instr_state)
+
     def __getitem__(self, i: int) -> InstrInstance:
         if i in range(self.count):
             return self.buffer[(i+self.first) % self.size]